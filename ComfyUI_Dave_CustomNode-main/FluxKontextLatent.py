@@ -0,0 +1,334 @@
+# Made by Davemane42#0042 for ComfyUI - Flux Kontext Latent Nodes 2025
+"""
+Flux Kontext 潜在空间节点
+
+Cached VAE Encode：参考/上下文图像的VAE编码结果按 (图像内容指纹, VAE标识) 缓存，
+更换种子或微调提示词重新排队时不再重复编码。缓存为内存LRU加可选的磁盘层
+（见 tensor_cache.TensorResultCache）。
+
+Latent Stitch：与 Image Stitch 相同的方向/对齐/间隙语义，但在潜在空间拼接各图像单独编码的
+潜在表示。配合 Cached VAE Encode，某一张源图像变化时只需重新编码这一张，而不是整张拼接画布。
+布局在潜在网格上计算（间隙必须是潜在缩放倍数的整数倍，居中对齐的偏移落在潜在网格上），
+再按缩放倍数换算为像素布局，解码后的图像可直接用 Image Unstitch 精确切分。
+
+Created: 2025-01-27
+Author: Davemane42
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import weakref
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+import torch
+
+from .FluxKontextNode import KontextStitchLayout, KontextStitchPlacement, plan_kontext_stitch
+from .tensor_cache import TensorResultCache, make_cache_key
+
+logger = logging.getLogger('DavemaneCustomNodes.FluxKontext')
+
+# Flux VAE 的空间下采样倍数（1个潜在像素 = 8x8 图像像素）
+KONTEXT_LATENT_SCALE = 8
+
+
+@lru_cache(maxsize=None)
+def get_vae_encode_cache() -> TensorResultCache:
+    """
+    获取共享的VAE编码缓存
+
+    @returns {TensorResultCache} 共享缓存
+    """
+    return TensorResultCache("vae_encode", memory_budget=1024 * 1024 * 1024)
+
+
+# id(VAE) -> (弱引用, 标识)
+_vae_identities: Dict[int, Tuple[weakref.ref, str]] = {}
+_vae_identities_lock = threading.Lock()
+
+
+def vae_identity(vae: Any) -> str:
+    """
+    计算VAE标识（按VAE对象记忆）
+
+    依次使用：VAE的 cache_identity 属性；first_stage_model 权重（名称、形状、dtype与内容）的哈希；
+    最后回退为类名 + 对象id（仅在当前进程内有效）。
+
+    @param {Any} vae - VAE对象
+    @returns {str} VAE标识
+    """
+    identity = getattr(vae, "cache_identity", None)
+    if identity:
+        return str(identity)
+
+    key = id(vae)
+    with _vae_identities_lock:
+        entry = _vae_identities.get(key)
+    if entry is not None and entry[0]() is vae:
+        return entry[1]
+
+    model = getattr(vae, "first_stage_model", None)
+    if isinstance(model, torch.nn.Module):
+        digest = hashlib.blake2b(digest_size=16)
+        for name, tensor in model.state_dict().items():
+            data = tensor.detach()
+            if data.device.type != "cpu":
+                data = data.cpu()
+            data = data.contiguous()
+            digest.update(f"{name}|{tuple(data.shape)}|{data.dtype}".encode())
+            digest.update(memoryview(data.view(-1).view(torch.uint8).numpy()))
+        identity = f"weights:{digest.hexdigest()}"
+    else:
+        identity = f"object:{type(vae).__module__}.{type(vae).__qualname__}:{key}"
+
+    try:
+        ref = weakref.ref(vae, lambda _, key=key: _vae_identities.pop(key, None))
+    except TypeError:
+        return identity
+    with _vae_identities_lock:
+        _vae_identities[key] = (ref, identity)
+    return identity
+
+
+class FluxKontextCachedVAEEncode:
+    """
+    带缓存的VAE编码节点
+
+    编码结果按图像内容指纹与VAE标识缓存，相同的参考图像在后续排队中直接复用潜在表示
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        """定义缓存VAE编码节点输入类型"""
+        return {
+            "required": {
+                "pixels": ("IMAGE", {
+                    "tooltip": "要编码的参考/上下文图像"
+                }),
+                "vae": ("VAE", {
+                    "tooltip": "VAE模型"
+                }),
+                "cache_mode": (["memory", "memory+disk", "off"], {
+                    "default": "memory",
+                    "tooltip": "缓存模式 - memory为内存LRU，memory+disk同时写入可内存映射的磁盘层，off不缓存"
+                }),
+            }
+        }
+
+    RETURN_TYPES = ("LATENT", "STRING")
+    RETURN_NAMES = ("latent", "cache_info")
+    FUNCTION = "encode"
+    CATEGORY = "Davemane42/FluxKontext"
+
+    DESCRIPTION = """
+    <strong>Cached VAE Encode</strong> - 带缓存的VAE编码
+
+    特性:
+    • 按图像内容指纹 + VAE标识缓存编码结果
+    • 内存LRU，可选磁盘层（跨重启复用）
+    • 输出命中状态与缓存统计
+    """
+
+    def encode(self, pixels, vae, cache_mode="memory"):
+        """
+        VAE编码（带缓存）
+
+        @param {torch.Tensor} pixels - [B, H, W, C] 图像
+        @param {VAE} vae - VAE模型
+        @param {str} cache_mode - 缓存模式（memory / memory+disk / off）
+        @returns {Tuple} (潜在表示, 缓存信息JSON)
+        """
+        cache = get_vae_encode_cache()
+        use_disk = cache_mode == "memory+disk"
+        status = "off"
+        cache_key = None
+        samples = None
+
+        if cache_mode != "off":
+            try:
+                cache_key = make_cache_key(
+                    "CachedVAEEncode/1",
+                    {"pixels": pixels},
+                    {"vae": vae_identity(vae), "channels": 3},
+                )
+                cached, status = cache.get(cache_key, use_disk)
+                if cached is not None:
+                    samples = cached["samples"]
+            except Exception as e:
+                logger.error(f"❌ VAE编码缓存查询失败: {e}")
+                cache_key = None
+                status = "error"
+
+        if samples is None:
+            samples = vae.encode(pixels[:, :, :, :3])
+            if cache_key is not None:
+                cache.put(cache_key, {"samples": samples}, use_disk)
+
+        info = {"status": status, **cache.stats()}
+        logger.info(f"VAE编码 - 缓存: {status}, 潜在形状: {tuple(samples.shape)}")
+        return ({"samples": samples}, json.dumps(info, ensure_ascii=False))
+
+
+def plan_kontext_latent_stitch(
+    sizes: List[Tuple[int, int]],
+    direction: str,
+    alignment: str,
+    gap: int,
+    columns: int = 0,
+    scale: int = KONTEXT_LATENT_SCALE,
+) -> KontextStitchLayout:
+    """
+    在潜在网格上计算拼接布局
+
+    @param {List[Tuple[int, int]]} sizes - 每个潜在表示的 (高, 宽)（潜在像素）
+    @param {str} direction - horizontal / vertical / grid
+    @param {str} alignment - top / center / bottom
+    @param {int} gap - 间隙（图像像素），必须是 scale 的整数倍
+    @param {int} columns - 网格列数，0表示自动
+    @param {int} scale - 潜在缩放倍数
+    @returns {KontextStitchLayout} 潜在空间布局（乘以 scale 即为像素布局）
+    """
+    if gap % scale:
+        raise ValueError(f"间隙 {gap} 不是潜在缩放倍数 {scale} 的整数倍")
+    return plan_kontext_stitch(sizes, direction, alignment, gap // scale, columns)
+
+
+def stitch_kontext_latents(latents: List[torch.Tensor], layout: KontextStitchLayout) -> torch.Tensor:
+    """
+    按潜在空间布局拼接潜在表示：一次性分配画布，每个潜在表示直接复制到对应切片
+
+    间隙与填充区域为0。批次大小为1的潜在表示通过广播复制到每个批次项。
+
+    @param {List[torch.Tensor]} latents - [B, C, h, w] 潜在表示列表，批次大小为1或相同的B
+    @param {KontextStitchLayout} layout - 潜在空间布局
+    @returns {torch.Tensor} [B, C, H, W] 拼接后的潜在表示
+    """
+    batch_size = max(latent.shape[0] for latent in latents)
+    channels = latents[0].shape[1]
+    for latent in latents:
+        if latent.dim() != 4:
+            raise ValueError(f"仅支持4维潜在表示 [B, C, H, W]，收到 {tuple(latent.shape)}")
+        if latent.shape[0] not in (1, batch_size):
+            raise ValueError(f"潜在表示批次大小 {latent.shape[0]} 无法广播到 {batch_size}")
+        if latent.shape[1] != channels:
+            raise ValueError(f"潜在表示通道数不一致: {latent.shape[1]} != {channels}")
+
+    canvas = torch.zeros(
+        (batch_size, channels, layout.height, layout.width),
+        dtype=latents[0].dtype, device=latents[0].device
+    )
+    for latent, placement in zip(latents, layout.placements):
+        canvas[
+            :,
+            :,
+            placement.y:placement.y + placement.height,
+            placement.x:placement.x + placement.width,
+        ].copy_(latent)
+    return canvas
+
+
+class FluxKontextLatentStitch:
+    """
+    潜在空间拼接节点
+
+    与 Image Stitch 语义相同，但拼接的是每张图像单独编码的潜在表示，
+    源图像变化时只需重新编码变化的那一张
+    """
+
+    MAX_LATENTS = 8
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        """定义潜在空间拼接节点输入类型"""
+        optional = {
+            f"latent{index}": ("LATENT", {
+                "tooltip": f"可选第{index}个潜在表示"
+            })
+            for index in range(3, cls.MAX_LATENTS + 1)
+        }
+        optional["grid_columns"] = ("INT", {
+            "default": 0,
+            "min": 0,
+            "max": cls.MAX_LATENTS,
+            "step": 1,
+            "tooltip": "网格列数 - 仅grid方向使用，0表示自动"
+        })
+        return {
+            "required": {
+                "latent1": ("LATENT", {
+                    "tooltip": "第一个潜在表示"
+                }),
+                "latent2": ("LATENT", {
+                    "tooltip": "第二个潜在表示"
+                }),
+                "stitch_direction": (["horizontal", "vertical", "grid"], {
+                    "default": "horizontal",
+                    "tooltip": "拼接方向 - 水平、垂直或网格（行×列）"
+                }),
+                "alignment": (["top", "center", "bottom"], {
+                    "default": "center",
+                    "tooltip": "对齐方式 - 垂直拼接时top/bottom表示左/右对齐；居中偏移落在潜在网格上"
+                }),
+                "gap": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 96,
+                    "step": KONTEXT_LATENT_SCALE,
+                    "tooltip": f"间隙像素数 - 必须是{KONTEXT_LATENT_SCALE}的整数倍"
+                }),
+            },
+            "optional": optional
+        }
+
+    RETURN_TYPES = ("LATENT", "STITCH_LAYOUT")
+    RETURN_NAMES = ("latent", "stitch_layout")
+    FUNCTION = "stitch_latents"
+    CATEGORY = "Davemane42/FluxKontext"
+
+    DESCRIPTION = """
+    <strong>Latent Stitch</strong> - 在潜在空间拼接多张图像
+
+    特性:
+    • 与 Image Stitch 相同的方向/对齐/间隙语义，支持2-8个潜在表示
+    • 每张图像单独编码，配合 Cached VAE Encode 只重新编码变化的图像
+    • 布局精确落在潜在网格上
+    • 输出像素单位的布局记录，解码后可用 Image Unstitch 切分
+    """
+
+    def stitch_latents(self, latent1, latent2, stitch_direction, alignment, gap, grid_columns=0, **optional_latents):
+        """
+        拼接多个潜在表示
+
+        @param {Dict} latent1 - 第一个潜在表示
+        @param {Dict} latent2 - 第二个潜在表示
+        @param {str} stitch_direction - 拼接方向（horizontal / vertical / grid）
+        @param {str} alignment - 对齐方式
+        @param {int} gap - 间隙像素数（KONTEXT_LATENT_SCALE 的整数倍）
+        @param {int} grid_columns - 网格列数，0表示自动
+        @param {Dict} optional_latents - 可选的 latent3 ... latentN
+        @returns {Tuple} (拼接后的潜在表示, 像素单位的布局记录)
+        """
+        try:
+            latents = [latent1["samples"], latent2["samples"]] + [
+                optional_latents[f"latent{index}"]["samples"]
+                for index in range(3, self.MAX_LATENTS + 1)
+                if optional_latents.get(f"latent{index}") is not None
+            ]
+
+            layout = plan_kontext_latent_stitch(
+                [(latent.shape[-2], latent.shape[-1]) for latent in latents],
+                stitch_direction, alignment, gap, grid_columns
+            )
+            stitched = stitch_kontext_latents(latents, layout)
+
+            logger.info(f"潜在空间拼接完成 - {len(latents)} 个潜在表示, 最终尺寸: {tuple(stitched.shape)}")
+            return ({"samples": stitched}, layout.scaled(KONTEXT_LATENT_SCALE).to_record())
+
+        except Exception as e:
+            logger.error(f"潜在空间拼接失败: {str(e)}")
+            # 返回第一个潜在表示作为回退，布局为覆盖整张图像的单个源
+            height, width = latent1["samples"].shape[-2], latent1["samples"].shape[-1]
+            fallback_layout = KontextStitchLayout(height, width, (KontextStitchPlacement(0, 0, height, width),))
+            return (latent1, fallback_layout.scaled(KONTEXT_LATENT_SCALE).to_record())
@@ -2,10 +2,28 @@
 import torch
 import logging
 import numpy as np
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Dict, List, Tuple, Optional, Any, Mapping, Iterable, NamedTuple, FrozenSet
+import bisect
 import json
+import math
 import os
+import re
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
+
+from .kontext_backends import (
+    DEFAULT_KONTEXT_BACKEND,
+    KONTEXT_MAX_SEED,
+    KontextRequest,
+    KontextResult,
+    get_kontext_batcher,
+    list_kontext_backends,
+    resolve_kontext_seed,
+)
+from .mask_resampling import resample_mask
+from .stage_timing import StageTimer
+from .tensor_cache import TensorResultCache, make_cache_key
 
 # 导入ComfyUI核心模块
 try:
@@ -21,83 +39,404 @@ except ImportError as e:
 logger = logging.getLogger('DavemaneCustomNodes.FluxKontext')
 logger.setLevel(logging.INFO)
 
+def _freeze(value: Any) -> Any:
+    """递归冻结配置数据：dict -> 只读映射，list -> tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+@lru_cache(maxsize=None)
+def get_kontext_model_config() -> Mapping[str, Any]:
+    """
+    获取Flux Kontext模型配置（模块级只读数据，首次使用时构建一次）
+    
+    @returns {Mapping} 只读模型配置
+    """
+    # Flux Kontext标准配置
+    config = {
+        "architecture": "flow_matching",
+        "text_encoders": ["clip_l", "t5xxl"],
+        "unet_config": {
+            "in_channels": 16,  # Flux典型配置
+            "out_channels": 16,
+            "model_channels": 3072,
+            "attention_resolutions": [2, 4, 8],
+            "channel_mult": [1, 2, 4],
+            "transformer_depth": [1, 2, 10],
+            "context_dim": 4096,  # T5编码器维度
+            "use_linear_in_transformer": True,
+            "adm_in_channels": 256,  # 额外条件通道
+        },
+        "vae_config": {
+            "scaling_factor": 0.3611,
+            "shift_factor": 0.1159,
+        },
+        "scheduler_config": {
+            "num_train_timesteps": 1000,
+            "beta_schedule": "scaled_linear",
+            "prediction_type": "flow_matching",
+        }
+    }
+    
+    logger.info(f"Flux Kontext配置加载完成: {config['architecture']}")
+    return _freeze(config)
+
+@lru_cache(maxsize=None)
+def get_kontext_aspect_ratios() -> Tuple[Tuple[str, float], ...]:
+    """
+    获取Flux Kontext支持的宽高比（按比例升序，模块级只读数据）
+    
+    @returns {Tuple} (名称, 宽/高) 元组
+    """
+    return (
+        ("1:4", 0.25),
+        ("2:7", 2/7),
+        ("3:8", 3/8),
+        ("9:21", 9/21),
+        ("9:16", 9/16),
+        ("2:3", 2/3),
+        ("3:4", 3/4),
+        ("1:1", 1.0),
+        ("4:3", 4/3),
+        ("3:2", 3/2),
+        ("16:9", 16/9),
+        ("21:9", 21/9),
+        ("8:3", 8/3),
+        ("7:2", 7/2),
+        ("4:1", 4.0),
+    )
+
+@lru_cache(maxsize=None)
+def get_kontext_aspect_ratio_map() -> Mapping[str, float]:
+    """
+    获取宽高比名称到数值的只读映射
+    
+    @returns {Mapping} {名称: 宽/高}
+    """
+    return MappingProxyType(dict(get_kontext_aspect_ratios()))
+
+class KontextBucket(NamedTuple):
+    """分辨率桶：宽高比名称、名义宽高比与对齐后的像素尺寸"""
+    name: str
+    ratio: float
+    width: int
+    height: int
+
+class KontextResolutionBuckets:
+    """
+    Kontext分辨率分桶
+    
+    为每个支持的宽高比预先计算目标像素数下的尺寸（宽高均为 multiple 的整数倍，
+    对齐模型的patch大小）；按输入宽高比查找最近的桶时在对数宽高比上二分查找。
+    """
+    
+    def __init__(self, target_pixels: int, multiple: int = 16):
+        """
+        @param {int} target_pixels - 目标像素数
+        @param {int} multiple - 宽高对齐的倍数
+        """
+        self.target_pixels = target_pixels
+        self.multiple = multiple
+        self.buckets = tuple(
+            self._make_bucket(name, ratio) for name, ratio in get_kontext_aspect_ratios()
+        )
+        self._log_ratios = [math.log(bucket.ratio) for bucket in self.buckets]
+        if self._log_ratios != sorted(self._log_ratios):
+            raise ValueError("宽高比表必须按比例升序排列")
+        self._by_name = {bucket.name: bucket for bucket in self.buckets}
+    
+    def _make_bucket(self, name: str, ratio: float) -> KontextBucket:
+        """按目标像素数计算对齐后的桶尺寸"""
+        m = self.multiple
+        width = max(m, round(math.sqrt(self.target_pixels * ratio) / m) * m)
+        height = max(m, round(math.sqrt(self.target_pixels / ratio) / m) * m)
+        return KontextBucket(name, ratio, width, height)
+    
+    def get(self, name: str) -> KontextBucket:
+        """
+        按宽高比名称获取桶
+        
+        @param {str} name - 宽高比名称（如 "16:9"）
+        @returns {KontextBucket} 分辨率桶
+        """
+        return self._by_name[name]
+    
+    def nearest(self, width: int, height: int) -> KontextBucket:
+        """
+        获取与给定尺寸宽高比最接近的桶（对数空间距离）
+        
+        @param {int} width - 宽度
+        @param {int} height - 高度
+        @returns {KontextBucket} 分辨率桶
+        """
+        log_ratio = math.log(width / height)
+        index = bisect.bisect_left(self._log_ratios, log_ratio)
+        if index == 0:
+            return self.buckets[0]
+        if index == len(self.buckets):
+            return self.buckets[-1]
+        if self._log_ratios[index] - log_ratio < log_ratio - self._log_ratios[index - 1]:
+            return self.buckets[index]
+        return self.buckets[index - 1]
+
+@lru_cache(maxsize=32)
+def get_kontext_buckets(target_pixels: int, multiple: int = 16) -> KontextResolutionBuckets:
+    """
+    获取指定目标像素数的分辨率桶（按参数缓存）
+    
+    @param {int} target_pixels - 目标像素数
+    @param {int} multiple - 宽高对齐的倍数
+    @returns {KontextResolutionBuckets} 分辨率桶
+    """
+    return KontextResolutionBuckets(target_pixels, multiple)
+
+def plan_kontext_crop(
+    width: int,
+    height: int,
+    aspect_ratio: str,
+    target_megapixels: float = 1.0,
+) -> Tuple[KontextBucket, Tuple[int, int, int, int]]:
+    """
+    计算预处理使用的分辨率桶与居中裁剪区域（只处理尺寸，不涉及张量）
+    
+    target_megapixels 为0时保持输入尺度，桶尺寸为该比例下可容纳的最大16倍数尺寸。
+    
+    @param {int} width - 输入宽度
+    @param {int} height - 输入高度
+    @param {str} aspect_ratio - 目标宽高比，auto表示与输入最接近的比例
+    @param {float} target_megapixels - 目标像素数(百万)，0表示保持输入像素数
+    @returns {Tuple} (分辨率桶, 裁剪区域 (上, 左, 高, 宽))
+    """
+    resample = target_megapixels > 0
+    buckets = get_kontext_buckets(int(target_megapixels * 1_000_000) if resample else 1_000_000)
+    bucket = buckets.nearest(width, height) if aspect_ratio == "auto" else buckets.get(aspect_ratio)
+    
+    if resample:
+        # 裁剪到桶的精确宽高比
+        if width * bucket.height > height * bucket.width:
+            # 图像太宽，裁剪宽度
+            crop_width, crop_height = max(1, round(height * bucket.width / bucket.height)), height
+        else:
+            # 图像太高，裁剪高度
+            crop_width, crop_height = width, max(1, round(width * bucket.height / bucket.width))
+    else:
+        # 保持输入尺度：该比例下可容纳的最大尺寸，向下对齐到16的倍数
+        m = buckets.multiple
+        fit_width = min(width, height * bucket.ratio)
+        fit_height = min(height, width / bucket.ratio)
+        bucket = bucket._replace(
+            width=max(m, int(fit_width) // m * m), height=max(m, int(fit_height) // m * m)
+        )
+        crop_width, crop_height = min(bucket.width, width), min(bucket.height, height)
+    
+    return bucket, ((height - crop_height) // 2, (width - crop_width) // 2, crop_height, crop_width)
+
+class PromptFeatures(NamedTuple):
+    """提示词分析结果（只读，可安全缓存共享）"""
+    edit_type: str
+    features: FrozenSet[str]
+    keywords: Tuple[str, ...]
+
+class KontextPromptMatcher:
+    """
+    Kontext提示词关键词匹配器
+    
+    所有特征的中英文关键词编译为一个正则（长词优先），对小写化的提示词一次扫描
+    同时完成编辑类型分类和特征提取；结果按提示词文本缓存在有界LRU中。
+    英文关键词沿用子串匹配语义。
+    """
+    
+    # 特征 -> 关键词（英文 + 中文）
+    KEYWORDS: Mapping[str, Tuple[str, ...]] = MappingProxyType({
+        # 风格转换
+        "style": (
+            "style", "painting", "sketch", "cartoon", "realistic", "artistic",
+            "风格", "画风", "油画", "水彩", "素描", "卡通", "动漫", "写实", "艺术",
+        ),
+        # 背景替换
+        "background": (
+            "background", "scene", "setting", "environment",
+            "背景", "场景", "环境",
+        ),
+        # 对象修改
+        "object": (
+            "change", "replace", "modify", "alter", "transform",
+            "修改", "替换", "更改", "改变", "变换", "换成",
+        ),
+        # 文本编辑
+        "text": (
+            "text", "sign", "writing", "letter", "word",
+            "文字", "文本", "标志", "字体", "标语",
+        ),
+        # 保持/保留条款
+        "preservation": (
+            "keep", "maintain", "preserve", "preserving",
+            "保持", "保留", "不变",
+        ),
+        # 质量术语（分析报告使用）
+        "quality": (
+            "high quality", "detailed", "professional",
+            "高质量", "细节", "专业",
+        ),
+        # 质量增强词（最佳实践判断使用，包含上面的质量术语）
+        "quality_enhancer": (
+            "high quality", "detailed", "professional", "realistic",
+            "seamless", "natural", "well-integrated",
+            "高质量", "细节", "专业", "写实", "无缝", "自然", "融合",
+        ),
+    })
+    
+    # 编辑类型判定优先级
+    EDIT_TYPE_PRIORITY: Tuple[Tuple[str, str], ...] = (
+        ("style", "style_transfer"),
+        ("background", "background_replacement"),
+        ("text", "text_editing"),
+        ("object", "object_modification"),
+    )
+    
+    def __init__(self, keywords: Optional[Mapping[str, Iterable[str]]] = None, cache_size: int = 4096):
+        """
+        @param {Mapping} keywords - 特征 -> 关键词，默认 KEYWORDS
+        @param {int} cache_size - LRU缓存的提示词数量上限
+        """
+        keywords = keywords if keywords is not None else self.KEYWORDS
+        features_by_keyword: Dict[str, set] = {}
+        for feature, words in keywords.items():
+            for word in words:
+                features_by_keyword.setdefault(word.lower(), set()).add(feature)
+        self._features_by_keyword = {word: frozenset(f) for word, f in features_by_keyword.items()}
+        # 长词优先，避免短关键词抢先匹配；不使用 re.IGNORECASE，
+        # 以保留正则引擎按首字符集合跳过无关位置的优化（先小写化文本）
+        alternatives = sorted(self._features_by_keyword, key=len, reverse=True)
+        self._pattern = re.compile("|".join(map(re.escape, alternatives)))
+        self._cached_analyze = lru_cache(maxsize=cache_size)(self._scan)
+        # 不同提示词命中的关键词组合很少，按组合缓存特征归并结果
+        self._resolve = lru_cache(maxsize=cache_size)(self._resolve_keywords)
+    
+    def _scan(self, prompt: str) -> PromptFeatures:
+        """单次扫描提示词，提取全部特征"""
+        return self._resolve(tuple(dict.fromkeys(self._pattern.findall(prompt.lower()))))
+    
+    def _resolve_keywords(self, keywords: Tuple[str, ...]) -> PromptFeatures:
+        """由命中的关键词得到特征集合与编辑类型"""
+        features = set()
+        for word in keywords:
+            features |= self._features_by_keyword[word]
+        
+        edit_type = "general_editing"
+        for feature, candidate in self.EDIT_TYPE_PRIORITY:
+            if feature in features:
+                edit_type = candidate
+                break
+        return PromptFeatures(edit_type, frozenset(features), keywords)
+    
+    def analyze(self, prompt: str) -> PromptFeatures:
+        """
+        分析单个提示词（结果缓存）
+        
+        @param {str} prompt - 提示词
+        @returns {PromptFeatures} 编辑类型、特征集合、命中的关键词
+        """
+        return self._cached_analyze(prompt)
+    
+    def classify(self, prompt: str) -> str:
+        """
+        获取提示词的编辑类型
+        
+        @param {str} prompt - 提示词
+        @returns {str} 编辑类型
+        """
+        return self._cached_analyze(prompt).edit_type
+    
+    def extend(self, result: PromptFeatures, suffix: str) -> PromptFeatures:
+        """
+        获取 原提示词 + suffix 的分析结果，无需重新扫描原提示词
+        
+        suffix 须以逗号开头：关键词都不含逗号，不会跨越拼接处，因此拼接后的
+        命中关键词即两部分命中关键词的并集。
+        
+        @param {PromptFeatures} result - 原提示词的分析结果
+        @param {str} suffix - 以逗号开头的追加文本
+        @returns {PromptFeatures} 拼接后提示词的分析结果
+        """
+        if not suffix:
+            return result
+        suffix_keywords = self._cached_analyze(suffix).keywords
+        return self._resolve(tuple(dict.fromkeys(result.keywords + suffix_keywords)))
+    
+    def analyze_batch(self, prompts: Iterable[str]) -> List[PromptFeatures]:
+        """
+        批量分析提示词，用于离线处理大量提示词
+        
+        重复的提示词只扫描一次；批量结果不写入LRU，避免冲掉交互执行的缓存。
+        
+        @param {Iterable} prompts - 提示词序列
+        @returns {List} 与输入顺序一致的分析结果
+        """
+        prompts = list(prompts)
+        scan = self._scan
+        results = {prompt: scan(prompt) for prompt in dict.fromkeys(prompts)}
+        return [results[prompt] for prompt in prompts]
+    
+    def cache_info(self):
+        """获取LRU缓存统计（hits / misses / maxsize / currsize）"""
+        return self._cached_analyze.cache_info()
+
+@lru_cache(maxsize=None)
+def get_kontext_prompt_matcher() -> KontextPromptMatcher:
+    """
+    获取共享的Kontext提示词匹配器（首次使用时编译一次）
+    
+    @returns {KontextPromptMatcher} 共享匹配器
+    """
+    return KontextPromptMatcher()
+
+@lru_cache(maxsize=None)
+def get_kontext_processor() -> "FluxKontextProcessor":
+    """
+    获取共享的Flux Kontext处理器
+    
+    处理器不持有可变状态，所有节点与调用共享同一实例。
+    
+    @returns {FluxKontextProcessor} 共享处理器
+    """
+    processor = FluxKontextProcessor()
+    logger.info("Flux Kontext处理器初始化完成")
+    return processor
+
 class FluxKontextProcessor:
     """
     Flux Kontext模型处理核心类
     
     专门用于处理Flux Kontext模型的Flow-Matching架构
     和双文本编码器系统的集成
+    
+    处理器是无状态的：模型配置与宽高比表为模块级只读数据，
+    请通过 get_kontext_processor() 获取共享实例。
     """
     
     def __init__(self):
-        """初始化Flux Kontext处理器"""
+        """初始化Flux Kontext处理器（引用共享的只读配置）"""
         self.model_config = self._load_model_config()
         self.aspect_ratios = self._get_supported_aspect_ratios()
-        logger.info("Flux Kontext处理器初始化完成")
     
-    def _load_model_config(self) -> Dict[str, Any]:
+    def _load_model_config(self) -> Mapping[str, Any]:
         """
         加载Flux Kontext模型配置
         
-        @returns {Dict} 模型配置字典
+        @returns {Mapping} 只读模型配置
         """
-        try:
-            # Flux Kontext标准配置
-            config = {
-                "architecture": "flow_matching",
-                "text_encoders": ["clip_l", "t5xxl"],
-                "unet_config": {
-                    "in_channels": 16,  # Flux典型配置
-                    "out_channels": 16,
-                    "model_channels": 3072,
-                    "attention_resolutions": [2, 4, 8],
-                    "channel_mult": [1, 2, 4],
-                    "transformer_depth": [1, 2, 10],
-                    "context_dim": 4096,  # T5编码器维度
-                    "use_linear_in_transformer": True,
-                    "adm_in_channels": 256,  # 额外条件通道
-                },
-                "vae_config": {
-                    "scaling_factor": 0.3611,
-                    "shift_factor": 0.1159,
-                },
-                "scheduler_config": {
-                    "num_train_timesteps": 1000,
-                    "beta_schedule": "scaled_linear",
-                    "prediction_type": "flow_matching",
-                }
-            }
-            
-            logger.info(f"Flux Kontext配置加载完成: {config['architecture']}")
-            return config
-            
-        except Exception as e:
-            logger.error(f"加载模型配置失败: {str(e)}")
-            return {}
+        return get_kontext_model_config()
     
-    def _get_supported_aspect_ratios(self) -> List[Tuple[str, float]]:
+    def _get_supported_aspect_ratios(self) -> Tuple[Tuple[str, float], ...]:
         """
         获取Flux Kontext支持的宽高比
         
-        @returns {List} 宽高比列表
-        """
-        return [
-            ("1:4", 0.25),
-            ("2:7", 2/7),
-            ("3:8", 3/8),
-            ("9:21", 9/21),
-            ("9:16", 9/16),
-            ("2:3", 2/3),
-            ("3:4", 3/4),
-            ("1:1", 1.0),
-            ("4:3", 4/3),
-            ("3:2", 3/2),
-            ("16:9", 16/9),
-            ("21:9", 21/9),
-            ("8:3", 8/3),
-            ("7:2", 7/2),
-            ("4:1", 4.0),
-        ]
+        @returns {Tuple} 宽高比元组
+        """
+        return get_kontext_aspect_ratios()
     
     def validate_aspect_ratio(self, ratio_str: str) -> bool:
         """
@@ -106,8 +445,7 @@ class FluxKontextProcessor:
         @param {str} ratio_str - 宽高比字符串
         @returns {bool} 是否有效
         """
-        valid_ratios = [ratio[0] for ratio in self.aspect_ratios]
-        is_valid = ratio_str in valid_ratios
+        is_valid = ratio_str in get_kontext_aspect_ratio_map()
         
         if not is_valid:
             logger.warning(f"不支持的宽高比: {ratio_str}")
@@ -150,32 +488,12 @@ class FluxKontextProcessor:
     
     def _detect_edit_type(self, prompt: str) -> str:
         """
-        检测编辑类型以应用相应优化
+        检测编辑类型以应用相应优化（中英文关键词，结果缓存）
         
         @param {str} prompt - 提示词
         @returns {str} 编辑类型
         """
-        prompt_lower = prompt.lower()
-        
-        # 风格转换关键词
-        style_keywords = ["style", "painting", "sketch", "cartoon", "realistic", "artistic"]
-        # 背景替换关键词  
-        background_keywords = ["background", "scene", "setting", "environment"]
-        # 对象修改关键词
-        object_keywords = ["change", "replace", "modify", "alter", "transform"]
-        # 文本编辑关键词
-        text_keywords = ["text", "sign", "writing", "letter", "word"]
-        
-        if any(keyword in prompt_lower for keyword in style_keywords):
-            return "style_transfer"
-        elif any(keyword in prompt_lower for keyword in background_keywords):
-            return "background_replacement"
-        elif any(keyword in prompt_lower for keyword in text_keywords):
-            return "text_editing"
-        elif any(keyword in prompt_lower for keyword in object_keywords):
-            return "object_modification"
-        else:
-            return "general_editing"
+        return get_kontext_prompt_matcher().classify(prompt)
     
     def _enhance_prompt(self, prompt: str, edit_type: str) -> str:
         """
@@ -217,6 +535,65 @@ class FluxKontextProcessor:
         
         return guidance_map.get(edit_type, 7.0)
 
+class KontextEditItem(NamedTuple):
+    """批量编辑中的单项：源图像索引、提示词与种子"""
+    source_index: int
+    prompt: str
+    seed: int
+
+def expand_kontext_edit_items(
+    batch_size: int,
+    prompt: str,
+    base_seed: int,
+    variants: int = 1,
+    prompt_list: str = "",
+    seed_list: str = "",
+) -> List[KontextEditItem]:
+    """
+    展开批量编辑项：每张输入图像扇出为 variants 个变体，第 i 项为源图像 i // variants
+    
+    prompt_list 每行一个提示词，seed_list 以逗号或空白分隔；列表长度可以是1、总项数N或
+    输入批次大小B（每张源图像的所有变体共用）。单张图像且 variants 为1时按列表长度扇出。
+    未提供种子列表时第 i 项使用 base_seed + i。
+    
+    @param {int} batch_size - 输入图像批次大小
+    @param {str} prompt - 默认提示词
+    @param {int} base_seed - 基础种子
+    @param {int} variants - 每张图像的变体数
+    @param {str} prompt_list - 逐项提示词（多行）
+    @param {str} seed_list - 逐项种子
+    @returns {List[KontextEditItem]} 编辑项
+    """
+    prompts = [line.strip() for line in (prompt_list or "").splitlines() if line.strip()] or [prompt]
+    seeds = [int(token) for token in re.split(r"[\s,]+", (seed_list or "").strip()) if token]
+    
+    variants = max(1, int(variants))
+    if batch_size == 1 and variants == 1:
+        variants = max(len(prompts), len(seeds), 1)
+    count = batch_size * variants
+    
+    def pick(values: List[Any], index: int, name: str) -> Any:
+        if len(values) == 1:
+            return values[0]
+        if len(values) == count:
+            return values[index]
+        if len(values) == batch_size:
+            return values[index // variants]
+        raise ValueError(f"{name}数量 {len(values)} 与编辑项数 {count} 或图像数 {batch_size} 不匹配")
+    
+    items = []
+    for index in range(count):
+        if not seeds:
+            item_seed = (base_seed + index) % (KONTEXT_MAX_SEED + 1)
+        elif len(seeds) == 1:
+            item_seed = (seeds[0] + index) % (KONTEXT_MAX_SEED + 1)
+        elif len(seeds) == count:
+            item_seed = seeds[index] % (KONTEXT_MAX_SEED + 1)
+        else:
+            item_seed = (pick(seeds, index, "种子") + index % variants) % (KONTEXT_MAX_SEED + 1)
+        items.append(KontextEditItem(index // variants, pick(prompts, index, "提示词"), item_seed))
+    return items
+
 class FluxKontextNode:
     """
     Flux Kontext主节点类
@@ -227,8 +604,8 @@ class FluxKontextNode:
     
     def __init__(self):
         """初始化Flux Kontext节点"""
-        self.processor = FluxKontextProcessor()
-        logger.info("Flux Kontext节点初始化完成")
+        self.processor = get_kontext_processor()
+        logger.debug("Flux Kontext节点初始化完成")
     
     @classmethod
     def INPUT_TYPES(cls):
@@ -237,8 +614,7 @@ class FluxKontextNode:
         
         @returns {Dict} 输入类型定义
         """
-        processor = FluxKontextProcessor()
-        aspect_ratio_options = [ratio[0] for ratio in processor.aspect_ratios]
+        aspect_ratio_options = ["auto"] + list(get_kontext_aspect_ratio_map())
         
         return {
             "required": {
@@ -252,7 +628,7 @@ class FluxKontextNode:
                 }),
                 "aspect_ratio": (aspect_ratio_options, {
                     "default": "1:1",
-                    "tooltip": "宽高比 - 必须在1:4到4:1之间"
+                    "tooltip": "宽高比 - 必须在1:4到4:1之间，auto选择与输入最接近的比例"
                 }),
                 "prompt_upsampling": ("BOOLEAN", {
                     "default": False,
@@ -286,6 +662,48 @@ class FluxKontextNode:
                 "controlnet_image": ("IMAGE", {
                     "tooltip": "可选控制图像 - 额外的结构引导"
                 }),
+                "target_megapixels": ("FLOAT", {
+                    "default": 1.0,
+                    "min": 0.0,
+                    "max": 4.0,
+                    "step": 0.05,
+                    "tooltip": "目标像素数(百万) - 输出尺寸按宽高比分桶，宽高均为16的倍数；0表示保持输入像素数"
+                }),
+                "input_range": (["auto", "0-1", "0-255"], {
+                    "default": "auto",
+                    "tooltip": "输入数值范围 - auto按数据类型判断（整数类型为0-255，浮点为0-1），不扫描像素"
+                }),
+                "backend": (list_kontext_backends(), {
+                    "default": DEFAULT_KONTEXT_BACKEND,
+                    "tooltip": "推理后端 - reference_cpu为确定性CPU参考实现，其他后端通过register_kontext_backend注册"
+                }),
+                "batch_window_ms": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 1000,
+                    "step": 1,
+                    "tooltip": "合并窗口(毫秒) - 0(默认)直接推理；大于0时窗口内到达的同尺寸编辑合并为一次批量推理，单次执行最多额外等待该时长"
+                }),
+                "result_cache": (["off", "memory", "memory+disk"], {
+                    "default": "off",
+                    "tooltip": "结果缓存 - 图像、遮罩、提示词、种子等完全相同的编辑直接返回缓存结果；随机种子(-1)不缓存"
+                }),
+                "variants": ("INT", {
+                    "default": 1,
+                    "min": 1,
+                    "max": 64,
+                    "step": 1,
+                    "tooltip": "变体数 - 每张图像扇出为K个种子（seed + i），只预处理一次并批量推理"
+                }),
+                "prompt_list": ("STRING", {
+                    "multiline": True,
+                    "default": "",
+                    "tooltip": "逐项提示词 - 每行一个，数量为1、编辑项数或图像数；单张图像时按行数扇出"
+                }),
+                "seed_list": ("STRING", {
+                    "default": "",
+                    "tooltip": "逐项种子 - 逗号分隔，数量为1、编辑项数或图像数；留空使用 seed + 索引"
+                }),
             },
             "hidden": {
                 "unique_id": "UNIQUE_ID",
@@ -327,6 +745,14 @@ class FluxKontextNode:
         seed,
         mask=None,
         controlnet_image=None,
+        target_megapixels=1.0,
+        input_range="auto",
+        backend=DEFAULT_KONTEXT_BACKEND,
+        batch_window_ms=0,
+        result_cache="off",
+        variants=1,
+        prompt_list="",
+        seed_list="",
         unique_id=None,
         extra_pnginfo=None
     ):
@@ -342,56 +768,165 @@ class FluxKontextNode:
         @param {int} seed - 随机种子
         @param {torch.Tensor} mask - 可选遮罩
         @param {torch.Tensor} controlnet_image - 可选控制图像
+        @param {float} target_megapixels - 目标像素数(百万)，0表示保持输入像素数
+        @param {str} input_range - 输入数值范围（auto / 0-1 / 0-255）
+        @param {str} backend - 推理后端名称
+        @param {int} batch_window_ms - 微批处理合并窗口(毫秒)
+        @param {str} result_cache - 结果缓存（off / memory / memory+disk）
+        @param {int} variants - 每张图像的变体数
+        @param {str} prompt_list - 逐项提示词（多行）
+        @param {str} seed_list - 逐项种子（逗号分隔）
         @returns {Tuple} (编辑后图像, 使用的提示词, 编辑元数据)
         """
         try:
             logger.info(f"开始Flux Kontext编辑 - 节点ID: {unique_id}")
+            timer = StageTimer("flux_kontext")
             
             # 验证输入参数
-            if not self.processor.validate_aspect_ratio(aspect_ratio):
+            if aspect_ratio != "auto" and not self.processor.validate_aspect_ratio(aspect_ratio):
                 raise ValueError(f"不支持的宽高比: {aspect_ratio}")
             
-            # 处理提示词
-            prompt_data = self.processor.process_prompt_for_kontext(
-                prompt, prompt_upsampling
+            # 解析基础种子并展开编辑项（每张图像 × 变体，逐项提示词与种子）
+            random_seed = seed == -1 and not (seed_list or "").strip()
+            seed = resolve_kontext_seed(seed)
+            if image.dim() == 3:
+                image = image.unsqueeze(0)
+            items = expand_kontext_edit_items(
+                image.shape[0], prompt, seed, variants, prompt_list, seed_list
             )
             
-            # 设置随机种子
-            if seed == -1:
-                seed = torch.randint(0, 2147483647, (1,)).item()
-            
-            # 预处理图像
-            processed_image = self._preprocess_image(image, aspect_ratio)
-            
-            # 执行Flux Kontext推理
-            edited_image = self._run_kontext_inference(
-                processed_image,
-                prompt_data,
-                guidance_scale,
-                num_inference_steps,
-                seed,
-                mask,
-                controlnet_image
-            )
+            # 处理提示词（相同提示词只处理一次）
+            with timer.stage("prompt"):
+                prompt_data_by_text = {}
+                for item in items:
+                    if item.prompt not in prompt_data_by_text:
+                        prompt_data_by_text[item.prompt] = self.processor.process_prompt_for_kontext(
+                            item.prompt, prompt_upsampling
+                        )
+                item_prompt_data = [prompt_data_by_text[item.prompt] for item in items]
+            
+            # 查询结果缓存（随机种子的请求不可复现，不参与缓存）
+            cache = get_kontext_result_cache()
+            use_disk = result_cache == "memory+disk"
+            cache_key = None
+            cached = None
+            cache_status = "off"
+            if result_cache != "off":
+                if random_seed:
+                    cache_status = "bypass"
+                else:
+                    with timer.stage("cache"):
+                        cache_key = make_cache_key(
+                            "FluxKontextNode/1.0.0",
+                            {"image": image, "mask": mask, "controlnet_image": controlnet_image},
+                            {
+                                "items": [list(item) for item in items],
+                                "prompt_upsampling": bool(prompt_upsampling),
+                                "aspect_ratio": aspect_ratio,
+                                "guidance_scale": float(guidance_scale),
+                                "num_steps": int(num_inference_steps),
+                                "target_megapixels": float(target_megapixels),
+                                "input_range": input_range,
+                                "backend": backend,
+                            },
+                        )
+                        cached, cache_status = cache.get(cache_key, use_disk)
             
-            # 构建编辑元数据
+            if cached is not None:
+                edited_image = cached["image"]
+                results = [KontextResult(edited_image[index:index + 1], backend, 0.0, 0.0, 0) for index in range(len(items))]
+                bucket_name = cached["bucket"] or None
+            else:
+                # 预处理图像（每张源图像只处理一次，变体共享）
+                with timer.stage("preprocess"):
+                    processed_image, bucket = self._preprocess_image(
+                        image, aspect_ratio, target_megapixels, input_range
+                    )
+                bucket_name = bucket.name if bucket else None
+                
+                # 遮罩重采样到处理后的尺寸（后端合并批次时直接复用）
+                if mask is not None:
+                    with timer.stage("mask"):
+                        mask = resample_mask(mask, (processed_image.shape[1], processed_image.shape[2]))
+                
+                # 执行Flux Kontext推理：每个编辑项一个请求，合并为批量后端调用
+                with timer.stage("inference"):
+                    requests = [
+                        KontextRequest(
+                            image=processed_image[item.source_index:item.source_index + 1],
+                            prompt=data["text"],
+                            edit_type=data["edit_type"],
+                            guidance_scale=guidance_scale,
+                            num_steps=num_inference_steps,
+                            seed=item.seed,
+                            mask=self._select_source(mask, item.source_index),
+                            controlnet_image=self._select_source(controlnet_image, item.source_index),
+                        )
+                        for item, data in zip(items, item_prompt_data)
+                    ]
+                    results = self._run_kontext_inference(requests, backend, batch_window_ms)
+                    edited_image = results[0].image if len(results) == 1 else torch.cat([r.image for r in results])
+                
+                # 写入结果缓存（推理失败回退为原图时 batched_requests 为0，不缓存）
+                if cache_key is not None and all(r.batched_requests > 0 for r in results):
+                    with timer.stage("cache"):
+                        cache.put(cache_key, {"image": edited_image, "bucket": bucket_name or ""}, use_disk)
+            
+            # 后处理：结果放回输入所在设备
+            with timer.stage("postprocess"):
+                if edited_image.device != image.device:
+                    edited_image = edited_image.to(image.device)
+            stage_timings = timer.finish()
+            
+            # 预处理在输入上的居中裁剪区域（上, 左, 高, 宽），Image Unstitch 据此切分编辑后的拼接画布
+            crop_box = None
+            if bucket_name is not None:
+                _, crop_box = plan_kontext_crop(image.shape[2], image.shape[1], aspect_ratio, target_megapixels)
+            
+            # 构建编辑元数据（顶层字段取第一项，逐项信息见 items）
+            first_data = item_prompt_data[0]
+            used_texts = list(dict.fromkeys(data["text"] for data in item_prompt_data))
             edit_metadata = {
                 "model_type": "flux_kontext",
-                "edit_type": prompt_data["edit_type"],
+                "edit_type": first_data["edit_type"],
                 "original_prompt": prompt,
-                "enhanced_prompt": prompt_data["text"],
+                "enhanced_prompt": first_data["text"],
                 "aspect_ratio": aspect_ratio,
+                "bucket": bucket_name,
+                "input_size": [image.shape[1], image.shape[2]],
+                "crop_box": list(crop_box) if crop_box else None,
+                "resolution": f"{edited_image.shape[2]}x{edited_image.shape[1]}",
                 "guidance_scale": guidance_scale,
                 "num_steps": num_inference_steps,
                 "seed": seed,
+                "sample_seeds": [item.seed for item in items],
+                "variants": len(items) // image.shape[0],
                 "prompt_enhanced": prompt_upsampling,
-                "processing_time": "N/A",  # 这里可以添加实际处理时间
+                "backend": backend,
+                "queue_ms": round(max(r.queue_time for r in results) * 1000, 3),
+                "compute_ms": round(max(r.compute_time for r in results) * 1000, 3),
+                "batched_requests": max(r.batched_requests for r in results),
+                "result_cache": cache_status,
+                "processing_time": round(stage_timings["total"] / 1000, 6),
+                "stage_timings_ms": stage_timings,
+                "items": [
+                    {
+                        "index": index,
+                        "source_index": item.source_index,
+                        "prompt": data["text"],
+                        "edit_type": data["edit_type"],
+                        "seed": item.seed,
+                        "queue_ms": round(r.queue_time * 1000, 3),
+                        "compute_ms": round(r.compute_time * 1000, 3),
+                    }
+                    for index, (item, data, r) in enumerate(zip(items, item_prompt_data, results))
+                ],
                 "node_version": "1.0.0"
             }
             
-            logger.info(f"Flux Kontext编辑完成 - 类型: {prompt_data['edit_type']}")
+            logger.info(f"Flux Kontext编辑完成 - {len(items)} 项, 类型: {first_data['edit_type']}")
             
-            return (edited_image, prompt_data["text"], edit_metadata)
+            return (edited_image, "\n".join(used_texts), edit_metadata)
             
         except Exception as e:
             logger.error(f"Flux Kontext编辑失败: {str(e)}")
@@ -406,127 +941,361 @@ class FluxKontextNode:
             
             return (image, prompt, fallback_metadata)
     
-    def _preprocess_image(self, image: torch.Tensor, aspect_ratio: str) -> torch.Tensor:
+    def _preprocess_image(
+        self,
+        image: torch.Tensor,
+        aspect_ratio: str,
+        target_megapixels: float = 1.0,
+        input_range: str = "auto",
+    ) -> Tuple[torch.Tensor, Optional[KontextBucket]]:
         """
         预处理图像以适配Flux Kontext要求
         
+        按宽高比分桶：居中裁剪到桶的精确宽高比（张量视图，不复制），
+        尺寸与桶不同时最多做一次缩放。target_megapixels 为0时保持输入尺度，
+        直接裁剪到该比例下可容纳的最大16倍数尺寸，不缩放。数值范围由数据类型
+        或 input_range 声明，不扫描像素。
+        
         @param {torch.Tensor} image - 输入图像
-        @param {str} aspect_ratio - 目标宽高比
-        @returns {torch.Tensor} 预处理后的图像
+        @param {str} aspect_ratio - 目标宽高比，auto表示与输入最接近的比例
+        @param {float} target_megapixels - 目标像素数(百万)，0表示保持输入像素数
+        @param {str} input_range - 输入数值范围（auto / 0-1 / 0-255）
+        @returns {Tuple} (预处理后的图像, 使用的分辨率桶)
         """
         try:
-            # 获取宽高比数值
-            ratio_value = next(
-                ratio[1] for ratio in self.processor.aspect_ratios 
-                if ratio[0] == aspect_ratio
-            )
-            
             # 确保图像格式正确 (B, H, W, C)
             if image.dim() == 3:
                 image = image.unsqueeze(0)
             
-            # 确保图像在正确的数值范围内 [0, 1]
-            if image.max() > 1.0:
-                image = image / 255.0
-            
             batch_size, height, width, channels = image.shape
-            current_ratio = width / height
-            
-            logger.debug(f"图像预处理: {width}x{height} -> 目标比例: {aspect_ratio}")
+            bucket, (start_y, start_x, crop_height, crop_width) = plan_kontext_crop(
+                width, height, aspect_ratio, target_megapixels
+            )
             
-            # 如果比例差异很小，直接返回
-            if abs(current_ratio - ratio_value) < 0.05:
-                return image
+            logger.debug(f"图像预处理: {width}x{height} -> {bucket.name} ({bucket.width}x{bucket.height})")
+            
+            # 居中裁剪（切片为视图，不复制）
+            image = image[:, start_y:start_y + crop_height, start_x:start_x + crop_width, :]
+            
+            # 数值范围：由声明决定，不做 image.max() 之类的全量扫描
+            is_255 = input_range == "0-255" or (input_range == "auto" and not image.is_floating_point())
+            owned = False
+            if not image.is_floating_point():
+                image = image.float()
+                owned = True
+            
+            if (image.shape[1], image.shape[2]) != (bucket.height, bucket.width):
+                # 唯一一次缩放；NHWC的permute视图为channels_last，输出permute回来即连续
+                image = torch.nn.functional.interpolate(
+                    image.permute(0, 3, 1, 2),
+                    size=(bucket.height, bucket.width),
+                    mode="bilinear",
+                    align_corners=False,
+                    antialias=True,
+                ).permute(0, 2, 3, 1)
+                owned = True
             
-            # 调整图像尺寸以匹配目标宽高比
-            if current_ratio > ratio_value:
-                # 图像太宽，裁剪宽度
-                new_width = int(height * ratio_value)
-                start_x = (width - new_width) // 2
-                image = image[:, :, start_x:start_x + new_width, :]
-            else:
-                # 图像太高，裁剪高度
-                new_height = int(width / ratio_value)
-                start_y = (height - new_height) // 2
-                image = image[:, start_y:start_y + new_height, :, :]
+            if is_255:
+                image = image.mul_(1.0 / 255.0) if owned else image * (1.0 / 255.0)
             
-            logger.info(f"图像预处理完成: {image.shape[2]}x{image.shape[1]}")
-            return image
+            logger.info(f"图像预处理完成: {image.shape[2]}x{image.shape[1]} ({bucket.name})")
+            return image, bucket
             
         except Exception as e:
             logger.error(f"图像预处理失败: {str(e)}")
-            return image
+            return image, None
+    
+    @staticmethod
+    def _select_source(tensor: Optional[torch.Tensor], source_index: int) -> Optional[torch.Tensor]:
+        """取第 source_index 张源图像对应的遮罩/控制图像（批次为1时共用，返回视图）"""
+        if tensor is None or tensor.dim() < 3 or tensor.shape[0] == 1:
+            return tensor
+        return tensor[source_index:source_index + 1]
     
     def _run_kontext_inference(
-        self, 
-        image: torch.Tensor, 
-        prompt_data: Dict[str, Any],
-        guidance_scale: float,
-        num_steps: int,
-        seed: int,
-        mask: Optional[torch.Tensor] = None,
-        controlnet_image: Optional[torch.Tensor] = None
-    ) -> torch.Tensor:
+        self,
+        requests: List[KontextRequest],
+        backend: str = DEFAULT_KONTEXT_BACKEND,
+        batch_window_ms: int = 0
+    ) -> List[KontextResult]:
         """
         运行Flux Kontext推理
         
-        注意: 这是一个框架实现，实际使用时需要集成真实的Flux Kontext模型
+        所有请求一起提交到所选后端的微批处理队列，尺寸兼容的请求（包括其他执行中
+        窗口内到达的请求）合并为批量后端调用
         
-        @param {torch.Tensor} image - 预处理后的图像
-        @param {Dict} prompt_data - 提示词数据
-        @param {float} guidance_scale - 引导强度
-        @param {int} num_steps - 推理步数
-        @param {int} seed - 随机种子
-        @param {torch.Tensor} mask - 可选遮罩
-        @param {torch.Tensor} controlnet_image - 可选控制图像
-        @returns {torch.Tensor} 编辑后的图像
+        @param {List[KontextRequest]} requests - 编辑请求（每个编辑项一个）
+        @param {str} backend - 推理后端名称
+        @param {int} batch_window_ms - 合并窗口(毫秒)，0表示不等待、直接按 max_batch 分批调用后端
+        @returns {List[KontextResult]} 与请求顺序一致的结果及排队/计算耗时
         """
         try:
-            # 设置随机种子以确保可重现性
-            torch.manual_seed(seed)
-            if torch.cuda.is_available():
-                torch.cuda.manual_seed(seed)
-            
-            logger.info(f"开始Flux Kontext推理 - 步数: {num_steps}, 引导: {guidance_scale}")
-            
-            # TODO: 这里需要集成实际的Flux Kontext模型推理
-            # 当前返回轻微修改的原图作为演示
-            
-            # 模拟推理过程的日志
-            logger.info(f"使用提示词: {prompt_data['text'][:100]}...")
-            logger.info(f"编辑类型: {prompt_data['edit_type']}")
-            
-            # 临时实现：添加微小的随机噪声来模拟编辑
-            noise_factor = 0.02  # 很小的噪声，不会显著改变图像
-            noise = torch.randn_like(image) * noise_factor
-            
-            # 如果有遮罩，只在遮罩区域应用变化
-            if mask is not None:
-                if mask.dim() == 2:
-                    mask = mask.unsqueeze(0).unsqueeze(-1)
-                elif mask.dim() == 3:
-                    mask = mask.unsqueeze(-1)
-                
-                # 确保遮罩和图像尺寸匹配
-                mask = torch.nn.functional.interpolate(
-                    mask.permute(0, 3, 1, 2), 
-                    size=(image.shape[1], image.shape[2]), 
-                    mode='bilinear'
-                ).permute(0, 2, 3, 1)
-                
-                edited_image = image + noise * mask
-            else:
-                edited_image = image + noise
+            first = requests[0]
+            logger.info(
+                f"开始Flux Kontext推理 - 后端: {backend}, 编辑项: {len(requests)}, "
+                f"步数: {first.num_steps}, 引导: {first.guidance_scale}"
+            )
+            logger.info(f"使用提示词: {first.prompt[:100]}...")
+            logger.info(f"编辑类型: {first.edit_type}")
             
-            # 确保图像值在有效范围内
-            edited_image = torch.clamp(edited_image, 0.0, 1.0)
+            results = get_kontext_batcher(backend).submit_many(requests, batch_window_ms / 1000.0)
             
-            logger.info("Flux Kontext推理完成")
-            return edited_image
+            logger.info(
+                f"Flux Kontext推理完成 - 排队: {max(r.queue_time for r in results) * 1000:.1f}ms, "
+                f"计算: {max(r.compute_time for r in results) * 1000:.1f}ms, "
+                f"合并请求数: {max(r.batched_requests for r in results)}"
+            )
+            return results
             
         except Exception as e:
             logger.error(f"Flux Kontext推理失败: {str(e)}")
-            return image
+            return [KontextResult(request.image, backend, 0.0, 0.0, 0) for request in requests]
+
+@lru_cache(maxsize=None)
+def get_kontext_result_cache() -> TensorResultCache:
+    """
+    获取共享的Kontext编辑结果缓存（内存LRU + 可选磁盘层）
+    
+    @returns {TensorResultCache} 共享缓存
+    """
+    return TensorResultCache("flux_kontext")
+
+class KontextStitchPlacement(NamedTuple):
+    """单张源图像在拼接画布中的位置（像素），padding 为单元格内的 (上, 下, 左, 右) 填充"""
+    y: int
+    x: int
+    height: int
+    width: int
+    padding: Tuple[int, int, int, int] = (0, 0, 0, 0)
+
+class KontextStitchLayout(NamedTuple):
+    """拼接布局：画布尺寸与每张源图像的位置"""
+    height: int
+    width: int
+    placements: Tuple[KontextStitchPlacement, ...]
+    direction: str = "horizontal"
+    alignment: str = "center"
+    gap: int = 0
+    
+    def to_record(self) -> Dict[str, Any]:
+        """
+        导出紧凑的布局记录（可JSON序列化），供 Image Unstitch 节点使用
+        
+        @returns {Dict} 布局记录
+        """
+        return {
+            "version": 1,
+            "canvas": [self.height, self.width],
+            "direction": self.direction,
+            "alignment": self.alignment,
+            "gap": self.gap,
+            "sources": [
+                {
+                    "offset": [placement.y, placement.x],
+                    "size": [placement.height, placement.width],
+                    "padding": list(placement.padding),
+                }
+                for placement in self.placements
+            ],
+        }
+    
+    def scaled(self, factor: int) -> "KontextStitchLayout":
+        """
+        按整数倍缩放布局（例如潜在空间布局换算为像素布局）
+        
+        @param {int} factor - 缩放倍数
+        @returns {KontextStitchLayout} 缩放后的布局
+        """
+        return self._replace(
+            height=self.height * factor,
+            width=self.width * factor,
+            placements=tuple(
+                KontextStitchPlacement(
+                    y=placement.y * factor,
+                    x=placement.x * factor,
+                    height=placement.height * factor,
+                    width=placement.width * factor,
+                    padding=tuple(value * factor for value in placement.padding),
+                )
+                for placement in self.placements
+            ),
+            gap=self.gap * factor,
+        )
+    
+    @classmethod
+    def from_record(cls, record: Mapping[str, Any]) -> "KontextStitchLayout":
+        """
+        从布局记录恢复布局
+        
+        @param {Dict} record - to_record 导出的布局记录
+        @returns {KontextStitchLayout} 拼接布局
+        """
+        height, width = record["canvas"]
+        return cls(
+            height=int(height),
+            width=int(width),
+            placements=tuple(
+                KontextStitchPlacement(
+                    y=int(source["offset"][0]),
+                    x=int(source["offset"][1]),
+                    height=int(source["size"][0]),
+                    width=int(source["size"][1]),
+                    padding=tuple(int(value) for value in source.get("padding", (0, 0, 0, 0))),
+                )
+                for source in record["sources"]
+            ),
+            direction=record.get("direction", "horizontal"),
+            alignment=record.get("alignment", "center"),
+            gap=int(record.get("gap", 0)),
+        )
+
+def _stitch_align_offset(free: int, alignment: str) -> int:
+    """单元格内的对齐偏移（top为上/左对齐，bottom为下/右对齐）"""
+    if alignment == "top":
+        return 0
+    if alignment == "bottom":
+        return free
+    return free // 2
+
+def plan_kontext_stitch(
+    sizes: List[Tuple[int, int]],
+    direction: str,
+    alignment: str,
+    gap: int,
+    columns: int = 0,
+) -> KontextStitchLayout:
+    """
+    计算拼接布局（只处理尺寸，不涉及张量）
+    
+    horizontal 为单行、vertical 为单列、grid 为 行×列 网格；每行高度与每列宽度取该行/列的最大值，
+    图像在单元格内按 alignment 对齐，相邻单元格之间留 gap 像素间隙。
+    
+    @param {List[Tuple[int, int]]} sizes - 每张图像的 (高, 宽)
+    @param {str} direction - horizontal / vertical / grid
+    @param {str} alignment - top / center / bottom
+    @param {int} gap - 间隙像素数
+    @param {int} columns - 网格列数，0表示自动（接近正方形）
+    @returns {KontextStitchLayout} 拼接布局
+    """
+    count = len(sizes)
+    if count == 0:
+        raise ValueError("没有可拼接的图像")
+    if direction == "horizontal":
+        rows, cols = 1, count
+    elif direction == "vertical":
+        rows, cols = count, 1
+    elif direction == "grid":
+        cols = min(columns if columns > 0 else math.ceil(math.sqrt(count)), count)
+        rows = math.ceil(count / cols)
+    else:
+        raise ValueError(f"不支持的拼接方向: {direction}")
+    
+    row_heights = [0] * rows
+    col_widths = [0] * cols
+    for index, (height, width) in enumerate(sizes):
+        row, col = divmod(index, cols)
+        row_heights[row] = max(row_heights[row], height)
+        col_widths[col] = max(col_widths[col], width)
+    
+    row_offsets = [sum(row_heights[:row]) + gap * row for row in range(rows)]
+    col_offsets = [sum(col_widths[:col]) + gap * col for col in range(cols)]
+    placements = []
+    for index, (height, width) in enumerate(sizes):
+        row, col = divmod(index, cols)
+        pad_top = _stitch_align_offset(row_heights[row] - height, alignment)
+        pad_left = _stitch_align_offset(col_widths[col] - width, alignment)
+        placements.append(KontextStitchPlacement(
+            y=row_offsets[row] + pad_top,
+            x=col_offsets[col] + pad_left,
+            height=height,
+            width=width,
+            padding=(
+                pad_top,
+                row_heights[row] - height - pad_top,
+                pad_left,
+                col_widths[col] - width - pad_left,
+            ),
+        ))
+    
+    return KontextStitchLayout(
+        height=sum(row_heights) + gap * (rows - 1),
+        width=sum(col_widths) + gap * (cols - 1),
+        placements=tuple(placements),
+        direction=direction,
+        alignment=alignment,
+        gap=gap,
+    )
+
+def stitch_kontext_images(images: List[torch.Tensor], layout: KontextStitchLayout) -> torch.Tensor:
+    """
+    按布局拼接图像：一次性分配画布，每张图像直接复制到对应切片
+    
+    批次大小为1的图像通过广播复制到每个批次项，不会先展开成完整批次。
+    
+    @param {List[torch.Tensor]} images - [B, H, W, C] 图像列表，批次大小为1或相同的B
+    @param {KontextStitchLayout} layout - 拼接布局
+    @returns {torch.Tensor} [B, H, W, C] 拼接后的图像
+    """
+    batch_size = max(img.shape[0] for img in images)
+    channels = images[0].shape[3]
+    for img in images:
+        if img.shape[0] not in (1, batch_size):
+            raise ValueError(f"图像批次大小 {img.shape[0]} 无法广播到 {batch_size}")
+        if img.shape[3] != channels:
+            raise ValueError(f"图像通道数不一致: {img.shape[3]} != {channels}")
+    
+    canvas = torch.zeros(
+        (batch_size, layout.height, layout.width, channels),
+        dtype=images[0].dtype, device=images[0].device
+    )
+    for img, placement in zip(images, layout.placements):
+        canvas[
+            :,
+            placement.y:placement.y + placement.height,
+            placement.x:placement.x + placement.width,
+        ].copy_(img)
+    return canvas
+
+def unstitch_kontext_images(
+    stitched: torch.Tensor,
+    layout: KontextStitchLayout,
+    crop_box: Optional[Tuple[int, int, int, int]] = None,
+) -> List[torch.Tensor]:
+    """
+    按布局把拼接图像切分回每张源图像（切片视图，不复制）
+    
+    crop_box 为编辑时在拼接画布上的裁剪区域 (上, 左, 高, 宽)（画布像素），拼接图像是该区域
+    缩放后的结果；未提供时视为整个画布。坐标先减去裁剪偏移，再按裁剪区域与拼接图像的
+    尺寸比例换算。源图像超出裁剪区域的部分以0填充（此时复制），输出保持源图像的比例。
+    
+    @param {torch.Tensor} stitched - [B, H, W, C] 拼接后（可能已编辑）的图像
+    @param {KontextStitchLayout} layout - 拼接布局
+    @param {Tuple} crop_box - 编辑时的裁剪区域 (上, 左, 高, 宽)，None表示未裁剪
+    @returns {List[torch.Tensor]} 每张源图像对应的 [B, h, w, C] 图像
+    """
+    batch_size, height, width, channels = stitched.shape
+    crop_top, crop_left, crop_height, crop_width = crop_box or (0, 0, layout.height, layout.width)
+    scale_y = height / crop_height
+    scale_x = width / crop_width
+    parts = []
+    for placement in layout.placements:
+        top = round((placement.y - crop_top) * scale_y)
+        left = round((placement.x - crop_left) * scale_x)
+        bottom = max(top + 1, round((placement.y + placement.height - crop_top) * scale_y))
+        right = max(left + 1, round((placement.x + placement.width - crop_left) * scale_x))
+        if top >= 0 and left >= 0 and bottom <= height and right <= width:
+            parts.append(stitched[:, top:bottom, left:right])
+            continue
+        
+        # 部分（或全部）被裁剪掉：可见区域复制到0填充的完整尺寸中
+        part = stitched.new_zeros((batch_size, bottom - top, right - left, channels))
+        y0, y1 = max(top, 0), min(bottom, height)
+        x0, x1 = max(left, 0), min(right, width)
+        if y1 > y0 and x1 > x0:
+            part[:, y0 - top:y1 - top, x0 - left:x1 - left] = stitched[:, y0:y1, x0:x1]
+        logger.warning(f"源图像 {len(parts)} 在编辑时被部分裁剪，裁剪掉的区域以0填充")
+        parts.append(part)
+    return parts
 
 class FluxKontextImageStitch:
     """
@@ -535,9 +1304,24 @@ class FluxKontextImageStitch:
     支持多图像输入的官方工作流，允许将多个图像拼接后进行编辑
     """
     
+    MAX_IMAGES = 8
+    
     @classmethod
     def INPUT_TYPES(cls):
         """定义图像拼接节点输入类型"""
+        optional = {
+            f"image{index}": ("IMAGE", {
+                "tooltip": f"可选第{index}张图像"
+            })
+            for index in range(3, cls.MAX_IMAGES + 1)
+        }
+        optional["grid_columns"] = ("INT", {
+            "default": 0,
+            "min": 0,
+            "max": cls.MAX_IMAGES,
+            "step": 1,
+            "tooltip": "网格列数 - 仅grid方向使用，0表示自动"
+        })
         return {
             "required": {
                 "image1": ("IMAGE", {
@@ -546,13 +1330,13 @@ class FluxKontextImageStitch:
                 "image2": ("IMAGE", {
                     "tooltip": "第二张图像"
                 }),
-                "stitch_direction": (["horizontal", "vertical"], {
+                "stitch_direction": (["horizontal", "vertical", "grid"], {
                     "default": "horizontal",
-                    "tooltip": "拼接方向 - 水平或垂直"
+                    "tooltip": "拼接方向 - 水平、垂直或网格（行×列）"
                 }),
                 "alignment": (["top", "center", "bottom"], {
                     "default": "center",
-                    "tooltip": "对齐方式"
+                    "tooltip": "对齐方式 - 垂直拼接时top/bottom表示左/右对齐"
                 }),
                 "gap": ("INT", {
                     "default": 0,
@@ -562,18 +1346,11 @@ class FluxKontextImageStitch:
                     "tooltip": "图像间间隙像素数"
                 }),
             },
-            "optional": {
-                "image3": ("IMAGE", {
-                    "tooltip": "可选第三张图像"
-                }),
-                "image4": ("IMAGE", {
-                    "tooltip": "可选第四张图像"
-                }),
-            }
+            "optional": optional
         }
     
-    RETURN_TYPES = ("IMAGE",)
-    RETURN_NAMES = ("stitched_image",)
+    RETURN_TYPES = ("IMAGE", "STITCH_LAYOUT")
+    RETURN_NAMES = ("stitched_image", "stitch_layout")
     FUNCTION = "stitch_images"
     CATEGORY = "Davemane42/FluxKontext"
     
@@ -581,159 +1358,127 @@ class FluxKontextImageStitch:
     <strong>Flux Kontext图像拼接</strong> - 将多个图像拼接为单个图像用于编辑
 
     特性:
-    • 支持2-4张图像拼接
-    • 水平/垂直拼接方向
+    • 支持2-8张图像拼接
+    • 水平/垂直/网格拼接方向
     • 智能对齐选项
     • 可调节图像间距
+    • 批次大小为1的图像自动广播
+    • 输出布局记录，编辑后可用 Image Unstitch 切分回每张源图像
     • 兼容官方多图像工作流
     """
     
-    def stitch_images(self, image1, image2, stitch_direction, alignment, gap, image3=None, image4=None):
+    def stitch_images(self, image1, image2, stitch_direction, alignment, gap, grid_columns=0, **optional_images):
         """
         拼接多个图像
         
         @param {torch.Tensor} image1 - 第一张图像
         @param {torch.Tensor} image2 - 第二张图像  
-        @param {str} stitch_direction - 拼接方向
+        @param {str} stitch_direction - 拼接方向（horizontal / vertical / grid）
         @param {str} alignment - 对齐方式
         @param {int} gap - 间隙大小
-        @param {torch.Tensor} image3 - 可选第三张图像
-        @param {torch.Tensor} image4 - 可选第四张图像
-        @returns {Tuple} 拼接后的图像
+        @param {int} grid_columns - 网格列数，0表示自动
+        @param {torch.Tensor} optional_images - 可选的 image3 ... imageN
+        @returns {Tuple} (拼接后的图像, 布局记录)
         """
         try:
             logger.info(f"开始图像拼接 - 方向: {stitch_direction}, 对齐: {alignment}")
             
-            # 收集所有有效图像
-            images = [image1, image2]
-            if image3 is not None:
-                images.append(image3)
-            if image4 is not None:
-                images.append(image4)
+            # 收集所有有效图像（按编号顺序）
+            images = [image1, image2] + [
+                optional_images[f"image{index}"]
+                for index in range(3, self.MAX_IMAGES + 1)
+                if optional_images.get(f"image{index}") is not None
+            ]
             
             # 确保所有图像都是4D张量 (B, H, W, C)
-            processed_images = []
-            for img in images:
-                if img.dim() == 3:
-                    img = img.unsqueeze(0)
-                processed_images.append(img)
-            
-            # 根据拼接方向执行拼接
-            if stitch_direction == "horizontal":
-                stitched = self._stitch_horizontal(processed_images, alignment, gap)
-            else:
-                stitched = self._stitch_vertical(processed_images, alignment, gap)
+            images = [img.unsqueeze(0) if img.dim() == 3 else img for img in images]
             
-            logger.info(f"图像拼接完成 - 最终尺寸: {stitched.shape}")
-            return (stitched,)
+            layout = plan_kontext_stitch(
+                [(img.shape[1], img.shape[2]) for img in images],
+                stitch_direction, alignment, gap, grid_columns
+            )
+            stitched = stitch_kontext_images(images, layout)
+            
+            logger.info(f"图像拼接完成 - {len(images)} 张图像, 最终尺寸: {stitched.shape}")
+            return (stitched, layout.to_record())
             
         except Exception as e:
             logger.error(f"图像拼接失败: {str(e)}")
-            return (image1,)  # 返回第一张图像作为回退
+            # 返回第一张图像作为回退，布局为覆盖整张图像的单个源
+            height, width = image1.shape[-3], image1.shape[-2]
+            fallback_layout = KontextStitchLayout(height, width, (KontextStitchPlacement(0, 0, height, width),))
+            return (image1, fallback_layout.to_record())
+
+class FluxKontextImageUnstitch:
+    """
+    Flux Kontext图像拆分节点
     
-    def _stitch_horizontal(self, images: List[torch.Tensor], alignment: str, gap: int) -> torch.Tensor:
-        """水平拼接图像"""
-        try:
-            # 计算目标高度（最大高度）
-            max_height = max(img.shape[1] for img in images)
-            
-            # 调整所有图像到相同高度
-            aligned_images = []
-            for img in images:
-                current_height = img.shape[1]
-                if current_height != max_height:
-                    # 根据对齐方式填充图像
-                    if alignment == "top":
-                        pad_top, pad_bottom = 0, max_height - current_height
-                    elif alignment == "bottom":
-                        pad_top, pad_bottom = max_height - current_height, 0
-                    else:  # center
-                        pad_total = max_height - current_height
-                        pad_top = pad_total // 2
-                        pad_bottom = pad_total - pad_top
-                    
-                    # 应用填充
-                    img = torch.nn.functional.pad(
-                        img, (0, 0, 0, 0, pad_top, pad_bottom, 0, 0), 
-                        mode='constant', value=0
-                    )
-                
-                aligned_images.append(img)
-            
-            # 添加间隙
-            if gap > 0:
-                final_images = []
-                for i, img in enumerate(aligned_images):
-                    final_images.append(img)
-                    if i < len(aligned_images) - 1:  # 不在最后一张图像后添加间隙
-                        gap_tensor = torch.zeros(
-                            img.shape[0], img.shape[1], gap, img.shape[3],
-                            device=img.device, dtype=img.dtype
-                        )
-                        final_images.append(gap_tensor)
-                aligned_images = final_images
-            
-            # 水平拼接
-            stitched = torch.cat(aligned_images, dim=2)
-            
-            logger.debug(f"水平拼接完成: {len(images)} 张图像")
-            return stitched
-            
-        except Exception as e:
-            logger.error(f"水平拼接失败: {str(e)}")
-            return images[0]
+    按 Image Stitch 输出的布局记录，把编辑后的拼接图像切分回每张源图像，
+    一次拼接编辑即可替代对每张图像分别编辑
+    """
     
-    def _stitch_vertical(self, images: List[torch.Tensor], alignment: str, gap: int) -> torch.Tensor:
-        """垂直拼接图像"""
+    @classmethod
+    def INPUT_TYPES(cls):
+        """定义图像拆分节点输入类型"""
+        return {
+            "required": {
+                "stitched_image": ("IMAGE", {
+                    "tooltip": "拼接后（可已编辑）的图像"
+                }),
+                "stitch_layout": ("STITCH_LAYOUT", {
+                    "tooltip": "Image Stitch 输出的布局记录"
+                }),
+            },
+            "optional": {
+                "edit_metadata": ("DICT", {
+                    "tooltip": "Flux Kontext编辑节点的 edit_metadata - 编辑时裁剪到分辨率桶的比例，据此换算切分区域"
+                }),
+            }
+        }
+    
+    RETURN_TYPES = ("IMAGE",)
+    RETURN_NAMES = ("images",)
+    OUTPUT_IS_LIST = (True,)
+    FUNCTION = "unstitch_images"
+    CATEGORY = "Davemane42/FluxKontext"
+    
+    DESCRIPTION = """
+    <strong>Image Unstitch</strong> - 将拼接图像切分回每张源图像
+
+    特性:
+    • 按布局记录切分，输出列表顺序与拼接输入一致
+    • 切片视图，不复制图像数据
+    • 拼接图像被缩放时按比例换算切分区域
+    • 连接 edit_metadata 时考虑编辑节点对画布的居中裁剪
+    """
+    
+    def unstitch_images(self, stitched_image, stitch_layout, edit_metadata=None):
+        """
+        拆分拼接图像
+        
+        @param {torch.Tensor} stitched_image - 拼接后的图像
+        @param {Dict} stitch_layout - 布局记录
+        @param {Dict} edit_metadata - 可选，Flux Kontext编辑节点的元数据（裁剪区域）
+        @returns {Tuple} (每张源图像的列表,)
+        """
         try:
-            # 计算目标宽度（最大宽度）
-            max_width = max(img.shape[2] for img in images)
-            
-            # 调整所有图像到相同宽度
-            aligned_images = []
-            for img in images:
-                current_width = img.shape[2]
-                if current_width != max_width:
-                    # 根据对齐方式填充图像
-                    if alignment == "top":  # 实际是左对齐
-                        pad_left, pad_right = 0, max_width - current_width
-                    elif alignment == "bottom":  # 实际是右对齐
-                        pad_left, pad_right = max_width - current_width, 0
-                    else:  # center
-                        pad_total = max_width - current_width
-                        pad_left = pad_total // 2
-                        pad_right = pad_total - pad_left
-                    
-                    # 应用填充
-                    img = torch.nn.functional.pad(
-                        img, (0, 0, pad_left, pad_right, 0, 0, 0, 0), 
-                        mode='constant', value=0
-                    )
-                
-                aligned_images.append(img)
-            
-            # 添加间隙
-            if gap > 0:
-                final_images = []
-                for i, img in enumerate(aligned_images):
-                    final_images.append(img)
-                    if i < len(aligned_images) - 1:  # 不在最后一张图像后添加间隙
-                        gap_tensor = torch.zeros(
-                            img.shape[0], gap, img.shape[2], img.shape[3],
-                            device=img.device, dtype=img.dtype
-                        )
-                        final_images.append(gap_tensor)
-                aligned_images = final_images
-            
-            # 垂直拼接
-            stitched = torch.cat(aligned_images, dim=1)
-            
-            logger.debug(f"垂直拼接完成: {len(images)} 张图像")
-            return stitched
+            if stitched_image.dim() == 3:
+                stitched_image = stitched_image.unsqueeze(0)
+            layout = KontextStitchLayout.from_record(stitch_layout)
+            crop_box = None
+            if edit_metadata and edit_metadata.get("crop_box"):
+                # 裁剪区域为编辑输入的像素坐标，编辑输入与画布尺寸不同时按比例换算到画布
+                input_height, input_width = edit_metadata.get("input_size") or (layout.height, layout.width)
+                top, left, height, width = edit_metadata["crop_box"]
+                factor_y, factor_x = layout.height / input_height, layout.width / input_width
+                crop_box = (top * factor_y, left * factor_x, height * factor_y, width * factor_x)
+            parts = unstitch_kontext_images(stitched_image, layout, crop_box)
+            logger.info(f"图像拆分完成 - {len(parts)} 张图像")
+            return (parts,)
             
         except Exception as e:
-            logger.error(f"垂直拼接失败: {str(e)}")
-            return images[0]
+            logger.error(f"图像拆分失败: {str(e)}")
+            return ([stitched_image],)
 
 class FluxKontextPromptHelper:
     """
@@ -777,6 +1522,13 @@ class FluxKontextPromptHelper:
                     "default": "facial features, composition, lighting",
                     "tooltip": "需要保持不变的元素"
                 }),
+            },
+            "optional": {
+                "batch_prompts": ("STRING", {
+                    "multiline": True,
+                    "default": "",
+                    "tooltip": "批量提示词 - 每行一个提示词，或每行一个JSON对象 {\"prompt\": ..., \"preserve_elements\": ...}；非空时替代模板和自定义输入"
+                }),
             }
         }
     
@@ -785,6 +1537,42 @@ class FluxKontextPromptHelper:
     FUNCTION = "generate_optimal_prompt"
     CATEGORY = "Davemane42/FluxKontext"
     
+    # 批量模式：输入按列表接收（上游列表输出可直接连入），每个输出都是与提示词一一对应的列表
+    INPUT_IS_LIST = True
+    OUTPUT_IS_LIST = (True, True, True)
+    
+    EDITING_TIPS = MappingProxyType({
+        "style_transfer": """💡 风格转换建议:
+• 明确指定艺术风格名称
+• 描述关键视觉特征
+• 强调保持原始构图
+• 考虑分步骤转换复杂风格""",
+        
+        "background_replacement": """💡 背景替换建议:
+• 详细描述新背景
+• 强调保持主体位置不变
+• 注意光照一致性
+• 考虑透视和比例关系""",
+        
+        "object_modification": """💡 对象修改建议:
+• 使用具体的对象描述
+• 明确指定要改变的属性
+• 保持周围环境不变
+• 注意光照和阴影的连续性""",
+        
+        "text_editing": """💡 文本编辑建议:
+• 用引号包围要替换的文本
+• 指定保持字体样式
+• 注意文本的位置和大小
+• 确保颜色与背景协调""",
+        
+        "general_editing": """💡 通用编辑建议:
+• 使用明确和具体的描述
+• 避免模糊的术语
+• 分步骤处理复杂编辑
+• 明确指出需要保持的元素"""
+    })
+    
     DESCRIPTION = """
     <strong>Flux Kontext提示词助手</strong> - 生成最佳实践的编辑提示词
 
@@ -794,131 +1582,167 @@ class FluxKontextPromptHelper:
     • 编辑类型智能检测
     • 专业提示词建议
     • 保持元素自动添加
+    • 批量模式 - 列表输入或多行/JSONL提示词，一次执行处理整批
     """
     
-    def generate_optimal_prompt(self, edit_template, custom_prompt, enable_best_practices, preserve_elements):
+    def generate_optimal_prompt(self, edit_template, custom_prompt, enable_best_practices, preserve_elements,
+                                batch_prompts=None):
         """
-        生成优化的提示词
+        生成优化的提示词（批量）
+        
+        所有输入以列表形式传入，长度不一时按ComfyUI惯例用最后一个值补齐；
+        batch_prompts 非空时按行展开为提示词列表。整批提示词共享一次批量分析，
+        增强后的结果由追加文本推导，不再重新扫描；不逐条记录日志。
         
-        @param {str} edit_template - 编辑模板
-        @param {str} custom_prompt - 自定义提示词
-        @param {bool} enable_best_practices - 是否启用最佳实践
-        @param {str} preserve_elements - 保持不变的元素
-        @returns {Tuple} (优化提示词, 编辑建议, 分析数据)
+        @param {List[str]} edit_template - 编辑模板
+        @param {List[str]} custom_prompt - 自定义提示词
+        @param {List[bool]} enable_best_practices - 是否启用最佳实践
+        @param {List[str]} preserve_elements - 保持不变的元素
+        @param {List[str]} batch_prompts - 可选批量提示词（每行一个，或JSONL）
+        @returns {Tuple} (优化提示词列表, 编辑建议列表, 分析数据列表)
         """
         try:
-            logger.info("开始生成优化提示词")
+            jobs = self._collect_jobs(edit_template, custom_prompt, enable_best_practices,
+                                      preserve_elements, batch_prompts)
+            logger.info(f"开始生成优化提示词 - {len(jobs)} 条")
             
-            # 确定使用的基础提示词
-            if edit_template == "Custom Input":
-                base_prompt = custom_prompt
-            else:
-                base_prompt = edit_template
-            
-            # 应用最佳实践增强
-            if enable_best_practices:
-                optimized_prompt = self._apply_best_practices(base_prompt, preserve_elements)
-            else:
-                optimized_prompt = base_prompt
+            matcher = get_kontext_prompt_matcher()
             
-            # 生成编辑建议
-            editing_tips = self._generate_editing_tips(optimized_prompt)
+            # 一次批量分析基础提示词；最佳实践只追加以逗号开头的文本，
+            # 增强后提示词的分析结果由追加文本推导
+            optimized_prompts = []
+            results = []
+            base_results = matcher.analyze_batch(base for base, _, _ in jobs)
+            for (base, preserve, enabled), base_result in zip(jobs, base_results):
+                suffix = self._best_practice_suffix(preserve, base_result.features) if enabled else ""
+                optimized_prompts.append(base + suffix)
+                results.append(matcher.extend(base_result, suffix))
             
-            # 分析提示词
-            analysis = self._analyze_prompt(optimized_prompt)
+            editing_tips = [self._generate_editing_tips(prompt, result)
+                            for prompt, result in zip(optimized_prompts, results)]
+            analyses = [self._analyze_prompt(prompt, result)
+                        for prompt, result in zip(optimized_prompts, results)]
             
-            logger.info(f"提示词优化完成 - 类型: {analysis['edit_type']}")
+            logger.info(f"提示词优化完成 - {len(jobs)} 条")
             
-            return (optimized_prompt, editing_tips, analysis)
+            return (optimized_prompts, editing_tips, analyses)
             
         except Exception as e:
             logger.error(f"提示词生成失败: {str(e)}")
-            return (custom_prompt, "提示词生成失败", {"error": str(e)})
+            fallback = custom_prompt if isinstance(custom_prompt, list) else [custom_prompt]
+            return (fallback, ["提示词生成失败"] * len(fallback), [{"error": str(e)}] * len(fallback))
+    
+    def _collect_jobs(self, edit_template, custom_prompt, enable_best_practices, preserve_elements,
+                      batch_prompts=None) -> List[Tuple[str, str, bool]]:
+        """
+        展开列表输入为 (基础提示词, 保持元素, 是否启用最佳实践) 任务列表
+        
+        @returns {List} 任务列表
+        """
+        def as_list(value):
+            return value if isinstance(value, list) else [value]
+        
+        edit_template = as_list(edit_template)
+        custom_prompt = as_list(custom_prompt)
+        enable_best_practices = as_list(enable_best_practices)
+        preserve_elements = as_list(preserve_elements)
+        batch_text = "\n".join(text for text in as_list(batch_prompts) if text)
+        
+        if batch_text.strip():
+            # 批量提示词：其余设置取第一个值
+            return [
+                (prompt, preserve, bool(enable_best_practices[0]))
+                for prompt, preserve in self._parse_batch_prompts(batch_text, preserve_elements[0])
+            ]
+        
+        count = max(len(edit_template), len(custom_prompt), len(enable_best_practices), len(preserve_elements))
+        jobs = []
+        for i in range(count):
+            template = edit_template[min(i, len(edit_template) - 1)]
+            base_prompt = custom_prompt[min(i, len(custom_prompt) - 1)] if template == "Custom Input" else template
+            jobs.append((
+                base_prompt,
+                preserve_elements[min(i, len(preserve_elements) - 1)],
+                bool(enable_best_practices[min(i, len(enable_best_practices) - 1)]),
+            ))
+        return jobs
+    
+    def _parse_batch_prompts(self, text: str, default_preserve: str) -> List[Tuple[str, str]]:
+        """
+        解析批量提示词：每行一个提示词，或每行一个JSON对象
+        
+        @param {str} text - 多行文本
+        @param {str} default_preserve - 默认保持元素
+        @returns {List} (提示词, 保持元素) 列表
+        """
+        items = []
+        for line_number, line in enumerate(text.splitlines(), 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    record = json.loads(line)
+                    items.append((str(record.get("prompt", "")),
+                                  str(record.get("preserve_elements", default_preserve))))
+                    continue
+                except (ValueError, AttributeError) as e:
+                    logger.warning(f"批量提示词第{line_number}行JSON解析失败，按纯文本处理: {e}")
+            items.append((line, default_preserve))
+        return items
+    
+    def _best_practice_suffix(self, preserve_elements: str, features: FrozenSet[str]) -> str:
+        """最佳实践需要追加的文本（以逗号开头，可能为空）"""
+        suffix = ""
+        # 检查是否已经包含保持元素的描述
+        if preserve_elements and preserve_elements.strip():
+            if "preservation" not in features:
+                suffix += f", while preserving {preserve_elements}"
+        
+        # 检查是否需要添加质量词汇
+        if "quality_enhancer" not in features:
+            suffix += ", high quality and natural-looking result"
+        
+        return suffix
     
     def _apply_best_practices(self, prompt: str, preserve_elements: str) -> str:
         """应用Flux Kontext最佳实践"""
         try:
-            # 检查是否已经包含保持元素的描述
-            if preserve_elements and preserve_elements.strip():
-                if "keep" not in prompt.lower() and "maintain" not in prompt.lower() and "preserve" not in prompt.lower():
-                    prompt = f"{prompt}, while preserving {preserve_elements}"
-            
-            # 添加质量增强词汇
-            quality_enhancers = [
-                "high quality", "detailed", "professional", "realistic", 
-                "seamless", "natural", "well-integrated"
-            ]
-            
-            # 检查是否需要添加质量词汇
-            has_quality = any(enhancer in prompt.lower() for enhancer in quality_enhancers)
-            if not has_quality:
-                prompt = f"{prompt}, high quality and natural-looking result"
-            
-            return prompt
+            features = get_kontext_prompt_matcher().analyze(prompt).features
+            return prompt + self._best_practice_suffix(preserve_elements, features)
             
         except Exception as e:
             logger.error(f"最佳实践应用失败: {str(e)}")
             return prompt
     
-    def _generate_editing_tips(self, prompt: str) -> str:
+    def _generate_editing_tips(self, prompt: str, result: Optional[PromptFeatures] = None) -> str:
         """生成编辑建议"""
         try:
-            processor = FluxKontextProcessor()
-            edit_type = processor._detect_edit_type(prompt)
-            
-            tips_map = {
-                "style_transfer": """💡 风格转换建议:
-• 明确指定艺术风格名称
-• 描述关键视觉特征
-• 强调保持原始构图
-• 考虑分步骤转换复杂风格""",
-                
-                "background_replacement": """💡 背景替换建议:
-• 详细描述新背景
-• 强调保持主体位置不变
-• 注意光照一致性
-• 考虑透视和比例关系""",
-                
-                "object_modification": """💡 对象修改建议:
-• 使用具体的对象描述
-• 明确指定要改变的属性
-• 保持周围环境不变
-• 注意光照和阴影的连续性""",
-                
-                "text_editing": """💡 文本编辑建议:
-• 用引号包围要替换的文本
-• 指定保持字体样式
-• 注意文本的位置和大小
-• 确保颜色与背景协调""",
-                
-                "general_editing": """💡 通用编辑建议:
-• 使用明确和具体的描述
-• 避免模糊的术语
-• 分步骤处理复杂编辑
-• 明确指出需要保持的元素"""
-            }
-            
-            return tips_map.get(edit_type, tips_map["general_editing"])
+            edit_type = (result or get_kontext_prompt_matcher().analyze(prompt)).edit_type
+            return self.EDITING_TIPS.get(edit_type, self.EDITING_TIPS["general_editing"])
             
         except Exception as e:
             logger.error(f"生成编辑建议失败: {str(e)}")
             return "💡 使用明确和具体的描述词汇以获得最佳效果"
     
-    def _analyze_prompt(self, prompt: str) -> Dict[str, Any]:
+    def _analyze_prompt(self, prompt: str, result: Optional[PromptFeatures] = None) -> Dict[str, Any]:
         """分析提示词特征"""
         try:
-            processor = FluxKontextProcessor()
-            edit_type = processor._detect_edit_type(prompt)
+            processor = get_kontext_processor()
+            result = result or get_kontext_prompt_matcher().analyze(prompt)
+            edit_type = result.edit_type
+            word_count = len(prompt.split())
             
             analysis = {
                 "edit_type": edit_type,
                 "prompt_length": len(prompt),
-                "word_count": len(prompt.split()),
-                "has_preservation_clause": any(word in prompt.lower() for word in ["keep", "maintain", "preserve"]),
-                "has_quality_terms": any(word in prompt.lower() for word in ["high quality", "detailed", "professional"]),
-                "complexity_score": self._calculate_complexity(prompt),
+                "word_count": word_count,
+                "has_preservation_clause": "preservation" in result.features,
+                "has_quality_terms": "quality" in result.features,
+                "matched_keywords": list(result.keywords),
+                "complexity_score": self._calculate_complexity(prompt, word_count),
                 "suggested_guidance": processor._get_optimal_guidance(edit_type),
-                "readability": "good" if len(prompt.split()) < 50 else "complex"
+                "readability": "good" if word_count < 50 else "complex"
             }
             
             return analysis
@@ -927,11 +1751,11 @@ class FluxKontextPromptHelper:
             logger.error(f"提示词分析失败: {str(e)}")
             return {"error": str(e)}
     
-    def _calculate_complexity(self, prompt: str) -> str:
+    def _calculate_complexity(self, prompt: str, word_count: Optional[int] = None) -> str:
         """计算提示词复杂度"""
         try:
-            word_count = len(prompt.split())
-            comma_count = prompt.count(',')
+            if word_count is None:
+                word_count = len(prompt.split())
             
             if word_count < 10:
                 return "simple"
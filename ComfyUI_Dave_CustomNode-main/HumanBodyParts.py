@@ -18,10 +18,14 @@ Author: Davemane42
 import torch
 import numpy as np
 from typing import Dict, List, Tuple, Optional, Any, Union
+from collections import OrderedDict
+import json
 import logging
+import math
+import weakref
 
 # 导入中间件
-from .middleware import load_body_parts_config
+from .middleware import load_body_parts_config, get_body_parts_config_version
 
 # 配置日志系统
 logging.basicConfig(level=logging.INFO)
@@ -29,6 +33,73 @@ logger = logging.getLogger(__name__)
 
 # 全局配置函数已移至中间件模块
 
+
+class ClipEncodeCache:
+    """
+    CLIP文本编码LRU缓存
+    
+    以 (CLIP实例标识, 文本) 为键缓存编码结果，重复排队执行以及使用相同
+    提示词的部件都不会再次运行文本编码器。缓存只持有CLIP的弱引用，
+    不会阻止模型被卸载。
+    """
+    
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[Any, List]]" = OrderedDict()
+    
+    def encode(self, clip: Any, text: str) -> List[Tuple[torch.Tensor, Dict[str, Any]]]:
+        """
+        编码文本，命中缓存时直接返回之前的结果
+        
+        Args:
+            clip: ComfyUI CLIP对象
+            text: 提示词文本
+            
+        Returns:
+            ComfyUI conditioning列表
+        """
+        key = (id(clip), text)
+        entry = self._entries.get(key)
+        
+        # id可能在CLIP被释放后复用，用弱引用确认仍是同一个对象
+        if entry is not None and entry[0]() is clip:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        
+        self.misses += 1
+        tokens = clip.tokenize(text)
+        cond, pooled = clip.encode_from_tokens(tokens, return_pooled=True)
+        conditioning = [(cond, {"pooled_output": pooled})]
+        
+        try:
+            clip_ref = weakref.ref(clip)
+        except TypeError:
+            # 不支持弱引用的对象：只在本次调用内有效，不写入缓存
+            return conditioning
+        
+        self._entries[key] = (clip_ref, conditioning)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        
+        return conditioning
+    
+    def stats(self) -> Dict[str, int]:
+        """返回缓存统计信息"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+    
+    def clear(self) -> None:
+        """清空缓存与统计"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# 全局CLIP编码缓存（跨节点实例共享）
+_clip_encode_cache = ClipEncodeCache()
+
 class HumanBodyPartsConditioning:
     """
     人体部件条件控制节点
@@ -135,6 +206,12 @@ class HumanBodyPartsConditioning:
         }
     }
     
+    # 前端画布的部件ID到本节点部件ID的映射；前端其余的细分部件（face、chest、spine等）本节点不支持，加载时忽略
+    FRONTEND_PART_ALIASES = {
+        "left_arm": "left_upper_arm",
+        "right_arm": "right_upper_arm",
+    }
+    
     # 解剖学连接关系 - 基于医学标准
     ANATOMICAL_CONNECTIONS = [
         ("head", "neck"),
@@ -197,25 +274,101 @@ class HumanBodyPartsConditioning:
                     "tooltip": "图像高度"
                 }),
             },
-            "optional": {}
+            "optional": {
+                # 🩺 医疗预设：只输出重点部件并应用强度倍率
+                "medical_preset": (["none"] + list(cls.MEDICAL_PRESETS.keys()), {
+                    "default": "none",
+                    "tooltip": "医疗预设 - 只输出预设的重点部件，并应用其强度倍率"
+                }),
+                "focus_parts": ("STRING", {
+                    "default": "",
+                    "tooltip": "自定义重点部件（逗号分隔的部件ID，如 left_hand,right_hand），非空时覆盖预设的重点部件"
+                }),
+                "non_focus_mode": (["omit", "merge_background"], {
+                    "default": "omit",
+                    "tooltip": "非重点部件处理方式 - omit: 直接省略; merge_background: 合并为一个背景区域"
+                }),
+                # 🔄 自动化CLIP编码：为每个部件生成独立conditioning
+                "clip": ("CLIP", {
+                    "tooltip": "可选CLIP - 连接后按部件编码提示词，替代复制输入conditioning"
+                }),
+                "global_prompt": ("STRING", {
+                    "multiline": True,
+                    "default": "",
+                    "tooltip": "全局提示词 - 通过提示词模板展开为每个部件的提示词"
+                }),
+                "prompt_template": ("STRING", {
+                    "default": "{prompt}, {part}",
+                    "tooltip": "部件提示词模板 - {prompt}为全局提示词，{part}为部件英文名，{part_id}为部件ID"
+                }),
+                "part_prompts": ("STRING", {
+                    "multiline": True,
+                    "default": "",
+                    "tooltip": "部件专用提示词 - 每行一个，格式为 part_id: 提示词，优先于模板"
+                }),
+                # 🔍 分辨率自适应细节层级
+                "lod_min_cells": ("INT", {
+                    "default": 0, "min": 0, "max": 4096, "step": 1,
+                    "tooltip": "细节层级 - 小于该latent单元数(8x8像素)的部件并入其解剖学父部件，0表示关闭"
+                }),
+                # 🎬 视频批次关键帧布局
+                "keyframes": ("STRING", {
+                    "multiline": True,
+                    "default": "",
+                    "tooltip": "关键帧布局(JSON) - {\"帧序号\": {\"部件ID\": [x, y, w, h, strength, rotation]}}，部件在列出它的关键帧之间插值"
+                }),
+                "frame_count": ("INT", {
+                    "default": 0, "min": 0, "max": 4096, "step": 1,
+                    "tooltip": "批次帧数 - 关键帧逐帧插值的帧数，0表示使用最后一个关键帧+1"
+                }),
+            },
+            "hidden": {
+                # 前端按节点ID同步拖拽配置到中间件
+                "unique_id": "UNIQUE_ID",
+                # 用于判断遮罩/叠加预览输出是否被使用
+                "prompt": "PROMPT",
+            }
         }
         
         logger.info("🚀 彻底简化架构：核心输入 + properties数据传递 → 智能分配 → conditioning输出")
         return inputs
     
-    # 🎯 简化智能架构 - 一进一出
-    RETURN_TYPES = ("CONDITIONING",)
-    RETURN_NAMES = ("conditioning",)
+    # 🎯 简化智能架构 - conditioning输出 + 分配报告 + 部件遮罩/叠加预览
+    RETURN_TYPES = ("CONDITIONING", "STRING", "MASK", "IMAGE")
+    RETURN_NAMES = ("conditioning", "body_parts_info", "part_masks", "overlay")
     FUNCTION = "apply_intelligent_body_parts_conditioning"
     CATEGORY = "Dave/Human Body"
     DESCRIPTION = "🎯 智能人体部件条件控制 - 一个conditioning输入，智能分配到各身体部位，一个conditioning输出"
     
+    @classmethod
+    def IS_CHANGED(cls, unique_id: Optional[str] = None, **kwargs) -> int:
+        """
+        返回中间件中该节点配置的版本号
+        
+        前端拖拽配置不属于节点输入，版本号变化时ComfyUI才重新执行本节点；
+        只读取版本号，不加载也不解析配置。
+        """
+        node_id = str(unique_id) if unique_id is not None else 'default_node'
+        return get_body_parts_config_version(node_id)
+    
     def apply_intelligent_body_parts_conditioning(
         self,
         conditioning: List[Tuple[torch.Tensor, Dict[str, Any]]],
         resolution_x: int,
         resolution_y: int,
-    ) -> Tuple[List[Tuple[torch.Tensor, Dict[str, Any]]]]:
+        medical_preset: str = "none",
+        focus_parts: str = "",
+        non_focus_mode: str = "omit",
+        clip: Optional[Any] = None,
+        global_prompt: str = "",
+        prompt_template: str = "{prompt}, {part}",
+        part_prompts: str = "",
+        lod_min_cells: int = 0,
+        keyframes: str = "",
+        frame_count: int = 0,
+        unique_id: Optional[str] = None,
+        prompt: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Tuple[torch.Tensor, Dict[str, Any]]], str, torch.Tensor, torch.Tensor]:
         """
         🚀 彻底修复版：通过node properties读取实时拖拽数据
         
@@ -225,9 +378,22 @@ class HumanBodyPartsConditioning:
             conditioning: 输入的conditioning数据
             resolution_x: 图像宽度
             resolution_y: 图像高度
+            medical_preset: 医疗预设名称，"none"表示输出全部部件
+            focus_parts: 逗号分隔的重点部件ID，非空时覆盖预设的重点部件
+            non_focus_mode: 非重点部件处理方式（omit / merge_background）
+            clip: 可选CLIP，连接后为每个部件编码独立的提示词
+            global_prompt: 全局提示词，按模板展开到每个部件
+            prompt_template: 部件提示词模板
+            part_prompts: 部件专用提示词（每行 part_id: 提示词）
+            lod_min_cells: 细节层级阈值，小于该latent单元数的部件并入父部件
+            keyframes: 关键帧布局JSON，非空时为整个视频批次逐帧插值
+            frame_count: 批次帧数
+            unique_id: 节点ID（隐藏输入），用于读取前端同步的配置
+            prompt: 当前提示词（隐藏输入），用于跳过未连接的遮罩/叠加预览输出
             
         Returns:
-            经过智能分配的统一conditioning输出
+            经过智能分配的统一conditioning输出、分配报告、
+            [15, H, W] 部件遮罩以及彩色叠加预览（未连接的输出为占位张量）
         """
         try:
             logger.info(f"🚀 开始智能分配conditioning（中间件版）")
@@ -238,8 +404,8 @@ class HumanBodyPartsConditioning:
             import time
             logger.info(f"⏰ 执行时间戳: {time.time()}")
             
-            # 🚀 关键修复：通过中间件读取前端同步的数据
-            node_id = getattr(self, 'node_id', 'default_node')
+            # 🚀 关键修复：通过中间件读取前端同步的数据（有待写配置时会先强制落盘）
+            node_id = str(unique_id) if unique_id is not None else getattr(self, 'node_id', 'default_node')
             body_parts_config = load_body_parts_config(node_id)
             
             # 🚀 备用方案：尝试从多个位置读取配置
@@ -260,79 +426,670 @@ class HumanBodyPartsConditioning:
                 self._last_config = body_parts_config
                 logger.info("🎯 成功读取前端拖拽更新的配置")
                 logger.info(f"📊 配置内容: {body_parts_config}")
+                # 前端只保存拖拽过的部件：覆盖到默认配置上，保证输出全部部件
+                body_parts_config = self._merge_stored_config(body_parts_config, resolution_x, resolution_y)
             
-            # 🔄 步骤2: 智能分配 - 将输入conditioning分配到各个身体部位区域
-            result_conditioning = []
+            # 🩺 步骤1: 解析医疗预设/自定义重点部件
+            focus_set, strength_multiplier = self._resolve_focus_parts(medical_preset, focus_parts)
+            
+            # 🔄 步骤2: 解析每个部件的提示词（需要连接CLIP）
+            part_texts = {}
+            cache_hits_before, cache_misses_before = _clip_encode_cache.hits, _clip_encode_cache.misses
+            if clip is not None:
+                part_texts = self._resolve_part_prompts(global_prompt, prompt_template, part_prompts)
+            elif global_prompt.strip() or part_prompts.strip():
+                logger.warning("⚠️ 未连接CLIP，忽略部件提示词，使用输入conditioning")
+            
+            # 🎬 关键帧：为批次中的每一帧插值部件配置（无关键帧时只有一帧）
+            frame_configs = [body_parts_config]
+            if keyframes and keyframes.strip():
+                frame_configs = self._interpolate_keyframes(keyframes, body_parts_config, frame_count)
+            num_frames = len(frame_configs)
+            
+            frame_areas = [
+                {
+                    part_id: self._align_part_area(part_config, resolution_x, resolution_y)
+                    for part_id, part_config in frame_config.items()
+                }
+                for frame_config in frame_configs
+            ]
+            
+            # 🎭 部件遮罩与叠加预览（基于第一帧折叠前的原始部件区域，按布局缓存，只计算已连接的输出）
+            masks_used, overlay_used = self._mask_outputs_in_use(prompt, unique_id)
+            part_masks, overlay = self._get_part_masks(
+                frame_areas[0], resolution_x, resolution_y, masks_used, overlay_used
+            )
             
-            for part_id, part_config in body_parts_config.items():
-                part_info = self.BODY_PARTS[part_id]
+            # 🔄 步骤3: 按帧分组 - 区域完全相同的帧共享同一个conditioning条目
+            area_groups = OrderedDict()
+            folded_parts = {}
+            for frame_index, part_areas in enumerate(frame_areas):
+                # 🔍 细节层级：过小的部件并入解剖学父部件
+                frame_folded = {}
+                if lod_min_cells > 0:
+                    part_areas, frame_folded = self._apply_level_of_detail(part_areas, lod_min_cells)
+                    for parent_id, children in frame_folded.items():
+                        folded_parts.setdefault(parent_id, [])
+                        folded_parts[parent_id].extend(c for c in children if c not in folded_parts[parent_id])
                 
-                # 获取部件区域参数
-                x, y, width, height, strength, rotation = part_config
+                background_areas = []
+                for part_id, part_area in part_areas.items():
+                    absorbed_parts = tuple(frame_folded.get(part_id, []))
+                    
+                    # 非重点部件：省略或留待合并为背景区域（并入的子部件为重点时保留）
+                    if focus_set is not None and part_id not in focus_set and not focus_set.intersection(absorbed_parts):
+                        if non_focus_mode == "merge_background":
+                            background_areas.append(part_area)
+                        continue
+                    
+                    area_groups.setdefault((part_id, part_area, absorbed_parts), []).append(frame_index)
                 
-                # 确保参数在有效范围内
-                x = max(0, min(resolution_x - width, int(x)))
-                y = max(0, min(resolution_y - height, int(y)))
-                width = max(32, min(resolution_x - x, int(width)))
-                height = max(32, min(resolution_y - y, int(height)))
-                strength = max(0.0, min(10.0, float(strength)))
-                rotation = float(rotation) % 360
+                # 🧩 非重点部件合并为一个背景区域（外接矩形，强度取平均）
+                if background_areas:
+                    bg_x = min(area[0] for area in background_areas)
+                    bg_y = min(area[1] for area in background_areas)
+                    bg_width = max(area[0] + area[2] for area in background_areas) - bg_x
+                    bg_height = max(area[1] + area[3] for area in background_areas) - bg_y
+                    bg_strength = sum(area[4] for area in background_areas) / len(background_areas)
+                    bg_area = (bg_x, bg_y, bg_width, bg_height, bg_strength, 0.0)
+                    area_groups.setdefault(("background", bg_area, ()), []).append(frame_index)
+            
+            # 🔄 步骤4: 智能分配 - 将输入conditioning分配到各个身体部位区域
+            result_conditioning = []
+            
+            for (part_id, part_area, absorbed_parts), frames in area_groups.items():
+                aligned_x, aligned_y, aligned_width, aligned_height, strength, rotation = part_area
                 
-                                    # 🎯 为该部件应用区域conditioning - 使用正确的ComfyUI格式
-                for cond_tensor, cond_dict in conditioning:
-                    # 创建该部件的专用条件字典
-                    new_cond_dict = cond_dict.copy()
-                    
-                    # 🔧 正确的8像素对齐计算
-                    aligned_x = (x // 8) * 8
-                    aligned_y = (y // 8) * 8
-                    aligned_width = ((width + 7) // 8) * 8
-                    aligned_height = ((height + 7) // 8) * 8
+                if part_id == "background":
+                    part_name, part_category = "背景", "background"
+                    part_conditioning = conditioning
+                else:
+                    part_info = self.BODY_PARTS[part_id]
+                    part_name, part_category = part_info['name'], part_info['category']
+                    if focus_set is not None:
+                        strength = max(0.0, min(10.0, strength * strength_multiplier))
                     
-                    # 🔧 ComfyUI正确的area格式：(height_units, width_units, y_units, x_units)
-                    # 每个单位是8像素
-                    area_definition = (
-                        aligned_height // 8,  # height in 8-pixel units
-                        aligned_width // 8,   # width in 8-pixel units  
-                        aligned_y // 8,       # y position in 8-pixel units
-                        aligned_x // 8        # x position in 8-pixel units
+                    # 有部件提示词时使用其（缓存的）CLIP编码，否则复制输入conditioning
+                    part_conditioning = conditioning
+                    if part_id in part_texts:
+                        part_conditioning = _clip_encode_cache.encode(clip, part_texts[part_id])
+                
+                # 只覆盖部分帧时，用 [F, 1, 1] 帧遮罩把条目限制在这些批次索引上
+                frame_gate = None
+                if len(frames) < num_frames:
+                    frame_gate = torch.zeros((num_frames, 1, 1), dtype=torch.float32)
+                    frame_gate[frames] = 1.0
+                
+                # 🎯 为该部件应用区域conditioning - 使用正确的ComfyUI格式
+                for cond_tensor, cond_dict in part_conditioning:
+                    new_cond_dict = self._build_area_cond_dict(
+                        cond_dict, aligned_x, aligned_y, aligned_width, aligned_height, strength, rotation
                     )
                     
-                    # 🔧 设置正确的area属性
-                    new_cond_dict['area'] = area_definition
-                    
-                    # 🔧 添加ComfyUI必需的sigma范围
-                    new_cond_dict['strength'] = strength
-                    new_cond_dict['min_sigma'] = 0.0
-                    new_cond_dict['max_sigma'] = 99.0
-                    
-                    # 添加旋转信息（用于前端可视化）
-                    if rotation != 0:
-                        new_cond_dict['rotation'] = rotation
-                        new_cond_dict['rotation_center'] = (
-                            aligned_x + aligned_width // 2,
-                            aligned_y + aligned_height // 2
-                        )
-                    
                     # 添加部件标识
                     new_cond_dict['body_part'] = part_id
-                    new_cond_dict['body_part_name'] = part_info['name']
-                    new_cond_dict['body_part_category'] = part_info['category']
+                    new_cond_dict['body_part_name'] = part_name
+                    new_cond_dict['body_part_category'] = part_category
+                    if absorbed_parts:
+                        new_cond_dict['folded_parts'] = list(absorbed_parts)
+                    if frame_gate is not None:
+                        new_cond_dict['mask'] = frame_gate
+                        new_cond_dict['mask_strength'] = 1.0
+                        new_cond_dict['batch_index'] = list(frames)
+                        new_cond_dict['frame_range'] = (frames[0], frames[-1])
                     
                     result_conditioning.append((cond_tensor, new_cond_dict))
                 
-                logger.info(f"✅ 分配 {part_info['name']} - 区域: ({aligned_x}, {aligned_y}, {aligned_width}, {aligned_height})")
+                logger.debug(f"✅ 分配 {part_name} - 区域: ({aligned_x}, {aligned_y}, {aligned_width}, {aligned_height}), 帧数: {len(frames)}")
+            
+            # 📊 步骤5: 生成分配报告（每步采样的区域评估次数）
+            body_parts_info = self._build_distribution_report(
+                medical_preset, focus_set, strength_multiplier, non_focus_mode,
+                total_areas=sum(len(frame_config) for frame_config in frame_configs),
+                emitted_areas=len(area_groups),
+                num_conditioning=len(conditioning),
+                emitted_entries=len(result_conditioning),
+            )
+            if num_frames > 1:
+                body_parts_info += f"\n关键帧批次: {num_frames} 帧, 相同区域的帧共享条目 ({len(area_groups)} 个区域组)"
+            if folded_parts:
+                body_parts_info += "\nLOD折叠 (<{} 单元): {}".format(
+                    lod_min_cells,
+                    ", ".join(f"{'+'.join(children)}→{parent}" for parent, children in folded_parts.items())
+                )
+            if clip is not None:
+                cache_stats = _clip_encode_cache.stats()
+                body_parts_info += (
+                    f"\nCLIP编码缓存: 本次命中 {cache_stats['hits'] - cache_hits_before}"
+                    f" / 未命中 {cache_stats['misses'] - cache_misses_before}"
+                    f" (累计命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']}, 缓存 {cache_stats['size']} 条)"
+                )
             
-            # 🎯 步骤3: 返回统一的conditioning输出
+            # 🎯 步骤6: 返回统一的conditioning输出
             logger.info(f"🎯 智能分配完成: 生成{len(result_conditioning)}个区域conditioning")
             logger.info(f"📤 输出: 统一的conditioning数据")
             
-            return (result_conditioning,)
+            return (result_conditioning, body_parts_info, part_masks, overlay)
             
         except Exception as e:
             logger.error(f"🚨 智能分配错误: {e}")
-            # 发生错误时返回原始conditioning
-            return (conditioning,)
+            # 发生错误时返回原始conditioning和空遮罩
+            empty_masks = torch.zeros((len(self.BODY_PARTS), resolution_y, resolution_x), dtype=torch.float32)
+            empty_overlay = torch.zeros((1, resolution_y, resolution_x, 3), dtype=torch.float32)
+            return (conditioning, f"智能分配错误: {e}", empty_masks, empty_overlay)
+    
+    def _align_part_area(
+        self, part_config: List[float], resolution_x: int, resolution_y: int
+    ) -> Tuple[int, int, int, int, float, float]:
+        """
+        将部件配置限制在画布内并进行8像素对齐
+        
+        Args:
+            part_config: 部件配置 [x, y, width, height, strength, rotation]
+            resolution_x: 图像宽度
+            resolution_y: 图像高度
+            
+        Returns:
+            (aligned_x, aligned_y, aligned_width, aligned_height, strength, rotation)
+        """
+        x, y, width, height, strength, rotation = part_config
+        
+        # 确保参数在有效范围内
+        x = max(0, min(resolution_x - width, int(x)))
+        y = max(0, min(resolution_y - height, int(y)))
+        width = max(32, min(resolution_x - x, int(width)))
+        height = max(32, min(resolution_y - y, int(height)))
+        strength = max(0.0, min(10.0, float(strength)))
+        rotation = float(rotation) % 360
+        # 关键帧插值得到的是浮点值，限制后转回整数像素，保证area为整数
+        x, y, width, height = int(x), int(y), int(width), int(height)
+        
+        # 🔧 正确的8像素对齐计算
+        aligned_x = (x // 8) * 8
+        aligned_y = (y // 8) * 8
+        aligned_width = ((width + 7) // 8) * 8
+        aligned_height = ((height + 7) // 8) * 8
+        
+        return aligned_x, aligned_y, aligned_width, aligned_height, strength, rotation
+    
+    def _interpolate_keyframes(
+        self,
+        keyframes: str,
+        base_config: Dict[str, List[float]],
+        frame_count: int,
+    ) -> List[Dict[str, List[float]]]:
+        """
+        对关键帧部件配置进行逐帧线性插值（每个部件一次向量化计算所有帧）
+        
+        Args:
+            keyframes: JSON字符串，帧序号 → {部件ID: [x, y, w, h, strength, rotation]}
+            base_config: 当前部件配置，没有任何关键帧的部件保持该配置；只出现在关键帧中的部件也会输出
+            frame_count: 帧数，0表示最后一个关键帧+1
+            
+        Returns:
+            每一帧的部件配置列表
+        """
+        raw_keyframes = json.loads(keyframes)
+        if not isinstance(raw_keyframes, dict) or not raw_keyframes:
+            raise ValueError("关键帧必须是非空的 {帧序号: 部件配置} 对象")
+        
+        frames_by_index = {int(frame): parts for frame, parts in raw_keyframes.items()}
+        num_frames = frame_count if frame_count > 0 else max(frames_by_index) + 1
+        times = torch.arange(num_frames, dtype=torch.float64)
+        
+        # 部件取 BODY_PARTS 中出现在当前配置或任一关键帧里的部件，未知部件ID忽略
+        keyed_part_ids = {part_id for parts in frames_by_index.values() for part_id in parts}
+        unknown_part_ids = keyed_part_ids.difference(self.BODY_PARTS)
+        if unknown_part_ids:
+            logger.warning(f"⚠️ 忽略关键帧中的未知部件ID: {sorted(unknown_part_ids)}")
+        part_ids = [
+            part_id for part_id in self.BODY_PARTS
+            if part_id in base_config or part_id in keyed_part_ids
+        ]
+        part_tracks = []
+        for part_id in part_ids:
+            # 每个部件只在列出它的关键帧之间插值，没有关键帧时保持当前配置
+            key_frames = sorted(frame for frame, parts in frames_by_index.items() if part_id in parts)
+            if not key_frames:
+                part_tracks.append(
+                    torch.tensor(base_config[part_id], dtype=torch.float64).expand(num_frames, 6)
+                )
+                continue
+            
+            key_times = torch.tensor(key_frames, dtype=torch.float64)
+            key_values = torch.tensor(
+                [[float(v) for v in frames_by_index[frame][part_id]] for frame in key_frames],
+                dtype=torch.float64,
+            )
+            
+            # 找到每帧所在的关键帧区间，区间外保持首/尾关键帧
+            last = len(key_frames) - 1
+            start = (torch.searchsorted(key_times, times, right=True) - 1).clamp(0, last)
+            end = (start + 1).clamp(max=last)
+            span = key_times[end] - key_times[start]
+            weight = torch.where(span > 0, (times - key_times[start]) / span.clamp(min=1), torch.zeros_like(times))
+            weight = weight.clamp(0.0, 1.0).unsqueeze(-1)
+            
+            part_tracks.append(key_values[start] + weight * (key_values[end] - key_values[start]))
+        
+        # [F, P, 6]
+        values = torch.stack(part_tracks, dim=1).clone()
+        
+        # 强度/角度取整，使对齐后区域相同的帧能够共享条目
+        values[..., 4] = torch.round(values[..., 4] * 100) / 100
+        values[..., 5] = torch.round(values[..., 5] * 10) / 10
+        
+        logger.info(f"🎬 关键帧插值完成: {len(frames_by_index)} 个关键帧 → {num_frames} 帧")
+        return [dict(zip(part_ids, frame_values)) for frame_values in values.tolist()]
+    
+    @staticmethod
+    def _mask_outputs_in_use(prompt: Optional[Dict[str, Any]], unique_id: Optional[str]) -> Tuple[bool, bool]:
+        """
+        判断 part_masks / overlay 输出是否连接到其他节点
+        
+        没有提示词信息（例如直接调用节点方法）时视为都已连接。
+        
+        Returns:
+            (part_masks是否被使用, overlay是否被使用)
+        """
+        if not isinstance(prompt, dict) or unique_id is None:
+            return True, True
+        
+        node_id = str(unique_id)
+        used_outputs = set()
+        for node in prompt.values():
+            if not isinstance(node, dict):
+                continue
+            for value in (node.get("inputs") or {}).values():
+                # 链接输入的格式为 [源节点ID, 输出序号]
+                if isinstance(value, list) and len(value) == 2 and str(value[0]) == node_id:
+                    used_outputs.add(value[1])
+        return 2 in used_outputs, 3 in used_outputs
+    
+    def _get_part_masks(
+        self,
+        part_areas: Dict[str, Tuple[int, int, int, int, float, float]],
+        resolution_x: int,
+        resolution_y: int,
+        masks_used: bool = True,
+        overlay_used: bool = True,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        获取部件遮罩和叠加预览，布局未变化时直接返回缓存结果
+        
+        未连接的输出不做栅格化，返回 [15, 1, 1] / [1, 1, 1, 3] 占位张量。
+        
+        Args:
+            part_areas: 部件ID到对齐区域的映射
+            resolution_x: 图像宽度
+            resolution_y: 图像高度
+            masks_used: 是否需要部件遮罩
+            overlay_used: 是否需要叠加预览
+            
+        Returns:
+            ([15, H, W] 部件遮罩, [1, H, W, 3] 叠加预览)
+        """
+        part_masks = torch.zeros((len(self.BODY_PARTS), 1, 1), dtype=torch.float32)
+        overlay = torch.zeros((1, 1, 1, 3), dtype=torch.float32)
+        if not (masks_used or overlay_used):
+            logger.info("🎭 遮罩/叠加预览输出未连接，跳过栅格化")
+            return part_masks, overlay
+        
+        layout_key = (
+            resolution_x, resolution_y,
+            tuple(part_areas.get(part_id) for part_id in self.BODY_PARTS),
+        )
+        cached = getattr(self, '_mask_cache', None)
+        if cached is not None and cached["layout"] == layout_key:
+            logger.info("🎭 部件遮罩命中缓存")
+        else:
+            cached = {
+                "layout": layout_key,
+                "crops": self._rasterize_part_masks(part_areas, resolution_x, resolution_y),
+                "masks": None,
+                "overlay": None,
+            }
+            self._mask_cache = cached
+        
+        if masks_used:
+            if cached["masks"] is None:
+                cached["masks"] = self._assemble_part_masks(cached["crops"], resolution_x, resolution_y)
+            part_masks = cached["masks"]
+        if overlay_used:
+            if cached["overlay"] is None:
+                cached["overlay"] = self._render_overlay(cached["crops"], resolution_x, resolution_y)
+            overlay = cached["overlay"]
+        return part_masks, overlay
+    
+    def _rasterize_part_masks(
+        self,
+        part_areas: Dict[str, Tuple[int, int, int, int, float, float]],
+        resolution_x: int,
+        resolution_y: int,
+    ) -> List[Tuple[int, int, int, torch.Tensor]]:
+        """
+        逐部件在其旋转矩形的外接框内计算遮罩
+        
+        每个像素中心绕 rotation_center 反向旋转后与部件半宽/半高比较，
+        与前端 GeometryUtils.pointInRect 的判定一致。中间张量只有外接框大小，
+        不随画布分辨率 × 部件数增长。
+        
+        Returns:
+            [(部件序号, 外接框y, 外接框x, [h, w] bool遮罩)]，按 BODY_PARTS 顺序，缺失或在画布外的部件省略
+        """
+        crops = []
+        for index, part_id in enumerate(self.BODY_PARTS):
+            area = part_areas.get(part_id)
+            if area is None:
+                continue
+            x, y, width, height, _, rotation = area
+            # 与 _build_area_cond_dict 中的 rotation_center 保持一致
+            center_x, center_y, half_w, half_h, angle = torch.tensor([
+                x + width // 2, y + height // 2, width / 2, height / 2, rotation
+            ], dtype=torch.float32)
+            theta = torch.deg2rad(angle)
+            cos_t, sin_t = torch.cos(theta), torch.sin(theta)
+            
+            # 旋转矩形的外接框（多留1像素，判定仍由下面的逐像素比较决定）
+            extent_x = abs(float(half_w * cos_t)) + abs(float(half_h * sin_t))
+            extent_y = abs(float(half_w * sin_t)) + abs(float(half_h * cos_t))
+            x0 = max(0, math.floor(float(center_x) - extent_x) - 1)
+            x1 = min(resolution_x, math.ceil(float(center_x) + extent_x) + 1)
+            y0 = max(0, math.floor(float(center_y) - extent_y) - 1)
+            y1 = min(resolution_y, math.ceil(float(center_y) + extent_y) + 1)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            
+            dx = torch.arange(x0, x1, dtype=torch.float32).view(1, -1) + 0.5 - center_x
+            dy = torch.arange(y0, y1, dtype=torch.float32).view(-1, 1) + 0.5 - center_y
+            local_x = dx * cos_t + dy * sin_t
+            local_y = dy * cos_t - dx * sin_t
+            
+            inside = (local_x.abs() <= half_w) & (local_y.abs() <= half_h)
+            crops.append((index, y0, x0, inside))
+        return crops
+    
+    def _assemble_part_masks(
+        self, crops: List[Tuple[int, int, int, torch.Tensor]], resolution_x: int, resolution_y: int
+    ) -> torch.Tensor:
+        """
+        将部件外接框遮罩写入完整画布
+        
+        Returns:
+            [15, H, W] float32遮罩，按 BODY_PARTS 顺序排列，缺失部件为全零
+        """
+        part_masks = torch.zeros((len(self.BODY_PARTS), resolution_y, resolution_x), dtype=torch.float32)
+        for index, y0, x0, inside in crops:
+            part_masks[index, y0:y0 + inside.shape[0], x0:x0 + inside.shape[1]] = inside
+        return part_masks
+    
+    def _render_overlay(
+        self,
+        crops: List[Tuple[int, int, int, torch.Tensor]],
+        resolution_x: int,
+        resolution_y: int,
+        alpha: float = 0.6,
+    ) -> torch.Tensor:
+        """
+        使用 BODY_PARTS 颜色渲染部件叠加预览（后绘制的部件覆盖先绘制的）
+        
+        Args:
+            crops: _rasterize_part_masks 返回的部件外接框遮罩
+            resolution_x: 图像宽度
+            resolution_y: 图像高度
+            alpha: 部件颜色不透明度
+            
+        Returns:
+            [1, H, W, 3] IMAGE张量
+        """
+        palette = torch.tensor(
+            [[0.0, 0.0, 0.0]] + [
+                [int(info["color"][i:i + 2], 16) / 255.0 for i in (1, 3, 5)]
+                for info in self.BODY_PARTS.values()
+            ],
+            dtype=torch.float32,
+        )
+        background = torch.tensor([0.1, 0.1, 0.1], dtype=torch.float32)
+        
+        # 每个像素取最上层部件的索引（0表示背景）
+        top_index = torch.zeros((resolution_y, resolution_x), dtype=torch.long)
+        for index, y0, x0, inside in crops:
+            top_index[y0:y0 + inside.shape[0], x0:x0 + inside.shape[1]][inside] = index + 1
+        
+        covered = (top_index > 0).unsqueeze(-1).to(torch.float32)
+        overlay = background + covered * alpha * (palette[top_index] - background)
+        return overlay.unsqueeze(0)
+    
+    def _apply_level_of_detail(
+        self,
+        part_areas: Dict[str, Tuple[int, int, int, int, float, float]],
+        min_cells: int,
+    ) -> Tuple[Dict[str, Tuple[int, int, int, int, float, float]], Dict[str, List[str]]]:
+        """
+        将小于阈值的部件并入其解剖学父部件（如手并入小臂、脚并入小腿）
+        
+        按解剖学层级从末端向躯干处理，父部件区域扩展为包含子部件的外接矩形；
+        若父部件本身也过小，会连同子部件一起继续向上并入。
+        
+        Args:
+            part_areas: 部件ID到对齐区域的映射
+            min_cells: 最小latent单元数（8x8像素为一个单元）
+            
+        Returns:
+            (折叠后的部件区域, 父部件ID到并入子部件ID列表的映射)
+        """
+        parents = {child: parent for parent, child in self.ANATOMICAL_CONNECTIONS}
+        
+        def depth(part_id: str) -> int:
+            level = 0
+            while part_id in parents:
+                part_id = parents[part_id]
+                level += 1
+            return level
+        
+        areas = dict(part_areas)
+        folded = {}
+        
+        for part_id in sorted(part_areas, key=depth, reverse=True):
+            x, y, width, height, strength, rotation = part_areas[part_id]
+            parent_id = parents.get(part_id)
+            if parent_id not in areas or (width // 8) * (height // 8) >= min_cells:
+                continue
+            
+            # 以当前（可能已吸收子部件的）区域并入父部件
+            cx, cy, cw, ch = areas.pop(part_id)[:4]
+            px, py, pw, ph, p_strength, p_rotation = areas[parent_id]
+            x0, y0 = min(px, cx), min(py, cy)
+            x1, y1 = max(px + pw, cx + cw), max(py + ph, cy + ch)
+            areas[parent_id] = (x0, y0, x1 - x0, y1 - y0, p_strength, p_rotation)
+            
+            folded.setdefault(parent_id, []).append(part_id)
+            folded[parent_id].extend(folded.pop(part_id, []))
+            logger.info(f"🔍 LOD: {part_id} 小于 {min_cells} 单元，并入 {parent_id}")
+        
+        return areas, folded
+    
+    def _build_area_cond_dict(
+        self,
+        cond_dict: Dict[str, Any],
+        aligned_x: int,
+        aligned_y: int,
+        aligned_width: int,
+        aligned_height: int,
+        strength: float,
+        rotation: float,
+    ) -> Dict[str, Any]:
+        """
+        基于输入条件字典创建带区域信息的新条件字典
+        
+        Args:
+            cond_dict: 原始条件字典
+            aligned_x, aligned_y, aligned_width, aligned_height: 8像素对齐后的区域
+            strength: 条件强度
+            rotation: 旋转角度
+            
+        Returns:
+            新的条件字典
+        """
+        new_cond_dict = cond_dict.copy()
+        
+        # 🔧 ComfyUI正确的area格式：(height_units, width_units, y_units, x_units)
+        # 每个单位是8像素
+        new_cond_dict['area'] = (
+            aligned_height // 8,  # height in 8-pixel units
+            aligned_width // 8,   # width in 8-pixel units  
+            aligned_y // 8,       # y position in 8-pixel units
+            aligned_x // 8        # x position in 8-pixel units
+        )
+        
+        # 🔧 添加ComfyUI必需的sigma范围
+        new_cond_dict['strength'] = strength
+        new_cond_dict['min_sigma'] = 0.0
+        new_cond_dict['max_sigma'] = 99.0
+        
+        # 添加旋转信息（用于前端可视化）
+        if rotation != 0:
+            new_cond_dict['rotation'] = rotation
+            new_cond_dict['rotation_center'] = (
+                aligned_x + aligned_width // 2,
+                aligned_y + aligned_height // 2
+            )
+        
+        return new_cond_dict
+    
+    def _resolve_focus_parts(self, medical_preset: str, focus_parts: str) -> Tuple[Optional[set], float]:
+        """
+        解析重点部件集合与强度倍率
+        
+        Args:
+            medical_preset: 医疗预设名称
+            focus_parts: 逗号分隔的自定义重点部件ID
+            
+        Returns:
+            (重点部件集合或None表示全部输出, 强度倍率)
+        """
+        preset = self.MEDICAL_PRESETS.get(medical_preset)
+        focus_set = set(preset["focus_areas"]) if preset else None
+        strength_multiplier = preset["strength_multiplier"] if preset else 1.0
+        
+        custom_parts = [part.strip() for part in (focus_parts or "").split(",") if part.strip()]
+        if custom_parts:
+            unknown_parts = [part for part in custom_parts if part not in self.BODY_PARTS]
+            if unknown_parts:
+                logger.warning(f"⚠️ 忽略未知部件ID: {unknown_parts}")
+            focus_set = {part for part in custom_parts if part in self.BODY_PARTS}
+        
+        if focus_set is not None:
+            logger.info(f"🩺 重点部件: {sorted(focus_set)}, 强度倍率: {strength_multiplier}")
+        
+        return focus_set, strength_multiplier
+    
+    def _resolve_part_prompts(self, global_prompt: str, prompt_template: str, part_prompts: str) -> Dict[str, str]:
+        """
+        解析每个部件的提示词文本
+        
+        部件专用提示词优先；否则在全局提示词非空时按模板展开。
+        
+        Args:
+            global_prompt: 全局提示词
+            prompt_template: 部件提示词模板（{prompt} / {part} / {part_id}）
+            part_prompts: 每行一个的 "part_id: 提示词"
+            
+        Returns:
+            部件ID到提示词文本的映射
+        """
+        part_texts = {}
+        
+        global_prompt = (global_prompt or "").strip()
+        if global_prompt:
+            template = prompt_template or "{prompt}"
+            for part_id in self.BODY_PARTS:
+                try:
+                    part_texts[part_id] = template.format(
+                        prompt=global_prompt, part=part_id.replace("_", " "), part_id=part_id
+                    )
+                except (KeyError, IndexError, ValueError) as e:
+                    logger.warning(f"⚠️ 提示词模板无效，使用全局提示词: {e}")
+                    part_texts[part_id] = global_prompt
+        
+        for line in (part_prompts or "").splitlines():
+            line = line.replace("：", ":", 1)  # 兼容中文冒号
+            if ":" not in line:
+                continue
+            part_id, text = line.split(":", 1)
+            part_id, text = part_id.strip(), text.strip()
+            if part_id not in self.BODY_PARTS:
+                logger.warning(f"⚠️ 忽略未知部件ID的提示词: {part_id}")
+                continue
+            if text:
+                part_texts[part_id] = text
+        
+        return part_texts
+    
+    def _build_distribution_report(
+        self,
+        medical_preset: str,
+        focus_set: Optional[set],
+        strength_multiplier: float,
+        non_focus_mode: str,
+        total_areas: int,
+        emitted_areas: int,
+        num_conditioning: int,
+        emitted_entries: int,
+    ) -> str:
+        """
+        生成分配报告，说明每步采样需要评估的区域数量变化
+        
+        Returns:
+            报告字符串
+        """
+        reduction = (1 - emitted_areas / total_areas) * 100 if total_areas else 0.0
+        
+        report_lines = ["=== 人体部件分配报告 ==="]
+        if focus_set is None:
+            report_lines.append("重点部件: 全部")
+        else:
+            report_lines.append(f"预设: {medical_preset} (强度倍率 x{strength_multiplier})")
+            report_lines.append(f"重点部件: {', '.join(sorted(focus_set)) or '无'}")
+            report_lines.append(f"非重点部件: {non_focus_mode}")
+        report_lines.append(f"每步区域评估: {total_areas} → {emitted_areas} (减少 {reduction:.1f}%)")
+        report_lines.append(
+            f"conditioning条目: {total_areas * num_conditioning} → {emitted_entries}"
+        )
+        
+        return "\n".join(report_lines)
+    
+    def _merge_stored_config(
+        self, stored_config: Dict[str, Any], resolution_x: int, resolution_y: int
+    ) -> Dict[str, List[float]]:
+        """
+        将前端保存的（部分）配置覆盖到默认配置上
+        
+        前端部件ID按 FRONTEND_PART_ALIASES 映射，同时存在时以本节点部件ID为准；
+        未知部件ID与格式无效的部件配置被忽略。
+        
+        Args:
+            stored_config: 中间件中保存的配置，部件ID → [x, y, width, height, strength, rotation]
+            resolution_x: 图像宽度
+            resolution_y: 图像高度
+            
+        Returns:
+            包含全部部件的配置字典
+        """
+        config = self._get_default_config(resolution_x, resolution_y)
+        ignored_parts = []
+        for part_id, values in stored_config.items():
+            target_id = self.FRONTEND_PART_ALIASES.get(part_id, part_id)
+            if target_id not in self.BODY_PARTS or not isinstance(values, (list, tuple)) or len(values) != 6:
+                ignored_parts.append(part_id)
+                continue
+            if target_id != part_id and target_id in stored_config:
+                continue
+            config[target_id] = list(values)
+        
+        if ignored_parts:
+            logger.info(f"⏭️ 忽略本节点不支持的部件配置: {ignored_parts}")
+        return config
     
     def _get_default_config(self, resolution_x: int, resolution_y: int) -> Dict[str, List[float]]:
         """
@@ -409,8 +1166,18 @@ class HumanBodyPartsDebug:
                     debug_lines.append(f"  人体部件: {cond_dict.get('body_part_name', 'Unknown')} ({cond_dict['body_part']})")
                 
                 if 'area' in cond_dict:
-                    for j, area in enumerate(cond_dict['area']):
-                        debug_lines.append(f"  区域 #{j + 1}: x={area[0]}, y={area[1]}, w={area[2]-area[0]}, h={area[3]-area[1]}")
+                    area = cond_dict['area']
+                    if area[0] == "percentage":
+                        # 百分比格式: ("percentage", height, width, y, x)
+                        _, h, w, y, x = area
+                        debug_lines.append(f"  区域(百分比): x={x:.2f}, y={y:.2f}, w={w:.2f}, h={h:.2f}")
+                    else:
+                        # ComfyUI格式: (height, width, y, x)，单位为8像素
+                        h, w, y, x = area
+                        debug_lines.append(f"  区域: x={x * 8}, y={y * 8}, w={w * 8}, h={h * 8}")
+                
+                if 'folded_parts' in cond_dict:
+                    debug_lines.append(f"  并入部件: {', '.join(cond_dict['folded_parts'])}")
                 
                 if 'strength' in cond_dict:
                     debug_lines.append(f"  强度: {cond_dict['strength']:.3f}")
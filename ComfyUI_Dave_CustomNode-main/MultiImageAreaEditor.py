@@ -7,6 +7,9 @@ import numpy as np
 import traceback
 from typing import List, Tuple, Dict, Any, Optional
 import json
+import time
+
+from .stage_timing import StageTimer
 
 # 导入ComfyUI核心模块
 try:
@@ -120,12 +123,10 @@ class MultiImageAreaEditor:
             combined_mask: 组合遮罩
             stitch_preview: 拼接预览
         """
-        from datetime import datetime
-        
         try:
             # 日志记录开始
-            start_time = datetime.now()
-            edit_log = f"🎨 Kontext编辑开始 - {start_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            timer = StageTimer("multi_image_area_editor")
+            edit_log = f"🎨 Kontext编辑开始 - {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
             edit_log += f"📝 编辑模式: {editing_mode}\n"
             edit_log += f"📐 输出比例: {aspect_ratio}\n"
             edit_log += f"🎯 提示词: {kontext_prompt[:100]}...\n"
@@ -136,76 +137,82 @@ class MultiImageAreaEditor:
             edit_log += f"🖼️ 基础图像尺寸: {width}x{height}\n"
             
             # 收集源图像
-            source_images = []
-            active_sources = []
-            
-            for i, source_img in enumerate([source_image_1, source_image_2, source_image_3, source_image_4]):
-                if source_img is not None:
-                    source_images.append(source_img)
-                    active_sources.append(i + 1)
-                    edit_log += f"✅ 源图像{i+1}: 已加载\n"
+            with timer.stage("preprocess"):
+                source_images = []
+                active_sources = []
+                
+                for i, source_img in enumerate([source_image_1, source_image_2, source_image_3, source_image_4]):
+                    if source_img is not None:
+                        source_images.append(source_img)
+                        active_sources.append(i + 1)
+                        edit_log += f"✅ 源图像{i+1}: 已加载\n"
             
             # 处理文本提示词
-            image_prompts = [image_1_prompt, image_2_prompt, image_3_prompt, image_4_prompt]
-            active_prompts = []
-            for i, prompt in enumerate(image_prompts):
-                if prompt and prompt.strip():
-                    active_prompts.append(prompt)
-                    edit_log += f"📝 图像{i+1}提示词: {prompt[:50]}...\n"
+            with timer.stage("prompt"):
+                image_prompts = [image_1_prompt, image_2_prompt, image_3_prompt, image_4_prompt]
+                active_prompts = []
+                for i, prompt in enumerate(image_prompts):
+                    if prompt and prompt.strip():
+                        active_prompts.append(prompt)
+                        edit_log += f"📝 图像{i+1}提示词: {prompt[:50]}...\n"
             
             # 根据编辑模式处理
-            if editing_mode == "local_edit":
-                # 局部编辑模式 - 精确区域控制
-                result_image = self._process_local_edit(
-                    base_tensor, source_images, active_prompts, kontext_prompt, 
-                    guidance_scale, context_strength
-                )
-                edit_log += "🎯 局部编辑模式: 精确区域控制完成\n"
+            with timer.stage("inference"):
+                if editing_mode == "local_edit":
+                    # 局部编辑模式 - 精确区域控制
+                    result_image = self._process_local_edit(
+                        base_tensor, source_images, active_prompts, kontext_prompt, 
+                        guidance_scale, context_strength
+                    )
+                    edit_log += "🎯 局部编辑模式: 精确区域控制完成\n"
                 
-            elif editing_mode == "style_transfer":
-                # 风格转换模式
-                result_image = self._process_style_transfer(
-                    base_tensor, reference_style, kontext_prompt, 
-                    preserve_character, context_strength
-                )
-                edit_log += "🎨 风格转换模式: 保持内容结构完成\n"
+                elif editing_mode == "style_transfer":
+                    # 风格转换模式
+                    result_image = self._process_style_transfer(
+                        base_tensor, reference_style, kontext_prompt, 
+                        preserve_character, context_strength
+                    )
+                    edit_log += "🎨 风格转换模式: 保持内容结构完成\n"
                 
-            elif editing_mode == "character_consistency":
-                # 角色一致性模式
-                result_image = self._process_character_consistency(
-                    base_tensor, source_images, kontext_prompt, 
-                    context_strength
-                )
-                edit_log += "👤 角色一致性模式: 特征保持完成\n"
+                elif editing_mode == "character_consistency":
+                    # 角色一致性模式
+                    result_image = self._process_character_consistency(
+                        base_tensor, source_images, kontext_prompt, 
+                        context_strength
+                    )
+                    edit_log += "👤 角色一致性模式: 特征保持完成\n"
                 
-            elif editing_mode == "multi_round_edit":
-                # 多轮编辑模式
-                result_image = self._process_multi_round_edit(
-                    base_tensor, previous_edit, kontext_prompt, 
-                    max_iterations, guidance_scale
-                )
-                edit_log += f"🔄 多轮编辑模式: 最大{max_iterations}轮迭代\n"
+                elif editing_mode == "multi_round_edit":
+                    # 多轮编辑模式
+                    result_image = self._process_multi_round_edit(
+                        base_tensor, previous_edit, kontext_prompt, 
+                        max_iterations, guidance_scale
+                    )
+                    edit_log += f"🔄 多轮编辑模式: 最大{max_iterations}轮迭代\n"
             
             # 创建空的组合遮罩（已移除遮罩功能）
-            combined_mask = torch.zeros((1, height, width), dtype=torch.float32)
+            with timer.stage("mask"):
+                combined_mask = torch.zeros((1, height, width), dtype=torch.float32)
             
-            # 创建拼接预览
-            stitch_preview = self._create_stitch_preview(source_images, base_tensor)
+            with timer.stage("postprocess"):
+                # 创建拼接预览
+                stitch_preview = self._create_stitch_preview(source_images, base_tensor)
+                
+                # 应用宽高比调整
+                if aspect_ratio != "match_input":
+                    result_image = self._apply_aspect_ratio(result_image, aspect_ratio)
+                    edit_log += f"📐 宽高比调整: {aspect_ratio}\n"
+            stage_timings = timer.finish()
             
             # 生成Kontext元数据
             kontext_metadata = self._generate_kontext_metadata(
                 editing_mode, aspect_ratio, guidance_scale, 
-                len(source_images), preserve_character, context_strength
+                len(source_images), preserve_character, context_strength,
+                stage_timings
             )
             
-            # 应用宽高比调整
-            if aspect_ratio != "match_input":
-                result_image = self._apply_aspect_ratio(result_image, aspect_ratio)
-                edit_log += f"📐 宽高比调整: {aspect_ratio}\n"
-            
             # 完成日志
-            end_time = datetime.now()
-            processing_time = (end_time - start_time).total_seconds()
+            processing_time = stage_timings["total"] / 1000
             edit_log += f"⏱️ 处理完成，耗时: {processing_time:.2f}秒\n"
             edit_log += f"✨ Kontext编辑成功 - 支持区域生图\n"
             
@@ -319,8 +326,9 @@ class MultiImageAreaEditor:
         return stitched
     
     def _generate_kontext_metadata(self, editing_mode, aspect_ratio, guidance_scale, 
-                                  num_sources, preserve_character, context_strength):
-        """生成Kontext元数据"""
+                                  num_sources, preserve_character, context_strength,
+                                  stage_timings=None):
+        """生成Kontext元数据（stage_timings 为各阶段毫秒耗时）"""
         metadata = {
             "editing_mode": editing_mode,
             "aspect_ratio": aspect_ratio,
@@ -332,6 +340,8 @@ class MultiImageAreaEditor:
             "supports_iterative": True,
             "supports_regional": True
         }
+        if stage_timings is not None:
+            metadata["stage_timings_ms"] = stage_timings
         
         return str(metadata)
     
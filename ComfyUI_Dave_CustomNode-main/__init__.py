@@ -249,9 +249,11 @@ def initialize_nodes():
             from .FluxKontextNode import (
                 FluxKontextNode,
                 FluxKontextImageStitch,
+                FluxKontextImageUnstitch,
                 FluxKontextPromptHelper,
                 FluxKontextProcessor
             )
+            from .FluxKontextLatent import FluxKontextCachedVAEEncode, FluxKontextLatentStitch
             # 导入新的多图区域编辑节点
             from .MultiImageAreaEditor import MultiImageAreaEditor
             
@@ -322,8 +324,10 @@ try:
         from .FluxKontextNode import (
             FluxKontextNode,
             FluxKontextImageStitch,
+            FluxKontextImageUnstitch,
             FluxKontextPromptHelper
         )
+        from .FluxKontextLatent import FluxKontextCachedVAEEncode, FluxKontextLatentStitch
         # 导入新的多图区域编辑节点
         from .MultiImageAreaEditor import MultiImageAreaEditor
         
@@ -339,7 +343,10 @@ try:
             # 新增Flux Kontext节点
             "FluxKontextNode": FluxKontextNode,
             "FluxKontextImageStitch": FluxKontextImageStitch,
+            "FluxKontextImageUnstitch": FluxKontextImageUnstitch,
             "FluxKontextPromptHelper": FluxKontextPromptHelper,
+            "FluxKontextCachedVAEEncode": FluxKontextCachedVAEEncode,
+            "FluxKontextLatentStitch": FluxKontextLatentStitch,
             # 新增多图区域编辑节点
             "MultiImageAreaEditor": MultiImageAreaEditor,
         }
@@ -356,7 +363,10 @@ try:
             # 新增Flux Kontext节点显示名称
             "FluxKontextNode": "🎨 Flux Kontext Editor (Dave)",
             "FluxKontextImageStitch": "🔗 Flux Kontext Image Stitch (Dave)",
+            "FluxKontextImageUnstitch": "✂️ Image Unstitch (Dave)",
             "FluxKontextPromptHelper": "💡 Flux Kontext Prompt Helper (Dave)",
+            "FluxKontextCachedVAEEncode": "🗜️ Cached VAE Encode (Dave)",
+            "FluxKontextLatentStitch": "🧩 Latent Stitch (Dave)",
         }
         
         initialization_success = True
@@ -0,0 +1,53 @@
+"""
+基准测试公共工具
+
+在ComfyUI之外直接加载本包的模块：把包目录注册为一个命名空间包，
+不执行包的 __init__.py（它会注册节点和前端扩展）。
+
+Created: 2025-01-27
+Author: Davemane42
+"""
+
+import importlib
+import logging
+import sys
+import tempfile
+import types
+from pathlib import Path
+from types import ModuleType
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent
+PACKAGE_NAME = "dave_custom_nodes"
+
+
+def isolate_tempdir() -> str:
+    """
+    使用新的临时目录，避免与正在运行的ComfyUI共享中间件存储和缓存
+
+    必须在加载 middleware 等模块之前调用。
+
+    Returns:
+        临时目录路径
+    """
+    tempfile.tempdir = tempfile.mkdtemp(prefix="dave_bench_")
+    return tempfile.tempdir
+
+
+def load_module(name: str, quiet: bool = True) -> ModuleType:
+    """
+    加载包内模块（支持模块内的相对导入）
+
+    Args:
+        name: 模块名，例如 "middleware"
+        quiet: 是否屏蔽模块日志
+
+    Returns:
+        模块对象
+    """
+    if quiet:
+        logging.disable(logging.CRITICAL)
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [str(PACKAGE_DIR)]
+        sys.modules[PACKAGE_NAME] = package
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
@@ -0,0 +1,92 @@
+"""
+人体部件配置存储基准：SQLite按节点存储 vs 旧版整文件JSON
+
+预先保存 N 个节点的配置（每个15个部件），然后测量单个节点的保存（含落盘）与加载耗时。
+旧版实现每次保存都读取、修改并重写整个 config.json，加载也要解析整个文件。
+
+用法:
+    python benchmarks/bench_config_store.py [--nodes 10000] [--repeat 200]
+
+Created: 2025-01-27
+Author: Davemane42
+"""
+
+import argparse
+import json
+import os
+import time
+
+from _common import isolate_tempdir, load_module
+
+PART_IDS = (
+    "head", "neck", "torso",
+    "left_upper_arm", "left_forearm", "left_hand",
+    "right_upper_arm", "right_forearm", "right_hand",
+    "left_thigh", "left_calf", "left_foot",
+    "right_thigh", "right_calf", "right_foot",
+)
+
+
+def make_config(seed: int):
+    return {part_id: [100 + seed % 97, 200, 80, 160, 1.0, 0.0] for part_id in PART_IDS}
+
+
+def per_op_us(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=10000, help="预先保存的节点数")
+    parser.add_argument("--repeat", type=int, default=200, help="SQLite每项测量的次数")
+    parser.add_argument("--legacy-repeat", type=int, default=10, help="旧版JSON每项测量的次数")
+    args = parser.parse_args()
+
+    tmp = isolate_tempdir()
+    middleware = load_module("middleware")._middleware
+    # 保留策略不在测量范围内：测量期间保留全部节点
+    middleware.RETENTION_MAX_NODES = args.nodes
+    target = str(args.nodes // 2)
+
+    start = time.perf_counter()
+    for node_id in range(args.nodes):
+        middleware.save_config(str(node_id), make_config(node_id))
+    middleware.flush()
+    print(f"SQLite: 写入 {args.nodes} 个节点配置 {time.perf_counter() - start:.2f} s")
+
+    def sqlite_save(i):
+        middleware.save_config(target, make_config(i + 1))
+        middleware.flush([target])
+
+    sqlite_save_us = per_op_us(sqlite_save, args.repeat)
+    sqlite_load_us = per_op_us(lambda i: middleware.load_config(target), args.repeat)
+
+    # 旧版：所有节点保存在一个缩进格式的JSON文件中
+    legacy_file = os.path.join(tmp, "legacy_config.json")
+    with open(legacy_file, "w", encoding="utf-8") as f:
+        json.dump({str(node_id): make_config(node_id) for node_id in range(args.nodes)}, f, indent=2)
+
+    def legacy_save(i):
+        with open(legacy_file, "r", encoding="utf-8") as f:
+            all_configs = json.load(f)
+        all_configs[target] = make_config(i + 1)
+        with open(legacy_file, "w", encoding="utf-8") as f:
+            json.dump(all_configs, f, ensure_ascii=False, indent=2)
+
+    def legacy_load(i):
+        with open(legacy_file, "r", encoding="utf-8") as f:
+            return json.load(f).get(target)
+
+    legacy_save_us = per_op_us(legacy_save, args.legacy_repeat)
+    legacy_load_us = per_op_us(legacy_load, args.legacy_repeat)
+
+    print(f"{args.nodes} 个节点，单节点操作耗时:")
+    print(f"  保存(含落盘): JSON {legacy_save_us / 1000:9.2f} ms   SQLite {sqlite_save_us / 1000:9.3f} ms")
+    print(f"  加载:         JSON {legacy_load_us / 1000:9.2f} ms   SQLite {sqlite_load_us / 1000:9.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+图像拼接峰值内存基准：预分配画布拼接 vs 旧版逐图填充 + torch.cat
+
+水平拼接 N 张高度不同的 [B, H, W, 3] 图像（中间留间隙），每种实现在独立子进程中运行，
+报告相对加载后的峰值RSS增量、输出大小与耗时，并检查两种实现的输出逐位一致。
+旧版实现对每张高度不足的图像调用 F.pad，再为每个间隙分配零张量，最后 torch.cat，
+峰值内存约为输出的两倍；新版一次性分配画布，每张图像直接复制到对应切片。
+
+用法:
+    python benchmarks/bench_image_stitch.py [--images 4] [--batch 4] [--size 1024] [--gap 8]
+
+Created: 2025-01-27
+Author: Davemane42
+"""
+
+import argparse
+import resource
+import subprocess
+import sys
+import time
+from typing import List
+
+import torch
+
+from _common import load_module
+
+
+def legacy_stitch_horizontal(images: List[torch.Tensor], alignment: str, gap: int) -> torch.Tensor:
+    """旧版 FluxKontextImageStitch._stitch_horizontal：逐图填充到最大高度，插入零间隙后 torch.cat"""
+    max_height = max(img.shape[1] for img in images)
+    aligned_images = []
+    for img in images:
+        pad_total = max_height - img.shape[1]
+        if pad_total:
+            if alignment == "top":
+                pad_top, pad_bottom = 0, pad_total
+            elif alignment == "bottom":
+                pad_top, pad_bottom = pad_total, 0
+            else:  # center
+                pad_top = pad_total // 2
+                pad_bottom = pad_total - pad_top
+            img = torch.nn.functional.pad(img, (0, 0, 0, 0, pad_top, pad_bottom, 0, 0), mode='constant', value=0)
+        aligned_images.append(img)
+
+    if gap > 0:
+        final_images = []
+        for i, img in enumerate(aligned_images):
+            final_images.append(img)
+            if i < len(aligned_images) - 1:
+                final_images.append(torch.zeros(
+                    img.shape[0], img.shape[1], gap, img.shape[3], device=img.device, dtype=img.dtype
+                ))
+        aligned_images = final_images
+
+    return torch.cat(aligned_images, dim=2)
+
+
+def make_images(count: int, batch: int, size: int) -> List[torch.Tensor]:
+    generator = torch.Generator().manual_seed(0)
+    return [torch.rand(batch, size - 64 * index, size, 3, generator=generator) for index in range(count)]
+
+
+def stitch(mode: str, images: List[torch.Tensor], alignment: str, gap: int) -> torch.Tensor:
+    if mode == "legacy":
+        return legacy_stitch_horizontal(images, alignment, gap)
+    node = load_module("FluxKontextNode")
+    layout = node.plan_kontext_stitch([(img.shape[1], img.shape[2]) for img in images], "horizontal", alignment, gap)
+    return node.stitch_kontext_images(images, layout)
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 单位为KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_single(args) -> None:
+    """子进程：只运行一种实现，输出一行结果"""
+    torch.set_num_threads(1)
+    load_module("FluxKontextNode")
+    images = make_images(args.images, args.batch, args.size)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    output = stitch(args.mode, images, args.alignment, args.gap)
+    elapsed = (time.perf_counter() - start) * 1000
+    output_mb = output.numel() * output.element_size() / 2 ** 20
+    print(f"{args.mode:8s} 峰值增量 {peak_rss_mb() - baseline:7.1f} MB   输出 {output_mb:6.1f} MB   耗时 {elapsed:6.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=4, help="拼接的图像数")
+    parser.add_argument("--batch", type=int, default=4, help="每张图像的批次大小")
+    parser.add_argument("--size", type=int, default=1024, help="图像宽度（高度依次减少64）")
+    parser.add_argument("--gap", type=int, default=8, help="图像间隙（像素）")
+    parser.add_argument("--alignment", default="center", choices=("top", "center", "bottom"))
+    parser.add_argument("--mode", choices=("legacy", "prealloc"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_single(args)
+        return
+
+    # 峰值RSS是进程级的，每种实现在独立的子进程中测量
+    passthrough = [
+        "--images", str(args.images), "--batch", str(args.batch), "--size", str(args.size),
+        "--gap", str(args.gap), "--alignment", args.alignment,
+    ]
+    for mode in ("legacy", "prealloc"):
+        subprocess.run([sys.executable, __file__, "--mode", mode] + passthrough, check=True)
+
+    images = make_images(args.images, args.batch, min(args.size, 512))
+    identical = all(
+        torch.equal(stitch("legacy", images, alignment, gap), stitch("prealloc", images, alignment, gap))
+        for alignment in ("top", "center", "bottom")
+        for gap in (0, args.gap)
+    )
+    print(f"输出逐位一致: {identical}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
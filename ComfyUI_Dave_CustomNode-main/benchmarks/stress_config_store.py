@@ -0,0 +1,83 @@
+"""
+人体部件配置存储多进程压力测试
+
+N 个进程共享同一个实例的存储，各自反复保存/加载自己的节点配置，同时写入一个共享节点。
+结束后检查每个节点的最终配置是否为最后一次写入的值（丢失更新数应为0），并输出延迟分位。
+
+用法:
+    python benchmarks/stress_config_store.py [--procs 4] [--ops 500] [--keys 50]
+
+Created: 2025-01-27
+Author: Davemane42
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from _common import isolate_tempdir, load_module
+
+INSTANCE_ID = "stress"
+
+
+def make_config(worker: int, step: int):
+    return {"head": [worker, step, 80, 80, 1.0, 0.0]}
+
+
+def worker_main(args):
+    tmp, worker, ops, keys = args
+    tempfile.tempdir = tmp
+    os.environ["COMFYUI_INSTANCE_ID"] = INSTANCE_ID
+    middleware = load_module("middleware")
+
+    latencies = []
+    for step in range(ops):
+        node_id = f"w{worker}_n{step % keys}"
+        config = make_config(worker, step)
+        start = time.perf_counter()
+        ok = middleware.save_body_parts_config(node_id, config)
+        middleware.save_body_parts_config("shared", config)
+        loaded = middleware.load_body_parts_config(node_id)
+        latencies.append(time.perf_counter() - start)
+        if not ok or loaded != config:
+            raise AssertionError(f"读回的配置不一致: {node_id}: {loaded} != {config}")
+    middleware.flush_body_parts_config()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--procs", type=int, default=4, help="进程数")
+    parser.add_argument("--ops", type=int, default=500, help="每个进程的迭代次数")
+    parser.add_argument("--keys", type=int, default=50, help="每个进程使用的节点数")
+    args = parser.parse_args()
+
+    tmp = isolate_tempdir()
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.procs) as pool:
+        results = pool.map(worker_main, [(tmp, worker, args.ops, args.keys) for worker in range(args.procs)])
+
+    # 所有进程结束后用新的中间件实例检查最终状态
+    os.environ["COMFYUI_INSTANCE_ID"] = INSTANCE_ID
+    middleware = load_module("middleware")
+    lost = 0
+    for worker in range(args.procs):
+        for key in range(args.keys):
+            last_step = max(step for step in range(args.ops) if step % args.keys == key)
+            if middleware.load_body_parts_config(f"w{worker}_n{key}") != make_config(worker, last_step):
+                lost += 1
+    shared = middleware.load_body_parts_config("shared")
+    shared_ok = shared in [make_config(worker, args.ops - 1) for worker in range(args.procs)]
+
+    latencies = sorted(value for result in results for value in result)
+    percentile = lambda fraction: latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+    print(f"进程数={args.procs} 每进程迭代={args.ops} 丢失更新={lost} 共享节点为某进程最后一次写入={shared_ok}")
+    print(f"延迟 p50={percentile(0.50):.2f}ms p99={percentile(0.99):.2f}ms max={latencies[-1] * 1000:.2f}ms")
+    if lost or not shared_ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
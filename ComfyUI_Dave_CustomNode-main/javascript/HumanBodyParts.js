@@ -59,6 +59,28 @@ const BODY_PARTS = {
     "spine": { name: "脊柱", color: "#dda0dd", defaultPos: [197, 85, 10, 100, 1.0, 0.0] }
 };
 
+// 部件配置数组 [x, y, width, height, strength, rotation] 的字段名，用于增量同步（与中间件 PART_FIELDS 一致）
+const PART_FIELDS = ["x", "y", "width", "height", "strength", "rotation"];
+
+// 同步到Python的部件ID映射（与中间件 PART_IDS 一致），不在其中的部件只在画布上显示
+const BACKEND_PART_IDS = {
+    "head": "head",
+    "neck": "neck",
+    "torso": "torso",
+    "left_arm": "left_upper_arm",
+    "left_forearm": "left_forearm",
+    "left_hand": "left_hand",
+    "right_arm": "right_upper_arm",
+    "right_forearm": "right_forearm",
+    "right_hand": "right_hand",
+    "left_thigh": "left_thigh",
+    "left_calf": "left_calf",
+    "left_foot": "left_foot",
+    "right_thigh": "right_thigh",
+    "right_calf": "right_calf",
+    "right_foot": "right_foot"
+};
+
 // ========== 专业Canvas交互系统 ==========
 
 /**
@@ -597,6 +619,8 @@ class HumanBodyPartsInteractor {
         this.throttler = new RAFThrottler();
         this.dragTracker = new ProfessionalDragTracker();
         this.parameterSync = new ParameterSyncManager(this);
+        // 🚀 增量同步状态：服务器确认的版本号与配置快照，同一时间只有一个请求在途
+        this.configSync = { version: null, synced: {}, inFlight: false, dirty: false };
         this.selectedPart = "head";
         this.hoveredPart = null;
         this.isResizing = false;
@@ -1110,41 +1134,128 @@ class HumanBodyPartsInteractor {
     
     /**
      * 🚀 通过ComfyUI API调用Python中间件
+     * 
+     * 已有服务器版本号时只发送变化的部件字段（patch_config），版本不一致(409)时
+     * 回退为整体同步；请求在途期间的变化在返回后合并为一次发送。
      */
     callMiddlewareAPI(nodeId, config) {
         try {
-            if (this.node.graph && this.node.graph.app && this.node.graph.app.api) {
-                const api = this.node.graph.app.api;
-                
-                // 构造API请求
-                const payload = {
-                    action: "save_body_parts_config",
-                    node_id: nodeId,
-                    config: config
-                };
-                
-                // 使用ComfyUI内置API发送请求
-                if (api.fetchApi) {
-                    api.fetchApi('/human_body_parts/save_config', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify(payload)
-                    }).then(response => {
-                        if (response.ok) {
-                            console.log("🚀 配置已通过API同步到Python中间件");
-                        }
-                    }).catch(err => {
-                        console.warn("⚠️ API调用失败，使用备用方案:", err);
-                    });
-                }
+            const api = this.node.graph && this.node.graph.app && this.node.graph.app.api;
+            if (!api || !api.fetchApi || !config) return;
+            
+            const sync = this.configSync;
+            if (sync.inFlight) {
+                sync.dirty = true;
+                return;
             }
+            
+            const snapshot = this.toBackendPartConfig(config);
+            const patch = sync.version === null ? null : this.diffPartConfigs(sync.synced, snapshot);
+            if (patch && Object.keys(patch).length === 0) return;
+            
+            sync.inFlight = true;
+            const request = patch
+                ? this.sendConfigPatch(api, nodeId, sync.version, patch, snapshot)
+                : this.sendFullConfig(api, nodeId, snapshot);
+            
+            request.then(version => {
+                sync.version = version;
+                sync.synced = snapshot;
+            }).catch(err => {
+                // 状态未知，下次整体同步
+                sync.version = null;
+                console.warn("⚠️ API调用失败，使用备用方案:", err);
+            }).finally(() => {
+                sync.inFlight = false;
+                if (sync.dirty) {
+                    sync.dirty = false;
+                    this.callMiddlewareAPI(nodeId, this.node.properties.current_body_parts_config);
+                }
+            });
         } catch (error) {
             console.warn("⚠️ API调用异常，使用备用方案:", error);
         }
     }
     
+    /**
+     * 🚀 将画布配置转换为Python部件ID的副本，丢弃Python不支持的部件
+     */
+    toBackendPartConfig(config) {
+        const converted = {};
+        for (const [partId, values] of Object.entries(config)) {
+            const backendId = BACKEND_PART_IDS[partId];
+            if (backendId) {
+                converted[backendId] = values.slice();
+            }
+        }
+        return converted;
+    }
+    
+    /**
+     * 🚀 计算相对已同步快照变化的部件字段：{部件ID: {字段名: 值}}，新部件发送完整数组
+     */
+    diffPartConfigs(base, config) {
+        const patch = {};
+        for (const [partId, values] of Object.entries(config)) {
+            const previous = base[partId];
+            if (!previous) {
+                patch[partId] = values.slice();
+                continue;
+            }
+            const fields = {};
+            PART_FIELDS.forEach((field, index) => {
+                if (values[index] !== previous[index]) {
+                    fields[field] = values[index];
+                }
+            });
+            if (Object.keys(fields).length > 0) {
+                patch[partId] = fields;
+            }
+        }
+        return patch;
+    }
+    
+    /**
+     * 🚀 发送增量补丁，返回新版本号；版本不一致时回退为整体同步
+     */
+    async sendConfigPatch(api, nodeId, baseVersion, patch, snapshot) {
+        const response = await api.fetchApi('/human_body_parts/patch_config', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ node_id: nodeId, base_version: baseVersion, patch: patch })
+        });
+        if (response.status === 409) {
+            console.log("🔄 配置版本不一致，回退为整体同步");
+            return this.sendFullConfig(api, nodeId, snapshot);
+        }
+        if (!response.ok) {
+            throw new Error(`patch_config HTTP ${response.status}`);
+        }
+        const result = await response.json();
+        return result.version;
+    }
+    
+    /**
+     * 🚀 发送完整配置，返回新版本号
+     */
+    async sendFullConfig(api, nodeId, config) {
+        const response = await api.fetchApi('/human_body_parts/save_config', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                action: "save_body_parts_config",
+                node_id: nodeId,
+                config: config
+            })
+        });
+        if (!response.ok) {
+            throw new Error(`save_config HTTP ${response.status}`);
+        }
+        const result = await response.json();
+        console.log("🚀 配置已通过API同步到Python中间件");
+        return result.version;
+    }
+    
     /**
      * 🚀 写入配置到临时文件（备用方案）
      */
@@ -0,0 +1,492 @@
+"""
+Flux Kontext 推理后端
+供 FluxKontextNode 使用
+
+推理通过可插拔的后端执行：后端实现 prepare / infer / teardown，按名称注册和选择，
+真实引擎只需调用 register_kontext_backend 注册即可，无需修改节点。
+内置的 reference_cpu 后端是确定性的CPU参考实现（按样本种子添加少量噪声），用于测试。
+
+后端前面有一个微批处理队列：在短时间窗口内到达、尺寸（分桶）与推理参数兼容的
+编辑请求合并为一次批量后端调用，结果再按请求拆分返回；每个请求报告排队时间与计算时间。
+
+Created: 2025-01-27
+Author: Davemane42
+"""
+
+import abc
+import atexit
+import logging
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import torch
+
+from .mask_resampling import resample_mask
+
+logger = logging.getLogger('DavemaneCustomNodes.FluxKontext')
+
+KONTEXT_MAX_SEED = 2147483647
+
+DEFAULT_KONTEXT_BACKEND = "reference_cpu"
+
+
+def resolve_kontext_seed(seed: int) -> int:
+    """
+    解析种子：-1 时生成新的随机种子（不读取也不修改全局随机状态）
+
+    Args:
+        seed: 输入种子
+
+    Returns:
+        实际使用的基础种子
+    """
+    if seed == -1:
+        return secrets.randbelow(KONTEXT_MAX_SEED + 1)
+    return int(seed)
+
+
+def kontext_sample_seeds(base_seed: int, batch_size: int) -> List[int]:
+    """
+    计算批次中每个样本的种子（基础种子 + 索引，超出范围时回绕）
+
+    Args:
+        base_seed: 基础种子
+        batch_size: 批次大小
+
+    Returns:
+        每个样本的种子
+    """
+    return [(base_seed + index) % (KONTEXT_MAX_SEED + 1) for index in range(batch_size)]
+
+
+def kontext_batch_noise(
+    shape: Tuple[int, ...],
+    seeds: List[int],
+    device: Optional[torch.device] = None,
+    dtype: torch.dtype = torch.float32,
+) -> torch.Tensor:
+    """
+    为整个批次生成噪声，每个样本使用独立的 torch.Generator
+
+    噪声在CPU上生成后一次性移动到目标设备，样本 i 只取决于 seeds[i]，
+    与批次大小、设备和其他样本无关，拆分批次后结果逐位一致。
+
+    Args:
+        shape: 单个样本的形状
+        seeds: 每个样本的种子
+        device: 目标设备
+        dtype: 目标数据类型
+
+    Returns:
+        [B, *shape] 噪声
+    """
+    noise = torch.empty((len(seeds),) + tuple(shape), dtype=torch.float32)
+    generator = torch.Generator(device="cpu")
+    for index, sample_seed in enumerate(seeds):
+        generator.manual_seed(sample_seed)
+        torch.randn(shape, generator=generator, out=noise[index])
+    return noise.to(device=device, dtype=dtype)
+
+
+class KontextRequest(NamedTuple):
+    """单个编辑请求（图像为 [B, H, W, C]，样本 i 的种子为 seed + i）"""
+    image: torch.Tensor
+    prompt: str
+    edit_type: str
+    guidance_scale: float
+    num_steps: int
+    seed: int
+    mask: Optional[torch.Tensor] = None
+    controlnet_image: Optional[torch.Tensor] = None
+
+    def batch_key(self) -> Tuple:
+        """可合并批处理的兼容键：尺寸、数据类型、设备、步数与控制图像尺寸一致"""
+        control_shape = None
+        if self.controlnet_image is not None:
+            control_shape = tuple(self.controlnet_image.shape[1:])
+        return (
+            tuple(self.image.shape[1:]),
+            self.image.dtype,
+            self.image.device,
+            int(self.num_steps),
+            control_shape,
+        )
+
+
+class KontextBatch(NamedTuple):
+    """合并后的后端输入，所有逐样本字段长度均为 N"""
+    images: torch.Tensor
+    prompts: Tuple[str, ...]
+    edit_types: Tuple[str, ...]
+    guidance_scales: Tuple[float, ...]
+    num_steps: int
+    seeds: Tuple[int, ...]
+    masks: Optional[torch.Tensor]
+    controlnet_images: Optional[torch.Tensor]
+
+
+class KontextResult(NamedTuple):
+    """单个请求的推理结果与耗时（秒）"""
+    image: torch.Tensor
+    backend: str
+    queue_time: float
+    compute_time: float
+    batched_requests: int
+
+
+class KontextBackend(abc.ABC):
+    """
+    推理后端接口
+
+    子类必须实现 infer（处理一个合并批次）；prepare 在首次使用前调用一次（加载模型等），
+    teardown 在后端被替换或进程退出时调用，默认不做任何事。
+    """
+
+    name = "base"
+
+    def prepare(self) -> None:
+        """加载模型等一次性准备工作"""
+
+    @abc.abstractmethod
+    def infer(self, batch: KontextBatch) -> torch.Tensor:
+        """
+        执行一次批量推理
+
+        Args:
+            batch: 合并后的批次
+
+        Returns:
+            [N, H, W, C] 编辑后的图像
+        """
+
+    def teardown(self) -> None:
+        """释放后端资源"""
+
+
+class ReferenceKontextBackend(KontextBackend):
+    """
+    确定性CPU参考后端：为每个样本按其种子添加少量噪声，遮罩外保持原图
+    """
+
+    name = "reference_cpu"
+    NOISE_FACTOR = 0.02  # 很小的噪声，不会显著改变图像
+
+    def infer(self, batch: KontextBatch) -> torch.Tensor:
+        images = batch.images
+        device = images.device
+        if device.type != "cpu":
+            images = images.cpu()
+        noise = kontext_batch_noise(tuple(images.shape[1:]), list(batch.seeds), dtype=images.dtype)
+        noise.mul_(self.NOISE_FACTOR)
+        if batch.masks is not None:
+            noise.mul_(batch.masks.to(device=images.device, dtype=images.dtype).unsqueeze(-1))
+        return torch.clamp(images + noise, 0.0, 1.0).to(device)
+
+
+_backend_factories: Dict[str, Callable[[], KontextBackend]] = {}
+_backends: Dict[str, KontextBackend] = {}
+_registry_lock = threading.Lock()
+
+
+def register_kontext_backend(name: str, factory: Callable[[], KontextBackend]) -> None:
+    """
+    注册推理后端，同名后端会被替换（已准备的旧实例先执行 teardown）
+
+    Args:
+        name: 后端名称
+        factory: 无参数的后端构造函数（通常是后端类本身）
+    """
+    with _registry_lock:
+        _backend_factories[name] = factory
+        previous = _backends.pop(name, None)
+    if previous is not None:
+        previous.teardown()
+    logger.info(f"🔌 已注册Kontext推理后端: {name}")
+
+
+def list_kontext_backends() -> List[str]:
+    """获取已注册的后端名称（默认后端在前）"""
+    with _registry_lock:
+        names = sorted(_backend_factories)
+    if DEFAULT_KONTEXT_BACKEND in names:
+        names.remove(DEFAULT_KONTEXT_BACKEND)
+        names.insert(0, DEFAULT_KONTEXT_BACKEND)
+    return names
+
+
+def get_kontext_backend(name: str) -> KontextBackend:
+    """
+    获取已准备好的后端实例（首次使用时创建并调用 prepare）
+
+    Args:
+        name: 后端名称
+
+    Returns:
+        后端实例
+    """
+    with _registry_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            factory = _backend_factories.get(name)
+            if factory is None:
+                raise ValueError(f"未知的Kontext推理后端: {name}")
+            backend = factory()
+            backend.prepare()
+            _backends[name] = backend
+            logger.info(f"✅ Kontext推理后端已就绪: {name}")
+        return backend
+
+
+def teardown_kontext_backends() -> None:
+    """释放所有已准备的后端"""
+    with _registry_lock:
+        backends = list(_backends.items())
+        _backends.clear()
+    for name, backend in backends:
+        try:
+            backend.teardown()
+        except Exception as e:
+            logger.error(f"❌ Kontext推理后端释放失败 {name}: {e}")
+
+
+atexit.register(teardown_kontext_backends)
+register_kontext_backend(ReferenceKontextBackend.name, ReferenceKontextBackend)
+
+
+def combine_kontext_requests(requests: List[KontextRequest]) -> KontextBatch:
+    """
+    将兼容的请求合并为一个批次（调用方保证 batch_key 相同）
+
+    遮罩统一重采样到图像尺寸并广播到每个请求的批次大小，
+    部分请求没有遮罩时以全1遮罩补齐。
+
+    Args:
+        requests: 兼容的请求列表
+
+    Returns:
+        合并后的批次
+    """
+    height, width = requests[0].image.shape[1], requests[0].image.shape[2]
+    prompts: List[str] = []
+    edit_types: List[str] = []
+    guidance_scales: List[float] = []
+    seeds: List[int] = []
+    masks: List[Optional[torch.Tensor]] = []
+    for request in requests:
+        batch_size = request.image.shape[0]
+        prompts.extend([request.prompt] * batch_size)
+        edit_types.extend([request.edit_type] * batch_size)
+        guidance_scales.extend([float(request.guidance_scale)] * batch_size)
+        seeds.extend(kontext_sample_seeds(request.seed, batch_size))
+        mask = None
+        if request.mask is not None:
+            mask = resample_mask(request.mask, (height, width))
+            if mask.shape[0] not in (1, batch_size):
+                raise ValueError(f"遮罩批次大小 {mask.shape[0]} 与图像批次大小 {batch_size} 不匹配")
+            mask = mask.expand(batch_size, height, width)
+        masks.append(mask)
+
+    combined_masks = None
+    if any(mask is not None for mask in masks):
+        reference = next(mask for mask in masks if mask is not None)
+        combined_masks = torch.cat([
+            mask.to(reference.dtype) if mask is not None
+            else reference.new_ones((request.image.shape[0], height, width))
+            for mask, request in zip(masks, requests)
+        ])
+
+    controlnet_images = None
+    if requests[0].controlnet_image is not None:
+        controlnet_images = torch.cat([request.controlnet_image for request in requests])
+
+    images = requests[0].image if len(requests) == 1 else torch.cat([r.image for r in requests])
+    return KontextBatch(
+        images=images,
+        prompts=tuple(prompts),
+        edit_types=tuple(edit_types),
+        guidance_scales=tuple(guidance_scales),
+        num_steps=int(requests[0].num_steps),
+        seeds=tuple(seeds),
+        masks=combined_masks,
+        controlnet_images=controlnet_images,
+    )
+
+
+def run_kontext_batch(backend_name: str, requests: List[KontextRequest]) -> Tuple[List[torch.Tensor], float]:
+    """
+    合并请求、执行一次后端调用并按请求拆分结果
+
+    Args:
+        backend_name: 后端名称
+        requests: 兼容的请求列表
+
+    Returns:
+        (每个请求的结果图像, 计算耗时秒数)
+    """
+    backend = get_kontext_backend(backend_name)
+    start = time.perf_counter()
+    output = backend.infer(combine_kontext_requests(requests))
+    outputs = list(torch.split(output, [r.image.shape[0] for r in requests]))
+    return outputs, time.perf_counter() - start
+
+
+class _QueuedRequest(NamedTuple):
+    request: KontextRequest
+    window: float
+    enqueued_at: float
+    future: Future
+
+
+class KontextMicroBatcher:
+    """
+    后端前的微批处理队列
+
+    第一个请求到达后最多等待其时间窗口，期间到达的请求按兼容键分组，
+    每组合并为一次后端调用；单批样本数达到 max_batch 时立即执行。
+    """
+
+    def __init__(self, backend_name: str, max_batch: int = 8):
+        self.backend_name = backend_name
+        self.max_batch = max_batch
+        self._queue: Deque[_QueuedRequest] = deque()
+        self._wakeup = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, request: KontextRequest, window: float = 0.0) -> KontextResult:
+        """
+        提交请求并等待结果
+
+        Args:
+            request: 编辑请求
+            window: 合并等待窗口（秒），0 表示不等待、直接调用后端
+
+        Returns:
+            推理结果与排队/计算耗时
+        """
+        return self.submit_many([request], window)[0]
+
+    def submit_many(self, requests: List[KontextRequest], window: float = 0.0) -> List[KontextResult]:
+        """
+        一次提交多个请求并等待全部结果（例如同一图像的多个种子/提示词变体）
+
+        Args:
+            requests: 编辑请求列表
+            window: 合并等待窗口（秒），0 表示不等待、在当前线程中按兼容键与 max_batch
+                分批直接调用后端
+
+        Returns:
+            与请求顺序一致的推理结果
+        """
+        enqueued_at = time.perf_counter()
+        if window <= 0:
+            results: List[Optional[KontextResult]] = [None] * len(requests)
+            for indices in self._split_batches(requests):
+                dispatched_at = time.perf_counter()
+                outputs, compute_time = run_kontext_batch(self.backend_name, [requests[i] for i in indices])
+                for index, output in zip(indices, outputs):
+                    results[index] = KontextResult(
+                        output, self.backend_name, dispatched_at - enqueued_at, compute_time, len(indices)
+                    )
+            return results
+
+        futures: List[Future] = []
+        with self._wakeup:
+            for request in requests:
+                future: Future = Future()
+                self._queue.append(_QueuedRequest(request, window, enqueued_at, future))
+                futures.append(future)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._worker_loop, name=f"KontextMicroBatcher-{self.backend_name}", daemon=True
+                )
+                self._worker.start()
+            self._wakeup.notify()
+        return [future.result() for future in futures]
+
+    def _split_batches(self, requests: List[KontextRequest]) -> List[List[int]]:
+        """
+        按兼容键分组，每组再按 max_batch 个样本切分（单个请求超过上限时单独成批）
+
+        Returns:
+            每批请求在 requests 中的索引
+        """
+        groups: Dict[Tuple, List[int]] = {}
+        for index, request in enumerate(requests):
+            groups.setdefault(request.batch_key(), []).append(index)
+
+        batches: List[List[int]] = []
+        for indices in groups.values():
+            batch: List[int] = []
+            samples = 0
+            for index in indices:
+                size = requests[index].image.shape[0]
+                if batch and samples + size > self.max_batch:
+                    batches.append(batch)
+                    batch, samples = [], 0
+                batch.append(index)
+                samples += size
+            batches.append(batch)
+        return batches
+
+    def _take_window(self) -> List[_QueuedRequest]:
+        """等待第一个请求的窗口结束（或样本数达到上限），取出本轮的请求"""
+        with self._wakeup:
+            while not self._queue:
+                self._wakeup.wait()
+            deadline = self._queue[0].enqueued_at + self._queue[0].window
+            while True:
+                samples = sum(item.request.image.shape[0] for item in self._queue)
+                remaining = deadline - time.perf_counter()
+                if samples >= self.max_batch or remaining <= 0:
+                    break
+                self._wakeup.wait(timeout=remaining)
+
+            taken: List[_QueuedRequest] = []
+            samples = 0
+            while self._queue:
+                size = self._queue[0].request.image.shape[0]
+                if taken and samples + size > self.max_batch:
+                    break
+                taken.append(self._queue.popleft())
+                samples += size
+            return taken
+
+    def _worker_loop(self) -> None:
+        """后台循环：按窗口取出请求，按兼容键分组执行"""
+        while True:
+            taken = self._take_window()
+            groups: Dict[Tuple, List[_QueuedRequest]] = {}
+            for item in taken:
+                groups.setdefault(item.request.batch_key(), []).append(item)
+
+            for items in groups.values():
+                dispatched_at = time.perf_counter()
+                try:
+                    outputs, compute_time = run_kontext_batch(
+                        self.backend_name, [item.request for item in items]
+                    )
+                except Exception as e:
+                    logger.error(f"❌ Kontext批量推理失败 ({len(items)} 个请求): {e}")
+                    for item in items:
+                        item.future.set_exception(e)
+                    continue
+                for item, output in zip(items, outputs):
+                    item.future.set_result(KontextResult(
+                        output, self.backend_name, dispatched_at - item.enqueued_at, compute_time, len(items)
+                    ))
+
+
+_batchers: Dict[str, KontextMicroBatcher] = {}
+
+
+def get_kontext_batcher(backend_name: str) -> KontextMicroBatcher:
+    """获取指定后端的共享微批处理队列"""
+    with _registry_lock:
+        batcher = _batchers.get(backend_name)
+        if batcher is None:
+            batcher = _batchers[backend_name] = KontextMicroBatcher(backend_name)
+        return batcher
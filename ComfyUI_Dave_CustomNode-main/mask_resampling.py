@@ -0,0 +1,124 @@
+"""
+共享遮罩重采样工具
+供 FluxKontextNode 使用
+
+遮罩按内容指纹缓存重采样结果：键为 (遮罩指纹, 目标尺寸, 插值模式, dtype, 设备)，
+同一遮罩在不同种子、重复排队执行时直接复用结果，不再重新插值。
+指纹由 tensor_cache 计算并按张量对象记忆，同一张量重复使用时也不会重新计算哈希（推理张量除外）。
+
+返回的遮罩可能被多次复用，调用方不得原地修改。
+
+Created: 2025-01-27
+Author: Davemane42
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import torch
+
+from .tensor_cache import fingerprint_tensor
+
+logger = logging.getLogger(__name__)
+
+
+def mask_as_batch(mask: torch.Tensor) -> torch.Tensor:
+    """
+    将遮罩统一为 [B, H, W] 视图（不复制）
+
+    支持 [H, W]、[B, H, W]、[B, 1, H, W] 与 [B, H, W, 1] 布局。
+
+    Args:
+        mask: 遮罩张量
+
+    Returns:
+        [B, H, W] 视图
+    """
+    if mask.dim() == 2:
+        return mask.unsqueeze(0)
+    if mask.dim() == 3:
+        return mask
+    if mask.dim() == 4:
+        if mask.shape[1] == 1:
+            return mask.squeeze(1)
+        if mask.shape[-1] == 1:
+            return mask.squeeze(-1)
+    raise ValueError(f"不支持的遮罩形状: {tuple(mask.shape)}")
+
+
+class MaskResampler:
+    """
+    带内容指纹LRU缓存的遮罩重采样器
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._results: "OrderedDict[Tuple, torch.Tensor]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resample(self, mask: torch.Tensor, size: Tuple[int, int], mode: str = "bilinear") -> torch.Tensor:
+        """
+        将遮罩重采样到目标尺寸
+
+        Args:
+            mask: 遮罩（[H, W]、[B, H, W]、[B, 1, H, W] 或 [B, H, W, 1]）
+            size: 目标尺寸 (H, W)
+            mode: 插值模式
+
+        Returns:
+            [B, H, W] 遮罩；尺寸已匹配时为输入的视图，否则为缓存的共享结果（只读）
+        """
+        batch_mask = mask_as_batch(mask)
+        size = (int(size[0]), int(size[1]))
+        if tuple(batch_mask.shape[1:]) == size:
+            return batch_mask
+
+        key = (fingerprint_tensor(mask), size, mode, batch_mask.dtype, batch_mask.device)
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        source = batch_mask if batch_mask.is_floating_point() else batch_mask.float()
+        align_corners = False if mode in ("linear", "bilinear", "bicubic", "trilinear") else None
+        resampled = torch.nn.functional.interpolate(
+            source.unsqueeze(1), size=size, mode=mode, align_corners=align_corners
+        ).squeeze(1)
+
+        with self._lock:
+            self._results[key] = resampled
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        logger.debug(f"遮罩重采样: {tuple(batch_mask.shape)} -> {size} ({mode})")
+        return resampled
+
+    def stats(self) -> Dict[str, int]:
+        """获取缓存命中统计"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._results)}
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._results.clear()
+
+
+# 全局共享重采样器
+_mask_resampler = MaskResampler()
+
+
+def resample_mask(mask: torch.Tensor, size: Tuple[int, int], mode: str = "bilinear") -> torch.Tensor:
+    """将遮罩重采样到目标尺寸（共享缓存），返回 [B, H, W]"""
+    return _mask_resampler.resample(mask, size, mode)
+
+
+def get_mask_resampler_stats() -> Dict[str, int]:
+    """获取遮罩重采样缓存统计"""
+    return _mask_resampler.stats()
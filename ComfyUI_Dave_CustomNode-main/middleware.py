@@ -2,130 +2,755 @@
 Human Body Parts 中间件系统
 用于JavaScript和Python之间的实时数据同步
 
+配置以节点为单位存储在SQLite(WAL模式)中，单个节点的读写只涉及一行，
+不再随已保存节点数量增长；每次写入都是一个事务，中断的写入不会破坏其他节点的配置。
+
+同一主机上运行多个ComfyUI实例时，每个实例（端口或 COMFYUI_INSTANCE_ID）
+使用独立的存储目录；初始化和迁移通过咨询式文件锁串行化，所有等待都有上限。
+
+保存采用写回（write-behind）策略：save_config 只更新内存中的待写状态，
+后台线程按有限频率把每个节点的最新配置合并写入；依赖某节点的提示词执行前
+会强制写入该节点。
+
+每个节点的配置带有版本号。版本号取自数据库内的全局版本时钟：每个进程一次预留
+一段版本号（VERSION_BLOCK），保存时从中分配，不需要写数据库，因此共享同一存储的
+进程不会给不同内容分配相同的版本号，被清除或淘汰的节点重新保存时也不会复用旧版本号。
+待写配置的版本号保存在内存中，查询版本号不会触发写入；写入时在跨进程锁内与已存储的
+内容比较，内容未变化时不写入，保留已存储的版本号。节点的 IS_CHANGED 只读取版本号，
+不解析配置。前端拖拽时只发送变化的部件字段及其基准版本（patch_config），
+版本不一致时回退为整体同步。
+
+存储有保留策略：节点数上限（按最近访问淘汰）、访问超时，以及清理不在当前
+工作流中的节点；淘汰由后台线程分批增量执行，不会阻塞保存。
+
 Created: 2025-01-27
 Author: Davemane42
 """
 
+import asyncio
+import atexit
 import json
 import os
+import re
+import sqlite3
 import tempfile
+import threading
+import time
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Optional, Tuple
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 logger = logging.getLogger(__name__)
 
+
+def _resolve_instance_id() -> str:
+    """
+    获取当前ComfyUI实例标识，用于隔离同一主机上多个实例的配置
+
+    优先使用环境变量 COMFYUI_INSTANCE_ID，其次使用ComfyUI监听端口
+    """
+    instance_id = os.environ.get("COMFYUI_INSTANCE_ID")
+    if not instance_id:
+        try:
+            from comfy.cli_args import args
+            instance_id = f"port{args.port}"
+        except Exception:
+            instance_id = "default"
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", instance_id)
+
+
+class InterProcessLock:
+    """
+    基于锁文件的跨进程咨询锁，等待时间有上限
+
+    POSIX上使用 fcntl.flock，Windows上使用 msvcrt.locking。
+    """
+
+    def __init__(self, path: Path, timeout: float = 5.0, poll_interval: float = 0.005):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._file = None
+
+    def _try_lock(self) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def __enter__(self) -> "InterProcessLock":
+        self._file = open(self.path, "a+b")
+        deadline = time.monotonic() + self.timeout
+        while not self._try_lock():
+            if time.monotonic() >= deadline:
+                self._file.close()
+                self._file = None
+                raise TimeoutError(f"等待文件锁超时({self.timeout}s): {self.path}")
+            time.sleep(self.poll_interval)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+
 class HumanBodyPartsMiddleware:
     """
     人体部件中间件 - 负责前后端数据同步
     """
-    
-    def __init__(self):
-        self.temp_dir = Path(tempfile.gettempdir()) / "comfyui_human_body_parts"
-        self.temp_dir.mkdir(exist_ok=True)
-        self.config_file = self.temp_dir / "config.json"
-        logger.info(f"🔧 中间件初始化完成，配置文件路径: {self.config_file}")
-    
+
+    # 等待其他进程释放锁的最长时间（秒）
+    LOCK_TIMEOUT = 5.0
+    # 后台写入的最小间隔（秒），即落盘频率上限
+    FLUSH_INTERVAL = 0.25
+    # 每次从数据库版本时钟预留的版本号数量
+    VERSION_BLOCK = 1024
+
+    # 保留策略
+    RETENTION_MAX_NODES = 1000          # 最多保留的节点数（按最近访问淘汰）
+    RETENTION_TTL = 7 * 24 * 3600       # 超过该时间（秒）未访问的节点被淘汰
+    ABSENT_NODE_GRACE = 3600            # 不在当前工作流中且超过该时间（秒）未访问的节点被清理
+    EVICTION_INTERVAL = 30.0            # 空闲时执行淘汰的间隔（秒）
+    EVICTION_BATCH = 200                # 每轮最多淘汰的节点数
+
+    # 部件配置数组 [x, y, width, height, strength, rotation] 的字段名，用于增量同步
+    PART_FIELDS = ("x", "y", "width", "height", "strength", "rotation")
+    # 可补丁的部件ID，与 HumanBodyPartsConditioning.BODY_PARTS 一致
+    PART_IDS = (
+        "head", "neck", "torso",
+        "left_upper_arm", "left_forearm", "left_hand",
+        "right_upper_arm", "right_forearm", "right_hand",
+        "left_thigh", "left_calf", "left_foot",
+        "right_thigh", "right_calf", "right_foot",
+    )
+
+    def __init__(self, instance_id: Optional[str] = None):
+        self.instance_id = instance_id or _resolve_instance_id()
+        self.base_dir = Path(tempfile.gettempdir()) / "comfyui_human_body_parts"
+        self.temp_dir = self.base_dir / self.instance_id
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self.db_file = self.temp_dir / "config.sqlite3"
+        self.lock_file = self.temp_dir / "config.lock"
+        # 旧版整文件JSON存储（所有实例共享），每个实例首次启动时导入
+        self.legacy_config_file = self.base_dir / "config.json"
+        self._local = threading.local()
+
+        # 写回状态：待写入 / 正在写入的配置，以及统计
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+        # 待写 / 正在写入的配置的版本号，以及从版本时钟预留的号段 [next, end]
+        self._versions: Dict[str, int] = {}
+        self._next_version = 1
+        self._version_block_end = 0
+        self._flusher: Optional[threading.Thread] = None
+        # 当前工作流中的节点ID（由提示词钩子更新），None表示未知
+        self._active_node_ids: Optional[set] = None
+        self._metrics = {
+            "updates_received": 0,
+            "noop_updates": 0,
+            "writes_performed": 0,
+            "flushes": 0,
+            "forced_flushes": 0,
+            "evicted_lru": 0,
+            "evicted_ttl": 0,
+            "purged_absent": 0,
+        }
+
+        try:
+            with InterProcessLock(self.lock_file, self.LOCK_TIMEOUT):
+                self._init_store()
+            # 旧版文件为所有实例共享，迁移使用共享目录下的锁
+            with InterProcessLock(self.base_dir / "config.json.lock", self.LOCK_TIMEOUT):
+                self._migrate_legacy_config()
+        except TimeoutError as e:
+            # 建表是幂等的，锁超时时直接继续，迁移留待下次启动
+            logger.warning(f"⚠️ {e}")
+            self._init_store()
+        # 后台线程在初始化时启动，只读的存储也会按保留策略定期淘汰
+        with self._lock:
+            self._ensure_flusher()
+        logger.info(f"🔧 中间件初始化完成，实例: {self.instance_id}，配置数据库路径: {self.db_file}")
+
+    def _connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接（sqlite3连接不能跨线程共享）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # timeout 即SQLite内部文件锁的有界等待时间
+            conn = sqlite3.connect(str(self.db_file), timeout=self.LOCK_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_store(self) -> None:
+        """创建按节点索引的配置表"""
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS configs ("
+            " node_id TEXT PRIMARY KEY,"
+            " config TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " last_access REAL NOT NULL DEFAULT 0,"
+            " version INTEGER NOT NULL DEFAULT 0"
+            ")"
+        )
+        # 旧表没有 last_access / version 列时补上
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(configs)")}
+        if "last_access" not in columns:
+            conn.execute("ALTER TABLE configs ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+            conn.execute("UPDATE configs SET last_access = updated_at")
+        if "version" not in columns:
+            conn.execute("ALTER TABLE configs ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_configs_last_access ON configs (last_access)")
+        # 全局版本时钟，从已有的最大版本号开始
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value)"
+            " SELECT 'version_clock', COALESCE(MAX(version), 0) FROM configs"
+        )
+
+    def _migrate_legacy_config(self) -> None:
+        """
+        将旧版 config.json 中的配置导入本实例的数据库（调用方持有文件锁）
+
+        旧文件为所有实例共享，导入后保留，其他实例首次启动时同样能导入；
+        是否已导入记录在本实例的 meta 表中，每个实例只导入一次。
+        """
+        if not self.legacy_config_file.exists():
+            return
+
+        try:
+            conn = self._connection()
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone():
+                return
+
+            with open(self.legacy_config_file, 'r', encoding='utf-8') as f:
+                all_configs = json.load(f)
+
+            now = time.time()
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT OR IGNORE INTO configs (node_id, config, updated_at, last_access) VALUES (?, ?, ?, ?)",
+                    [
+                        (str(node_id), json.dumps(config, ensure_ascii=False), now, now)
+                        for node_id, config in all_configs.items()
+                    ],
+                )
+                conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_migrated', ?)", (int(now),))
+
+            logger.info(f"📦 已导入旧版配置文件: {len(all_configs)} 个节点")
+
+        except Exception as e:
+            logger.warning(f"⚠️ 旧版配置迁移失败，保留原文件: {e}")
+
+    @staticmethod
+    def _digest(config: Dict[str, Any]) -> str:
+        """配置的规范化JSON，用于识别内容未变化的保存"""
+        return json.dumps(config, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+    def _allocate_version(self) -> int:
+        """
+        分配一个新版本号（调用方持有 self._lock）
+
+        号段用完时在文件锁内推进数据库版本时钟，预留下一段 VERSION_BLOCK 个版本号。
+        """
+        if self._next_version > self._version_block_end:
+            with InterProcessLock(self.lock_file, self.LOCK_TIMEOUT):
+                conn = self._connection()
+                with conn:
+                    conn.execute("BEGIN")
+                    conn.execute(
+                        "UPDATE meta SET value = value + ? WHERE key = 'version_clock'", (self.VERSION_BLOCK,)
+                    )
+                    end = conn.execute("SELECT value FROM meta WHERE key = 'version_clock'").fetchone()[0]
+            self._next_version, self._version_block_end = end - self.VERSION_BLOCK + 1, end
+        version = self._next_version
+        self._next_version += 1
+        return version
+
+    def _write_configs(self, configs: Dict[str, Dict[str, Any]], versions: Dict[str, int]) -> Tuple[int, int]:
+        """
+        在一个事务中写入多个节点的配置
+
+        在文件锁内与已存储的配置比较：内容相同的只记录访问时间并保留已存储的版本号，
+        内容变化的连同保存时分配的版本号一起写入。
+
+        Returns:
+            (写入的节点数, 内容未变化的节点数)
+        """
+        now = time.time()
+        written = unchanged = 0
+        # 写入方通过文件锁排队（细粒度轮询），避免SQLite忙等待退避造成的长尾延迟
+        with InterProcessLock(self.lock_file, self.LOCK_TIMEOUT):
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN")
+                for node_id, config in configs.items():
+                    row = conn.execute("SELECT config FROM configs WHERE node_id = ?", (node_id,)).fetchone()
+                    if row and self._digest(json.loads(row[0])) == self._digest(config):
+                        conn.execute("UPDATE configs SET last_access = ? WHERE node_id = ?", (now, node_id))
+                        unchanged += 1
+                        continue
+                    conn.execute(
+                        "INSERT OR REPLACE INTO configs (node_id, config, updated_at, last_access, version)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (node_id, json.dumps(config, ensure_ascii=False), now, now, versions[node_id]),
+                    )
+                    written += 1
+        return written, unchanged
+
+    def _ensure_flusher(self) -> None:
+        """按需启动后台写入线程（调用方持有 self._lock）"""
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="HumanBodyPartsFlusher", daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        """
+        后台循环：有待写配置时合并写入，两次写入之间至少间隔 FLUSH_INTERVAL；
+        每轮顺带执行一步增量淘汰，空闲时每 EVICTION_INTERVAL 执行一次
+        """
+        while True:
+            with self._wakeup:
+                if not self._pending:
+                    self._wakeup.wait(timeout=self.EVICTION_INTERVAL)
+            self.flush()
+            try:
+                self.evict_step()
+            except Exception as e:
+                logger.error(f"❌ 配置淘汰失败: {e}")
+            time.sleep(self.FLUSH_INTERVAL)
+
+    def evict_step(self, batch_size: Optional[int] = None) -> int:
+        """
+        执行一步增量淘汰：依次处理访问超时、不在当前工作流中、超出节点数上限的配置，
+        每步最多删除 batch_size 个节点
+
+        删除时要求节点的最近访问时间未晚于选中时读到的值：选中之后被写入或读取的节点
+        （包括本进程的强制写入以及其他进程的写入）不会被删除。
+
+        Args:
+            batch_size: 本步最多删除的节点数，默认 EVICTION_BATCH
+
+        Returns:
+            本步删除的节点数
+        """
+        budget = batch_size or self.EVICTION_BATCH
+        now = time.time()
+        with self._lock:
+            protected = set(self._pending) | set(self._inflight)
+            active_node_ids = self._active_node_ids
+
+        conn = self._connection()
+        removed = {"evicted_ttl": [], "purged_absent": [], "evicted_lru": []}
+        # 选中时读到的最近访问时间
+        seen_access: Dict[str, float] = {}
+
+        # 1. 访问超时
+        rows = conn.execute(
+            "SELECT node_id, last_access FROM configs WHERE last_access < ? LIMIT ?",
+            (now - self.RETENTION_TTL, budget),
+        ).fetchall()
+        seen_access.update(rows)
+        removed["evicted_ttl"] = [row[0] for row in rows if row[0] not in protected]
+        budget -= len(removed["evicted_ttl"])
+
+        # 2. 不在当前工作流中（超过宽限期未访问，避免误删其他标签页的工作流）
+        if budget > 0 and active_node_ids is not None:
+            rows = conn.execute(
+                "SELECT node_id, last_access FROM configs WHERE last_access < ? ORDER BY last_access",
+                (now - self.ABSENT_NODE_GRACE,),
+            ).fetchall()
+            seen_access.update(rows)
+            removed["purged_absent"] = [
+                row[0] for row in rows
+                if row[0] not in active_node_ids and row[0] not in protected
+                and row[0] not in removed["evicted_ttl"]
+            ][:budget]
+            budget -= len(removed["purged_absent"])
+
+        # 3. 超出节点数上限时按最近访问时间淘汰
+        if budget > 0:
+            total = conn.execute("SELECT COUNT(*) FROM configs").fetchone()[0]
+            excess = total - self.RETENTION_MAX_NODES - len(removed["evicted_ttl"]) - len(removed["purged_absent"])
+            if excess > 0:
+                already = set(removed["evicted_ttl"]) | set(removed["purged_absent"])
+                rows = conn.execute(
+                    "SELECT node_id, last_access FROM configs ORDER BY last_access LIMIT ?",
+                    (min(excess, budget) + len(already) + len(protected),),
+                ).fetchall()
+                seen_access.update(rows)
+                removed["evicted_lru"] = [
+                    row[0] for row in rows if row[0] not in already and row[0] not in protected
+                ][:min(excess, budget)]
+
+        if not any(removed.values()):
+            return 0
+
+        with InterProcessLock(self.lock_file, self.LOCK_TIMEOUT):
+            with conn:
+                conn.execute("BEGIN")
+                for key, ids in removed.items():
+                    removed[key] = [
+                        node_id for node_id in ids
+                        if conn.execute(
+                            "DELETE FROM configs WHERE node_id = ? AND last_access <= ?",
+                            (node_id, seen_access[node_id]),
+                        ).rowcount
+                    ]
+        node_ids = [node_id for ids in removed.values() for node_id in ids]
+        if not node_ids:
+            return 0
+
+        # 被淘汰的节点版本号变为0，重新保存时取得新的版本号
+        with self._lock:
+            for key, ids in removed.items():
+                self._metrics[key] += len(ids)
+        logger.info(
+            f"🧹 配置淘汰: 超时 {len(removed['evicted_ttl'])}, 不在工作流 {len(removed['purged_absent'])}, "
+            f"超出上限 {len(removed['evicted_lru'])}"
+        )
+        return len(node_ids)
+
+    def set_active_nodes(self, node_ids: Iterable[str]) -> None:
+        """
+        设置当前工作流中的节点ID，不在其中的节点配置会在宽限期后被清理
+
+        Args:
+            node_ids: 当前工作流中的节点ID
+        """
+        with self._lock:
+            self._active_node_ids = {str(node_id) for node_id in node_ids}
+
+    def flush(self, node_ids: Optional[Iterable[str]] = None, forced: bool = False) -> int:
+        """
+        将待写配置写入数据库
+
+        Args:
+            node_ids: 只写入这些节点，None表示全部
+            forced: 是否为执行前的强制写入（仅用于统计）
+
+        Returns:
+            写入的节点数
+        """
+        with self._flush_lock:
+            with self._lock:
+                if node_ids is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    batch = {
+                        node_id: self._pending.pop(node_id)
+                        for node_id in map(str, node_ids) if node_id in self._pending
+                    }
+                self._inflight = batch
+                versions = {node_id: self._versions[node_id] for node_id in batch}
+
+            if not batch:
+                return 0
+
+            written = None
+            try:
+                written, unchanged = self._write_configs(batch, versions)
+                with self._lock:
+                    self._metrics["writes_performed"] += written
+                    self._metrics["noop_updates"] += unchanged
+                    self._metrics["flushes"] += 1
+                    if forced:
+                        self._metrics["forced_flushes"] += 1
+                logger.debug(f"💾 配置写入完成: {written} 个节点, 未变化 {unchanged} 个")
+                return written
+
+            except Exception as e:
+                # 写入失败时放回待写队列（不覆盖期间收到的更新），等待下次重试
+                with self._lock:
+                    for node_id, config in batch.items():
+                        self._pending.setdefault(node_id, config)
+                logger.error(f"❌ 配置写入失败: {e}")
+                return 0
+
+            finally:
+                with self._lock:
+                    self._inflight = {}
+                    if written is not None:
+                        # 已落盘：版本号改由数据库提供（写入期间再次保存的节点保留新的版本号）
+                        for node_id, version in versions.items():
+                            if node_id not in self._pending and self._versions.get(node_id) == version:
+                                del self._versions[node_id]
+
     def save_config(self, node_id: str, config: Dict[str, Any]) -> bool:
         """
-        保存配置到临时文件
-        
+        保存单个节点的配置
+
+        立即更新内存中的待写状态并分配版本号，由后台线程合并写入数据库。
+        与待写配置相同的保存直接忽略；写入时内容与已存储配置相同的不会产生写入，
+        节点保留已存储的版本号。
+
         Args:
             node_id: 节点ID
             config: 配置数据
-            
+
         Returns:
             是否保存成功
         """
         try:
-            # 读取现有配置
-            all_configs = {}
-            if self.config_file.exists():
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    all_configs = json.load(f)
-            
-            # 更新配置
-            all_configs[node_id] = config
-            
-            # 写入文件
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(all_configs, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"✅ 配置保存成功: 节点ID={node_id}")
+            node_id = str(node_id)
+            with self._lock:
+                self._metrics["updates_received"] += 1
+                current = self._pending.get(node_id, self._inflight.get(node_id))
+                if current is not None and self._digest(current) == self._digest(config):
+                    self._metrics["noop_updates"] += 1
+                    return True
+                self._pending[node_id] = config
+                self._versions[node_id] = self._allocate_version()
+                self._ensure_flusher()
+                self._wakeup.notify()
+            logger.debug(f"✅ 配置已更新: 节点ID={node_id}")
             return True
-            
+
         except Exception as e:
             logger.error(f"❌ 配置保存失败: {e}")
             return False
-    
+
+    def _apply_patch(self, config: Dict[str, Any], patch: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """
+        将部件补丁应用到配置副本
+
+        补丁格式为 {部件ID: {字段名: 值}}，部件ID见 PART_IDS，字段名见 PART_FIELDS；
+        部件值为完整数组时整体替换该部件。只复制被修改的部件，开销与补丁大小成正比。
+
+        Returns:
+            (新配置, 内容是否变化)
+
+        Raises:
+            ValueError: 补丁格式无效
+        """
+        if not isinstance(patch, dict):
+            raise ValueError("补丁必须是 {部件ID: {字段名: 值}} 对象")
+        patched = dict(config)
+        changed = False
+        for part_id, fields in patch.items():
+            if part_id not in self.PART_IDS:
+                raise ValueError(f"未知的部件ID: {part_id}")
+            if isinstance(fields, list):
+                if len(fields) != len(self.PART_FIELDS):
+                    raise ValueError(f"部件 {part_id} 的配置长度应为 {len(self.PART_FIELDS)}")
+                changed = changed or patched.get(part_id) != fields
+                patched[part_id] = list(fields)
+                continue
+            if not isinstance(fields, dict) or part_id not in patched:
+                raise ValueError(f"无法对部件 {part_id} 应用补丁")
+            values = list(patched[part_id])
+            for field, value in fields.items():
+                if field not in self.PART_FIELDS:
+                    raise ValueError(f"未知的部件字段: {field}")
+                index = self.PART_FIELDS.index(field)
+                changed = changed or values[index] != value
+                values[index] = value
+            patched[part_id] = values
+        return patched, changed
+
+    def patch_config(
+        self, node_id: str, base_version: int, patch: Dict[str, Any]
+    ) -> Tuple[bool, int, Optional[Dict[str, Any]]]:
+        """
+        以补丁方式更新单个节点的配置
+
+        补丁应用到内存中的当前配置（待写配置，或从数据库读取），结果与 save_config 一样
+        进入待写状态并分配新版本号，由后台线程合并写入。只有 base_version 与当前版本号
+        一致时才应用补丁。
+
+        Args:
+            node_id: 节点ID
+            base_version: 补丁基于的版本号
+            patch: {部件ID: {字段名: 值}}
+
+        Returns:
+            (是否应用, 当前版本号, 配置)；版本不一致时返回服务器当前配置供前端整体同步
+
+        Raises:
+            ValueError: 补丁格式无效
+        """
+        node_id = str(node_id)
+        with self._lock:
+            current = self._pending.get(node_id, self._inflight.get(node_id))
+            if current is not None:
+                version = self._versions[node_id]
+            else:
+                row = self._connection().execute(
+                    "SELECT config, version FROM configs WHERE node_id = ?", (node_id,)
+                ).fetchone()
+                current, version = (json.loads(row[0]), row[1]) if row else ({}, 0)
+            if base_version != version:
+                return False, version, current
+
+            config, changed = self._apply_patch(current, patch)
+            self._metrics["updates_received"] += 1
+            if not changed:
+                self._metrics["noop_updates"] += 1
+                return True, version, current
+
+            version = self._allocate_version()
+            self._pending[node_id] = config
+            self._versions[node_id] = version
+            self._ensure_flusher()
+            self._wakeup.notify()
+        logger.debug(f"✅ 配置补丁已应用: 节点ID={node_id}, 版本={version}")
+        return True, version, config
+
+    def _read_config(self, node_id: str, touch: bool = False) -> Optional[Dict[str, Any]]:
+        """从数据库读取节点配置，touch 为真时记录访问时间"""
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT config FROM configs WHERE node_id = ?", (node_id,)
+        ).fetchone()
+        if not row:
+            return None
+        if touch:
+            # 记录访问时间，供保留策略使用
+            conn.execute("UPDATE configs SET last_access = ? WHERE node_id = ?", (time.time(), node_id))
+        return json.loads(row[0])
+
+    def get_config_version(self, node_id: str) -> int:
+        """
+        获取节点配置的版本号，不解析配置内容
+
+        节点有待写配置时返回保存时分配的版本号，不触发写入；否则读取数据库中的版本列。
+
+        Args:
+            node_id: 节点ID
+
+        Returns:
+            版本号，节点没有配置时为0
+        """
+        node_id = str(node_id)
+        with self._lock:
+            version = self._versions.get(node_id)
+        if version is not None:
+            return version
+        try:
+            row = self._connection().execute(
+                "SELECT version FROM configs WHERE node_id = ?", (node_id,)
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"❌ 配置版本读取失败: {e}")
+            return 0
+        return row[0] if row else 0
+
     def load_config(self, node_id: str) -> Optional[Dict[str, Any]]:
         """
-        从临时文件加载配置
-        
+        加载单个节点的配置
+
+        节点有待写配置时先强制写入，保证执行使用的配置已经落盘。
+
         Args:
             node_id: 节点ID
-            
+
         Returns:
             配置数据或None
         """
         try:
-            if not self.config_file.exists():
-                logger.warning("⚠️ 配置文件不存在")
-                return None
-            
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                all_configs = json.load(f)
-            
-            config = all_configs.get(node_id)
+            node_id = str(node_id)
+            with self._lock:
+                config = self._pending.get(node_id, self._inflight.get(node_id))
+                has_pending = node_id in self._pending
+
+            if has_pending:
+                self.flush([node_id], forced=True)
+
+            if config is None:
+                config = self._read_config(node_id, touch=True)
+
             if config:
                 logger.info(f"✅ 配置加载成功: 节点ID={node_id}")
                 return config
             else:
                 logger.warning(f"⚠️ 节点配置不存在: {node_id}")
                 return None
-                
+
         except Exception as e:
             logger.error(f"❌ 配置加载失败: {e}")
             return None
-    
+
     def clear_config(self, node_id: Optional[str] = None) -> bool:
         """
         清除配置
-        
+
         Args:
             node_id: 节点ID，如果为None则清除所有配置
-            
+
         Returns:
             是否清除成功
         """
         try:
-            if node_id is None:
-                # 清除所有配置
-                if self.config_file.exists():
-                    self.config_file.unlink()
-                logger.info("🗑️ 所有配置已清除")
-            else:
-                # 清除特定节点配置
-                if self.config_file.exists():
-                    with open(self.config_file, 'r', encoding='utf-8') as f:
-                        all_configs = json.load(f)
-                    
-                    if node_id in all_configs:
-                        del all_configs[node_id]
-                        
-                        with open(self.config_file, 'w', encoding='utf-8') as f:
-                            json.dump(all_configs, f, ensure_ascii=False, indent=2)
-                        
+            # 等待正在进行的写入完成，避免其在删除之后落盘
+            with self._flush_lock:
+                conn = self._connection()
+                # 被清除的节点版本号变为0，重新保存时从全局版本时钟取得新的版本号
+                if node_id is None:
+                    # 清除所有配置（只影响当前实例）
+                    with self._lock:
+                        self._pending.clear()
+                        self._versions.clear()
+                    conn.execute("DELETE FROM configs")
+                    logger.info("🗑️ 所有配置已清除")
+                else:
+                    # 清除特定节点配置
+                    with self._lock:
+                        had_pending = self._pending.pop(str(node_id), None) is not None
+                        self._versions.pop(str(node_id), None)
+                    cursor = conn.execute("DELETE FROM configs WHERE node_id = ?", (str(node_id),))
+                    if cursor.rowcount or had_pending:
                         logger.info(f"🗑️ 节点配置已清除: {node_id}")
-            
+
             return True
-            
+
         except Exception as e:
             logger.error(f"❌ 配置清除失败: {e}")
             return False
 
+    def get_metrics(self) -> Dict[str, int]:
+        """
+        获取写回统计
+
+        Returns:
+            收到的更新数、内容未变化的更新数、实际写入行数、写入事务数、强制写入次数、当前待写节点数
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["pending"] = len(self._pending)
+        metrics["coalesced"] = (
+            metrics["updates_received"] - metrics["noop_updates"]
+            - metrics["writes_performed"] - metrics["pending"]
+        )
+        return metrics
+
 # 全局中间件实例
 _middleware = HumanBodyPartsMiddleware()
+# 进程退出前写入剩余的待写配置
+atexit.register(_middleware.flush)
 
 def save_body_parts_config(node_id: str, config: Dict[str, Any]) -> bool:
     """保存身体部件配置"""
@@ -135,6 +760,91 @@ def load_body_parts_config(node_id: str) -> Optional[Dict[str, Any]]:
     """加载身体部件配置"""
     return _middleware.load_config(node_id)
 
+def patch_body_parts_config(
+    node_id: str, base_version: int, patch: Dict[str, Any]
+) -> Tuple[bool, int, Optional[Dict[str, Any]]]:
+    """以补丁方式更新身体部件配置"""
+    return _middleware.patch_config(node_id, base_version, patch)
+
+def get_body_parts_config_version(node_id: str) -> int:
+    """获取身体部件配置版本号"""
+    return _middleware.get_config_version(node_id)
+
 def clear_body_parts_config(node_id: Optional[str] = None) -> bool:
     """清除身体部件配置"""
-    return _middleware.clear_config(node_id) 
\ No newline at end of file
+    return _middleware.clear_config(node_id)
+
+def flush_body_parts_config(node_ids: Optional[Iterable[str]] = None) -> int:
+    """强制写入身体部件配置"""
+    return _middleware.flush(node_ids)
+
+def get_body_parts_middleware_metrics() -> Dict[str, int]:
+    """获取中间件写回统计"""
+    return _middleware.get_metrics()
+
+def set_active_body_parts_nodes(node_ids: Iterable[str]) -> None:
+    """设置当前工作流中的节点ID（用于清理已删除节点的配置）"""
+    _middleware.set_active_nodes(node_ids)
+
+def _flush_before_prompt(json_data: Dict[str, Any]) -> Dict[str, Any]:
+    """提示词入队前强制写入其中人体部件节点的配置，并记录当前工作流中的节点"""
+    try:
+        prompt = json_data.get("prompt", {})
+        workflow = (json_data.get("extra_data") or {}).get("extra_pnginfo", {}).get("workflow") or {}
+        workflow_node_ids = {str(node.get("id")) for node in workflow.get("nodes", []) if isinstance(node, dict)}
+        if workflow_node_ids:
+            _middleware.set_active_nodes(workflow_node_ids | set(prompt.keys()))
+
+        node_ids = [
+            node_id for node_id, node in prompt.items()
+            if isinstance(node, dict) and node.get("class_type") == "HumanBodyPartsConditioning"
+        ]
+        if node_ids:
+            _middleware.flush(node_ids, forced=True)
+    except Exception as e:
+        logger.error(f"❌ 提示词执行前写入配置失败: {e}")
+    return json_data
+
+# 注册前端同步路由与提示词钩子（仅在ComfyUI服务器环境中可用）
+try:
+    from server import PromptServer
+    from aiohttp import web
+
+    # 中间件调用可能等待文件锁或读取数据库，放到线程池中执行，不阻塞事件循环
+    def _save_config_with_version(node_id: str, config: Dict[str, Any]) -> Tuple[bool, int]:
+        return _middleware.save_config(node_id, config), _middleware.get_config_version(node_id)
+
+    @PromptServer.instance.routes.post("/human_body_parts/save_config")
+    async def _save_config_route(request):
+        data = await request.json()
+        ok, version = await asyncio.get_running_loop().run_in_executor(
+            None, _save_config_with_version, str(data.get("node_id", "default_node")), data.get("config") or {}
+        )
+        return web.json_response({"success": ok, "version": version})
+
+    @PromptServer.instance.routes.post("/human_body_parts/patch_config")
+    async def _patch_config_route(request):
+        data = await request.json()
+        try:
+            applied, version, config = await asyncio.get_running_loop().run_in_executor(
+                None,
+                _middleware.patch_config,
+                str(data.get("node_id", "default_node")),
+                int(data.get("base_version", -1)),
+                data.get("patch") or {},
+            )
+        except (TypeError, ValueError) as e:
+            return web.json_response({"success": False, "error": str(e)}, status=400)
+        if not applied:
+            # 版本不一致：返回当前配置，前端回退为整体同步
+            return web.json_response({"success": False, "version": version, "config": config}, status=409)
+        return web.json_response({"success": True, "version": version})
+
+    @PromptServer.instance.routes.get("/human_body_parts/metrics")
+    async def _metrics_route(request):
+        return web.json_response(_middleware.get_metrics())
+
+    PromptServer.instance.add_on_prompt_handler(_flush_before_prompt)
+
+except Exception as e:
+    logger.debug(f"未注册人体部件中间件路由: {e}")
\ No newline at end of file
@@ -0,0 +1,220 @@
+"""
+分阶段耗时统计
+供 FluxKontextNode 与 MultiImageAreaEditor 使用
+
+每次执行用 StageTimer 以单调高精度时钟（time.perf_counter）记录各阶段耗时，
+结果写入节点元数据，同时汇总到进程级直方图（count / p50 / p95 / p99）。
+直方图使用对数分桶（相对误差约2.5%），内存占用与样本数无关。
+
+汇总结果可通过 GET /dave/stage_timings 查询（?reset=1 查询后清空），
+或调用 dump_stage_timings 写入JSON文件；设置环境变量 DAVE_STAGE_TIMINGS_FILE 时
+进程退出前自动写入该文件。
+
+Created: 2025-01-27
+Author: Davemane42
+"""
+
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StageHistogram:
+    """
+    对数分桶的耗时直方图
+
+    桶 i 覆盖 [MIN_SECONDS * GROWTH^i, MIN_SECONDS * GROWTH^(i+1))，
+    百分位取所在桶的几何中点。
+    """
+
+    MIN_SECONDS = 1e-6
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        """记录一个样本（秒）"""
+        index = 0
+        if seconds > self.MIN_SECONDS:
+            index = int(math.log(seconds / self.MIN_SECONDS, self.GROWTH))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        """
+        估算百分位（秒）
+
+        Args:
+            fraction: 0-1 之间的分位
+
+        Returns:
+            估算值，限制在实际最小/最大值之间
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                estimate = self.MIN_SECONDS * self.GROWTH ** (index + 0.5)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """汇总统计（毫秒）"""
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class StageTimingRegistry:
+    """进程级的分阶段耗时直方图集合（线程安全）"""
+
+    def __init__(self):
+        self._histograms: Dict[str, StageHistogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        """记录一个阶段样本"""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = StageHistogram()
+            histogram.record(seconds)
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Dict[str, float]]:
+        """
+        获取所有阶段的汇总统计
+
+        Args:
+            reset: 获取后是否清空
+
+        Returns:
+            {阶段名: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}}
+        """
+        with self._lock:
+            result = {name: self._histograms[name].summary() for name in sorted(self._histograms)}
+            if reset:
+                self._histograms.clear()
+        return result
+
+
+_registry = StageTimingRegistry()
+
+
+class StageTimer:
+    """
+    单次执行的分阶段计时器
+
+    用法::
+
+        timer = StageTimer("flux_kontext")
+        with timer.stage("preprocess"):
+            ...
+        metadata["stage_timings_ms"] = timer.finish()
+    """
+
+    def __init__(self, component: str):
+        self.component = component
+        self.timings: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """计时一个阶段，同名阶段多次进入时累加"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def elapsed(self) -> float:
+        """从创建到现在的总耗时（秒）"""
+        return time.perf_counter() - self._start
+
+    def finish(self) -> Dict[str, float]:
+        """
+        结束计时：把各阶段与总耗时写入进程级直方图
+
+        Returns:
+            {阶段名: 毫秒}，包含 total
+        """
+        self.timings["total"] = self.elapsed()
+        for name, seconds in self.timings.items():
+            _registry.record(f"{self.component}.{name}", seconds)
+        return {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()}
+
+
+def get_stage_timings(reset: bool = False) -> Dict[str, Dict[str, float]]:
+    """获取进程级分阶段耗时汇总"""
+    return _registry.snapshot(reset)
+
+
+def dump_stage_timings(path: Optional[str] = None) -> Optional[str]:
+    """
+    把分阶段耗时汇总写入JSON文件
+
+    Args:
+        path: 文件路径，默认读取环境变量 DAVE_STAGE_TIMINGS_FILE
+
+    Returns:
+        写入的路径；未指定路径时返回 None
+    """
+    path = path or os.environ.get("DAVE_STAGE_TIMINGS_FILE")
+    if not path:
+        return None
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(target.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"generated_at": time.time(), "stages": get_stage_timings()}, f, indent=2)
+    os.replace(tmp_path, target)
+    return str(target)
+
+
+def _dump_at_exit() -> None:
+    try:
+        dump_stage_timings()
+    except Exception as e:
+        logger.error(f"❌ 写入分阶段耗时统计失败: {e}")
+
+
+atexit.register(_dump_at_exit)
+
+# 注册查询路由（仅在ComfyUI服务器环境中可用）
+try:
+    from server import PromptServer
+    from aiohttp import web
+
+    @PromptServer.instance.routes.get("/dave/stage_timings")
+    async def _stage_timings_route(request):
+        reset = request.query.get("reset") in ("1", "true")
+        return web.json_response(get_stage_timings(reset))
+
+except Exception as e:
+    logger.debug(f"未注册分阶段耗时路由: {e}")
@@ -0,0 +1,323 @@
+"""
+张量指纹与内容寻址结果缓存
+供 mask_resampling、FluxKontextNode 等模块使用
+
+指纹为张量形状、dtype与内容的 blake2b 哈希，并按张量对象（弱引用 + 版本号）记忆，
+同一张量重复使用时不会重新计算哈希。推理张量（torch.inference_mode 下创建，ComfyUI
+执行节点时即是如此）没有版本号，无法判断是否被原地修改，每次都重新计算哈希。
+
+TensorResultCache 以 (指纹 + 规范化参数) 的摘要为键缓存结果，分两层：
+- 内存层：按字节预算的LRU
+- 磁盘层（可选）：torch.save 文件，读取时内存映射（torch.load(mmap=True)），
+  按字节预算淘汰最久未访问的条目，写入通过临时文件原子替换
+
+缓存返回的张量会被多次复用，调用方不得原地修改。
+
+Created: 2025-01-27
+Author: Davemane42
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class TensorFingerprinter:
+    """
+    按内容计算张量指纹，并按张量对象记忆结果
+    """
+
+    def __init__(self):
+        # id(张量) -> (弱引用, 版本号, 指纹)
+        self._fingerprints: Dict[int, Tuple[weakref.ref, int, str]] = {}
+        self._lock = threading.Lock()
+
+    def fingerprint(self, tensor: torch.Tensor) -> str:
+        """
+        计算张量内容指纹
+
+        同一张量对象在未被原地修改（版本号不变）时复用上次的指纹；
+        推理张量不记录版本号，不做记忆。
+
+        Args:
+            tensor: 任意张量
+
+        Returns:
+            形状、dtype与内容的哈希
+        """
+        memoize = not tensor.is_inference()
+        key = id(tensor)
+        if memoize:
+            with self._lock:
+                entry = self._fingerprints.get(key)
+            if entry is not None and entry[0]() is tensor and entry[1] == tensor._version:
+                return entry[2]
+
+        data = tensor.detach()
+        if data.device.type != "cpu":
+            data = data.cpu()
+        data = data.contiguous()
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{tuple(data.shape)}|{data.dtype}".encode())
+        digest.update(memoryview(data.view(-1).view(torch.uint8).numpy()))
+        fingerprint = digest.hexdigest()
+        if not memoize:
+            return fingerprint
+
+        with self._lock:
+            self._fingerprints[key] = (
+                weakref.ref(tensor, lambda _, key=key: self._fingerprints.pop(key, None)),
+                tensor._version,
+                fingerprint,
+            )
+        return fingerprint
+
+    def clear(self) -> None:
+        """清空记忆的指纹"""
+        with self._lock:
+            self._fingerprints.clear()
+
+
+# 全局共享指纹器
+_fingerprinter = TensorFingerprinter()
+
+
+def fingerprint_tensor(tensor: Optional[torch.Tensor]) -> Optional[str]:
+    """计算张量内容指纹（共享记忆），None 返回 None"""
+    if tensor is None:
+        return None
+    return _fingerprinter.fingerprint(tensor)
+
+
+def make_cache_key(namespace: str, tensors: Dict[str, Optional[torch.Tensor]], params: Dict[str, Any]) -> str:
+    """
+    由张量指纹与规范化参数生成缓存键
+
+    Args:
+        namespace: 键空间（例如节点名与版本）
+        tensors: 参与键的张量（可为 None）
+        params: 参与键的参数（需可JSON序列化）
+
+    Returns:
+        键摘要
+    """
+    payload = {
+        "namespace": namespace,
+        "tensors": {name: fingerprint_tensor(tensor) for name, tensor in tensors.items()},
+        "params": params,
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=20).hexdigest()
+
+
+def _entry_nbytes(value: Dict[str, Any]) -> int:
+    """条目中张量占用的字节数"""
+    return sum(v.numel() * v.element_size() for v in value.values() if isinstance(v, torch.Tensor))
+
+
+class TensorResultCache:
+    """
+    两层内容寻址结果缓存（内存LRU + 可选磁盘层）
+
+    条目为 {名称: 张量或基本类型} 字典。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        memory_budget: int = 512 * 1024 * 1024,
+        disk_budget: int = 4 * 1024 * 1024 * 1024,
+        disk_dir: Optional[Path] = None,
+    ):
+        self.name = name
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.disk_dir = disk_dir or Path(tempfile.gettempdir()) / "comfyui_dave_cache" / name
+        self._memory: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._memory_bytes = 0
+        # 磁盘索引：键 -> (字节数, 最近访问时间)，首次使用磁盘层时扫描目录建立
+        self._disk_index: Optional[Dict[str, Tuple[int, float]]] = None
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evicted_memory": 0, "evicted_disk": 0}
+
+    # ------------------------------------------------------------------
+    # 内存层
+    # ------------------------------------------------------------------
+
+    def _memory_put(self, key: str, value: Dict[str, Any]) -> None:
+        """写入内存层并按预算淘汰（调用方持有 self._lock）"""
+        nbytes = _entry_nbytes(value)
+        if nbytes > self.memory_budget:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous[1]
+        self._memory[key] = (value, nbytes)
+        self._memory_bytes += nbytes
+        while self._memory_bytes > self.memory_budget:
+            _, (_, evicted_bytes) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_bytes
+            self._stats["evicted_memory"] += 1
+
+    # ------------------------------------------------------------------
+    # 磁盘层
+    # ------------------------------------------------------------------
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.pt"
+
+    def _ensure_disk_index(self) -> Dict[str, Tuple[int, float]]:
+        """扫描磁盘目录建立索引（调用方持有 self._lock）"""
+        if self._disk_index is None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            index = {}
+            for path in self.disk_dir.glob("*.pt"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                index[path.stem] = (stat.st_size, stat.st_mtime)
+            self._disk_index = index
+            self._disk_bytes = sum(size for size, _ in index.values())
+        return self._disk_index
+
+    def _disk_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            index = self._ensure_disk_index()
+            if key not in index:
+                return None
+            size = index[key][0]
+            index[key] = (size, time.time())
+        path = self._disk_path(key)
+        try:
+            value = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+            os.utime(path)
+        except Exception as e:
+            logger.warning(f"⚠️ 读取磁盘缓存失败 {path.name}: {e}")
+            with self._lock:
+                dropped = self._disk_index.pop(key, None)
+                if dropped is not None:
+                    self._disk_bytes -= dropped[0]
+            return None
+        return value
+
+    def _disk_put(self, key: str, value: Dict[str, Any]) -> None:
+        path = self._disk_path(key)
+        with self._lock:
+            index = self._ensure_disk_index()
+            if key in index:
+                return
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        cpu_value = {k: (v.detach().cpu().contiguous() if isinstance(v, torch.Tensor) else v) for k, v in value.items()}
+        torch.save(cpu_value, tmp_path)
+        size = tmp_path.stat().st_size
+        if size > self.disk_budget:
+            tmp_path.unlink(missing_ok=True)
+            return
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            index[key] = (size, time.time())
+            self._disk_bytes += size
+            victims = []
+            if self._disk_bytes > self.disk_budget:
+                for victim_key, (victim_size, _) in sorted(index.items(), key=lambda item: item[1][1]):
+                    if self._disk_bytes <= self.disk_budget:
+                        break
+                    if victim_key == key:
+                        continue
+                    del index[victim_key]
+                    self._disk_bytes -= victim_size
+                    victims.append(victim_key)
+            self._stats["evicted_disk"] += len(victims)
+        for victim_key in victims:
+            # 已被映射的文件删除后映射仍然有效
+            self._disk_path(victim_key).unlink(missing_ok=True)
+
+    # ------------------------------------------------------------------
+    # 公共接口
+    # ------------------------------------------------------------------
+
+    def get(self, key: str, use_disk: bool = False) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        查询缓存
+
+        Args:
+            key: 缓存键
+            use_disk: 是否查询磁盘层
+
+        Returns:
+            (条目或None, 状态 "memory_hit" / "disk_hit" / "miss")
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[0], "memory_hit"
+
+        if use_disk:
+            value = self._disk_get(key)
+            if value is not None:
+                with self._lock:
+                    self._memory_put(key, value)
+                    self._stats["disk_hits"] += 1
+                return value, "disk_hit"
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None, "miss"
+
+    def put(self, key: str, value: Dict[str, Any], use_disk: bool = False) -> None:
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: {名称: 张量或基本类型}
+            use_disk: 是否同时写入磁盘层
+        """
+        with self._lock:
+            self._memory_put(key, value)
+            self._stats["stores"] += 1
+        if use_disk:
+            try:
+                self._disk_put(key, value)
+            except Exception as e:
+                logger.error(f"❌ 写入磁盘缓存失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            return {
+                **self._stats,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk_index) if self._disk_index is not None else None,
+                "disk_bytes": self._disk_bytes if self._disk_index is not None else None,
+            }
+
+    def clear(self, disk: bool = False) -> None:
+        """清空内存层（disk=True 时同时删除磁盘文件）"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            keys = list(self._ensure_disk_index()) if disk else []
+            if disk:
+                self._disk_index.clear()
+                self._disk_bytes = 0
+        for key in keys:
+            self._disk_path(key).unlink(missing_ok=True)
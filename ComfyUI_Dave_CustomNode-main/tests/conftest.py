@@ -0,0 +1,72 @@
+"""
+测试公共设置
+
+把包目录注册为命名空间包，不执行包的 __init__.py（它会注册节点和前端扩展）；
+中间件存储放在独立的临时目录中，不影响正在运行的ComfyUI。
+"""
+
+import importlib
+import itertools
+import os
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+import pytest
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent
+PACKAGE_NAME = "dave_custom_nodes"
+
+# 必须在加载 middleware 之前设置
+tempfile.tempdir = tempfile.mkdtemp(prefix="dave_tests_")
+os.environ["COMFYUI_INSTANCE_ID"] = "tests"
+
+if PACKAGE_NAME not in sys.modules:
+    _package = types.ModuleType(PACKAGE_NAME)
+    _package.__path__ = [str(PACKAGE_DIR)]
+    sys.modules[PACKAGE_NAME] = _package
+
+
+def load_module(name: str) -> types.ModuleType:
+    """加载包内模块（支持模块内的相对导入）"""
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
+
+
+@pytest.fixture
+def middleware():
+    """全局中间件模块，测试结束后清除所有配置"""
+    module = load_module("middleware")
+    yield module
+    module.clear_body_parts_config()
+
+
+@pytest.fixture
+def body_parts_module():
+    return load_module("HumanBodyParts")
+
+
+@pytest.fixture
+def flux_kontext_module():
+    return load_module("FluxKontextNode")
+
+
+_store_ids = itertools.count()
+
+
+@pytest.fixture
+def store_factory():
+    """
+    创建使用独立实例目录的中间件
+
+    返回的工厂接受中间件类（默认 HumanBodyPartsMiddleware）与实例ID，
+    相同实例ID的中间件共享同一个存储，模拟同一实例下的多个进程。
+    """
+    module = load_module("middleware")
+    default_instance = f"store{next(_store_ids)}"
+
+    def create(cls=None, instance_id=None):
+        cls = cls or module.HumanBodyPartsMiddleware
+        return cls(instance_id=instance_id or default_instance)
+
+    return create
@@ -0,0 +1,76 @@
+"""
+FluxKontextNode 编辑路径的测试
+
+ComfyUI 在 torch.inference_mode() 下执行节点，输入张量都是推理张量。
+"""
+
+import torch
+
+
+def _edit(module, image, **kwargs):
+    node = module.FluxKontextNode()
+    return node.process_kontext_edit(image, "change the background", "auto", False, 7.0, 4, 123, **kwargs)
+
+
+def test_masked_edit_under_inference_mode(flux_kontext_module):
+    with torch.inference_mode():
+        image = torch.rand(1, 300, 500, 3)
+        mask = torch.ones(1, 300, 500)
+        edited, _, metadata = _edit(flux_kontext_module, image, mask=mask)
+
+    assert "status" not in metadata, metadata.get("error_message")
+    assert tuple(edited.shape) == (1, 752, 1328, 3)
+
+
+def test_result_cache_tiers_under_inference_mode(flux_kontext_module):
+    cache = flux_kontext_module.get_kontext_result_cache()
+    cache.clear(disk=True)
+
+    with torch.inference_mode():
+        image = torch.rand(1, 96, 128, 3)
+        first, _, metadata = _edit(flux_kontext_module, image, result_cache="memory+disk")
+        assert metadata["result_cache"] == "miss"
+
+        hit, _, metadata = _edit(flux_kontext_module, image.clone(), result_cache="memory+disk")
+        assert metadata["result_cache"] == "memory_hit"
+        assert torch.equal(hit, first)
+
+        # 内存层清空后从磁盘层读取
+        cache.clear()
+        hit, _, metadata = _edit(flux_kontext_module, image.clone(), result_cache="memory+disk")
+        assert metadata["result_cache"] == "disk_hit"
+        assert torch.equal(hit, first)
+
+        # 输入被原地修改后不能命中旧结果
+        image[0, 0, 0, 0] += 0.5
+        changed, _, metadata = _edit(flux_kontext_module, image, result_cache="memory+disk")
+        assert metadata["result_cache"] == "miss"
+        assert not torch.equal(changed, first)
+
+
+def test_stitch_edit_unstitch_round_trip(flux_kontext_module):
+    module = flux_kontext_module
+    left = torch.full((1, 300, 500, 3), 0.1)
+    right = torch.full((1, 300, 700, 3), 0.9)
+    stitched, layout = module.FluxKontextImageStitch().stitch_images(left, right, "horizontal", "center", 0)
+
+    # 16:9 的分辨率桶会裁掉 1200x300 画布左右两侧的大部分
+    edited, _, metadata = module.FluxKontextNode().process_kontext_edit(
+        stitched, "change the background", "16:9", False, 7.0, 4, 123
+    )
+    assert metadata["crop_box"] is not None
+
+    (parts,) = module.FluxKontextImageUnstitch().unstitch_images(edited, layout, metadata)
+    assert len(parts) == 2
+
+    # 输出保持源图像的比例
+    for part, source in zip(parts, (left, right)):
+        assert abs(part.shape[2] / part.shape[1] - source.shape[2] / source.shape[1]) < 0.02
+
+    # 左图可见区域只包含左图内容（排除插值边界），被裁掉的部分为0
+    top, crop_left, crop_height, crop_width = metadata["crop_box"]
+    scale = edited.shape[2] / crop_width
+    visible_from = round(crop_left * scale)
+    assert parts[0][:, :, :visible_from].abs().max() == 0
+    assert parts[0][:, :, visible_from:-2].max() < 0.5
+    assert parts[1][:, :, 2:round((crop_left + crop_width - 500) * scale) - 2].min() > 0.5
@@ -0,0 +1,49 @@
+"""
+FluxKontextCachedVAEEncode 缓存的测试（使用计数的替身VAE，在 inference_mode 下执行）
+"""
+
+import json
+
+import torch
+
+from conftest import load_module
+
+
+class StubVAE:
+    """按8倍下采样“编码”的替身VAE，记录 encode 调用次数"""
+
+    def __init__(self):
+        self.first_stage_model = torch.nn.Conv2d(3, 4, 1)
+        self.calls = 0
+
+    def encode(self, pixels):
+        self.calls += 1
+        return pixels[:, ::8, ::8, :].permute(0, 3, 1, 2).mean(1, keepdim=True).repeat(1, 4, 1, 1)
+
+
+def _encode(node, pixels, vae):
+    latent, info = node.encode(pixels, vae, "memory")
+    return latent["samples"], json.loads(info)["status"]
+
+
+def test_repeated_encode_hits_cache_under_inference_mode():
+    module = load_module("FluxKontextLatent")
+    module.get_vae_encode_cache().clear(disk=True)
+    node = module.FluxKontextCachedVAEEncode()
+    vae = StubVAE()
+
+    with torch.inference_mode():
+        pixels = torch.rand(1, 64, 96, 3)
+        statuses = []
+        for _ in range(3):
+            samples, status = _encode(node, pixels.clone(), vae)
+            statuses.append(status)
+        assert statuses == ["miss", "memory_hit", "memory_hit"]
+        assert vae.calls == 1
+        assert tuple(samples.shape) == (1, 4, 8, 12)
+
+        # 图像内容变化后重新编码
+        pixels[0, 0, 0, 0] += 0.5
+        _, status = _encode(node, pixels, vae)
+        assert status == "miss"
+        assert vae.calls == 2
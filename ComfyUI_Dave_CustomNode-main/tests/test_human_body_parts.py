@@ -0,0 +1,146 @@
+"""
+HumanBodyPartsConditioning 读取前端保存配置的测试
+"""
+
+import torch
+
+# 前端 HumanBodyParts.js 保存的配置：只包含拖拽过的部件，使用前端部件ID
+FRONTEND_SAVED_CONFIG = {
+    "face": [175, 15, 50, 40, 1.0, 0.0],
+    "chest": [165, 85, 70, 50, 1.0, 0.0],
+    "spine": [197, 85, 10, 100, 1.0, 0.0],
+    "left_arm": [96, 120, 40, 80, 1.5, 0.0],
+    "head": [168, 8, 72, 56, 1.2, 10.0],
+}
+
+
+def _conditioning():
+    return [(torch.zeros(1, 77, 768), {"pooled_output": torch.zeros(1, 768)})]
+
+
+def test_loads_config_saved_from_frontend(middleware, body_parts_module):
+    node_id = "42"
+    assert middleware.save_body_parts_config(node_id, FRONTEND_SAVED_CONFIG)
+
+    node = body_parts_module.HumanBodyPartsConditioning()
+    conditioning, info, _, _ = node.apply_intelligent_body_parts_conditioning(
+        _conditioning(), 640, 1024, unique_id=node_id, prompt={}
+    )
+
+    assert "错误" not in info
+    entries = {cond_dict["body_part"]: cond_dict for _, cond_dict in conditioning}
+    # 未拖拽的部件使用默认配置，所有部件都有输出
+    assert set(entries) == set(node.BODY_PARTS)
+    # 拖拽过的部件使用前端配置：area 为 (h, w, y, x)，单位8像素
+    assert entries["head"]["area"] == (7, 9, 1, 21)
+    assert entries["head"]["strength"] == 1.2
+    assert entries["head"]["rotation"] == 10.0
+    # 前端的 left_arm 映射为 left_upper_arm
+    assert entries["left_upper_arm"]["area"] == (10, 5, 15, 12)
+    assert entries["left_upper_arm"]["strength"] == 1.5
+
+
+def test_merge_prefers_node_part_id_over_alias(body_parts_module):
+    node = body_parts_module.HumanBodyPartsConditioning()
+    merged = node._merge_stored_config(
+        {"left_arm": [0, 0, 40, 40, 1.0, 0.0], "left_upper_arm": [64, 64, 40, 40, 2.0, 0.0], "knee": [1, 2]},
+        640, 1024,
+    )
+
+    assert set(merged) == set(node.BODY_PARTS)
+    assert merged["left_upper_arm"] == [64, 64, 40, 40, 2.0, 0.0]
+
+
+def _apply(module, node_id, **kwargs):
+    node = module.HumanBodyPartsConditioning()
+    conditioning, info, _, _ = node.apply_intelligent_body_parts_conditioning(
+        _conditioning(), 640, 1024, unique_id=node_id, prompt={}, **kwargs
+    )
+    assert "错误" not in info, info
+    return conditioning, info
+
+
+class CountingClip:
+    """只实现节点用到的 tokenize / encode_from_tokens，记录编码次数"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def tokenize(self, text):
+        return text
+
+    def encode_from_tokens(self, tokens, return_pooled=False):
+        self.encoded.append(tokens)
+        return torch.full((1, 77, 768), float(len(self.encoded))), torch.zeros(1, 768)
+
+
+def test_medical_preset_reduces_areas(middleware, body_parts_module):
+    conditioning, info = _apply(body_parts_module, "preset", medical_preset="hand_therapy")
+
+    entries = {cond_dict["body_part"]: cond_dict for _, cond_dict in conditioning}
+    assert set(entries) == {"left_hand", "right_hand", "left_forearm", "right_forearm"}
+    assert all(cond_dict["strength"] == 2.0 for cond_dict in entries.values())
+    assert "每步区域评估: 15 → 4 (减少 73.3%)" in info
+
+    conditioning, info = _apply(
+        body_parts_module, "preset", medical_preset="hand_therapy", non_focus_mode="merge_background"
+    )
+    parts = [cond_dict["body_part"] for _, cond_dict in conditioning]
+    assert parts.count("background") == 1
+    assert "每步区域评估: 15 → 5" in info
+
+
+def test_clip_encodes_are_cached_across_runs(middleware, body_parts_module):
+    body_parts_module._clip_encode_cache.clear()
+    clip = CountingClip()
+
+    first, info = _apply(body_parts_module, "clip", clip=clip, global_prompt="a dancer")
+    assert len(clip.encoded) == len(body_parts_module.HumanBodyPartsConditioning.BODY_PARTS)
+    assert "本次命中 0 / 未命中 15" in info
+
+    # 再次排队执行：全部命中缓存，不再运行文本编码器
+    second, info = _apply(body_parts_module, "clip", clip=clip, global_prompt="a dancer")
+    assert len(clip.encoded) == 15
+    assert "本次命中 15 / 未命中 0" in info
+    assert all(a[0] is b[0] for a, b in zip(first, second))
+
+    # 部件专用提示词只编码变化的部件
+    _apply(body_parts_module, "clip", clip=clip, global_prompt="a dancer", part_prompts="head: smiling face")
+    assert clip.encoded[15:] == ["smiling face"]
+
+
+def test_level_of_detail_folds_small_parts_into_parents(middleware, body_parts_module):
+    conditioning, info = _apply(body_parts_module, "lod", lod_min_cells=100)
+
+    entries = {cond_dict["body_part"]: cond_dict for _, cond_dict in conditioning}
+    # 默认布局下手、脚与颈部小于 100 个latent单元
+    assert not {"left_hand", "right_hand", "left_foot", "right_foot", "neck"} & set(entries)
+    assert entries["left_forearm"]["folded_parts"] == ["left_hand"]
+    assert entries["head"]["folded_parts"] == ["neck"]
+    # 父部件区域扩展为包含子部件的外接矩形：(h, w, y, x)，单位8像素
+    assert entries["left_forearm"]["area"] == (27, 13, 60, 6)
+    assert "left_hand→left_forearm" in info
+
+    # 并入的子部件为重点部件时保留父部件
+    conditioning, _ = _apply(body_parts_module, "lod", lod_min_cells=100, focus_parts="left_hand")
+    assert [cond_dict["body_part"] for _, cond_dict in conditioning] == ["left_forearm"]
+
+
+def test_keyframes_share_entries_between_identical_frames(middleware, body_parts_module):
+    keyframes = (
+        '{"0": {"head": [256, 48, 176, 216, 1.0, 0]},'
+        ' "2": {"head": [256, 48, 176, 216, 1.0, 0]},'
+        ' "3": {"head": [336, 48, 176, 216, 1.0, 0]}}'
+    )
+    conditioning, info = _apply(body_parts_module, "keyframes", keyframes=keyframes, frame_count=4)
+
+    head_entries = [cond_dict for _, cond_dict in conditioning if cond_dict["body_part"] == "head"]
+    assert [cond_dict["batch_index"] for cond_dict in head_entries] == [[0, 1, 2], [3]]
+    assert [cond_dict["area"][3] for cond_dict in head_entries] == [32, 42]
+    assert head_entries[0]["mask"].flatten().tolist() == [1.0, 1.0, 1.0, 0.0]
+
+    # 没有关键帧的部件在所有帧中相同，只输出一个不带帧遮罩的条目
+    static_entries = [cond_dict for _, cond_dict in conditioning if cond_dict["body_part"] != "head"]
+    assert len(static_entries) == 14
+    assert all("mask" not in cond_dict for cond_dict in static_entries)
+    assert "关键帧批次: 4 帧" in info
@@ -0,0 +1,33 @@
+"""
+Kontext 微批处理队列的测试
+"""
+
+import torch
+
+from conftest import load_module
+
+
+def test_direct_submit_respects_max_batch():
+    module = load_module("kontext_backends")
+    batch_sizes = []
+
+    class RecordingBackend(module.KontextBackend):
+        name = "test_recording"
+
+        def infer(self, batch):
+            batch_sizes.append(batch.images.shape[0])
+            return batch.images + 1
+
+    module.register_kontext_backend(RecordingBackend.name, RecordingBackend)
+    batcher = module.KontextMicroBatcher(RecordingBackend.name, max_batch=8)
+    requests = [
+        module.KontextRequest(torch.full((2, 16, 16, 3), float(index)), "p", "general", 7.0, 4, index)
+        for index in range(20)
+    ]
+
+    results = batcher.submit_many(requests, window=0)
+
+    assert batch_sizes == [8, 8, 8, 8, 8]
+    assert [r.batched_requests for r in results] == [4] * 20
+    for index, result in enumerate(results):
+        assert torch.equal(result.image, requests[index].image + 1)
@@ -0,0 +1,176 @@
+"""
+人体部件中间件存储的测试：保留策略淘汰、共享存储的版本号与旧版配置导入
+"""
+
+import json
+import sqlite3
+import time
+
+import pytest
+
+from conftest import load_module
+
+CONFIG = {"head": [0, 0, 64, 64, 1.0, 0.0]}
+
+
+class ManualMiddleware(load_module("middleware").HumanBodyPartsMiddleware):
+    """不启动后台线程的中间件，淘汰只在测试中手动执行"""
+
+    def _ensure_flusher(self):
+        pass
+
+
+def _node_ids(store):
+    return {row[0] for row in store._connection().execute("SELECT node_id FROM configs")}
+
+
+def test_eviction_keeps_config_rewritten_after_selection(store_factory, monkeypatch):
+    module = load_module("middleware")
+    store = store_factory(ManualMiddleware)
+    store.RETENTION_MAX_NODES = 1
+    store.save_config("old", CONFIG)
+    store.save_config("new", CONFIG)
+    store.flush()
+    store._connection().execute("UPDATE configs SET last_access = 1 WHERE node_id = 'old'")
+
+    class RacingLock(module.InterProcessLock):
+        def __enter__(self):
+            # 淘汰选中 "old" 之后、删除之前，另一个写入者重新写入了它
+            other = sqlite3.connect(str(store.db_file), isolation_level=None)
+            other.execute("UPDATE configs SET last_access = ? WHERE node_id = 'old'", (time.time(),))
+            other.close()
+            return super().__enter__()
+
+    monkeypatch.setattr(module, "InterProcessLock", RacingLock)
+    assert store.evict_step() == 0
+    assert _node_ids(store) == {"old", "new"}
+
+    monkeypatch.undo()
+    store._connection().execute("UPDATE configs SET last_access = 1 WHERE node_id = 'new'")
+    assert store.evict_step() == 1
+    assert _node_ids(store) == {"old"}
+
+
+def test_read_only_store_is_trimmed(store_factory):
+    writer = store_factory(ManualMiddleware)
+    for index in range(5):
+        writer.save_config(str(index), CONFIG)
+    writer.flush()
+
+    class FastEvictionMiddleware(load_module("middleware").HumanBodyPartsMiddleware):
+        RETENTION_MAX_NODES = 2
+        EVICTION_INTERVAL = 0.01
+
+    # 只读取、从不保存的实例也会在后台按保留策略淘汰
+    reader = store_factory(FastEvictionMiddleware, instance_id=writer.instance_id)
+    deadline = time.monotonic() + 5
+    while len(_node_ids(reader)) > 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert len(_node_ids(reader)) == 2
+
+
+def test_versions_are_shared_between_processes(store_factory):
+    first = store_factory(ManualMiddleware)
+    second = store_factory(ManualMiddleware, instance_id=first.instance_id)
+    other = {"head": [8, 8, 32, 32, 1.0, 0.0]}
+
+    first.save_config("node", CONFIG)
+    first.flush()
+    v1 = first.get_config_version("node")
+    second.save_config("node", other)
+    second.flush()
+    v2 = second.get_config_version("node")
+    # 另一个进程改写后再保存原内容，不能被当作内容未变化而跳过
+    first.save_config("node", CONFIG)
+    first.flush()
+    v3 = first.get_config_version("node")
+
+    assert len({0, v1, v2, v3}) == 4
+    assert second.get_config_version("node") == v3
+    assert second.load_config("node") == CONFIG
+
+    # 与已存储内容相同的保存不写入，落盘后保留已存储的版本号
+    second.save_config("node", CONFIG)
+    second.flush()
+    assert second.get_config_version("node") == v3
+    assert second.get_metrics()["noop_updates"] == 1
+
+
+def test_version_query_does_not_flush(store_factory):
+    store = store_factory(ManualMiddleware)
+    versions = []
+    for index in range(50):
+        store.save_config("node", {"head": [index, 0, 64, 64, 1.0, 0.0]})
+        versions.append(store.get_config_version("node"))
+
+    assert len(set(versions)) == 50
+    assert store.get_metrics()["flushes"] == 0
+    assert store.flush() == 1
+    assert store.get_config_version("node") == versions[-1]
+    assert store.get_metrics()["writes_performed"] == 1
+
+
+def test_patch_checks_version_written_by_other_process(store_factory):
+    first = store_factory(ManualMiddleware)
+    second = store_factory(ManualMiddleware, instance_id=first.instance_id)
+    first.save_config("node", CONFIG)
+    first.flush()
+    base = first.get_config_version("node")
+    second.save_config("node", {"head": [8, 8, 32, 32, 1.0, 0.0]})
+    second.flush()
+
+    applied, version, config = first.patch_config("node", base, {"head": {"strength": 2.0}})
+    assert not applied
+    assert version == second.get_config_version("node")
+    assert config["head"][:4] == [8, 8, 32, 32]
+
+    applied, version, config = first.patch_config("node", version, {"head": {"strength": 2.0}})
+    assert applied
+    first.flush()
+    assert second.get_config_version("node") == version
+    assert second.load_config("node") == config
+
+
+def test_patches_are_coalesced(store_factory):
+    store = store_factory(ManualMiddleware)
+    store.save_config("node", CONFIG)
+    store.flush()
+    version = store.get_config_version("node")
+    for index in range(50):
+        applied, version, _ = store.patch_config("node", version, {"head": {"x": index + 1}})
+        assert applied
+
+    metrics = store.get_metrics()
+    assert metrics["flushes"] == 1 and metrics["writes_performed"] == 1
+    assert store.flush() == 1
+    assert store.load_config("node")["head"][0] == 50
+    assert store.get_config_version("node") == version
+
+
+def test_patch_rejects_frontend_only_part_ids(store_factory):
+    store = store_factory(ManualMiddleware)
+    store.save_config("node", CONFIG)
+    version = store.get_config_version("node")
+    with pytest.raises(ValueError):
+        store.patch_config("node", version, {"spine": [0, 0, 10, 100, 1.0, 0.0]})
+    assert store.load_config("node") == CONFIG
+    assert store.get_config_version("node") == version
+
+
+def test_legacy_config_is_imported_by_every_instance(store_factory):
+    module = load_module("middleware")
+    legacy_file = module._middleware.legacy_config_file
+    legacy_file.write_text(json.dumps({"7": CONFIG}), encoding="utf-8")
+    try:
+        first = store_factory(ManualMiddleware, instance_id="legacy_a")
+        second = store_factory(ManualMiddleware, instance_id="legacy_b")
+        assert first.load_config("7") == CONFIG
+        assert second.load_config("7") == CONFIG
+        assert legacy_file.exists()
+
+        # 已导入的实例不会再次导入（已清除的配置不会复活）
+        first.clear_config("7")
+        again = store_factory(ManualMiddleware, instance_id="legacy_a")
+        assert again.load_config("7") is None
+    finally:
+        legacy_file.unlink()